@@ -1,8 +1,13 @@
 """AST parser module for extracting function information and call relationships."""
 import ast
+import hashlib
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Set
+from typing import Any, Iterable, Iterator, List, Dict, Optional, Set, Tuple
 
 
 @dataclass
@@ -21,6 +26,23 @@ class FunctionInfo:
     calls: Set[str] = field(default_factory=set)
     docstring: str = ""
     arg_types: Dict[str, str] = field(default_factory=dict)  # 参数名 -> 类型注解字符串
+    qualname: str = ""  # 模块内限定名，方法为 "类名.方法名"
+    # 调用名 -> 调用目标的候选符号 "模块:限定名"（模块为空表示当前模块，
+    # 以 "." 开头表示相对导入），"?" 表示接收者无法解析
+    qualified_calls: Dict[str, List[str]] = field(default_factory=dict)
+    # 每个调用点 (调用名, 起始行, 起始列, 结束行, 结束列)，行号为文件中的行号，按位置排序
+    call_sites: List[Tuple[str, int, int, int, int]] = field(default_factory=list)
+    # 文件中排在前面、限定名相同的函数个数（嵌套函数、property setter、条件定义）
+    occurrence: int = 0
+
+
+@dataclass(frozen=True)
+class FileStamp:
+    """Size, modification time and content hash of the bytes that were parsed."""
+
+    size: int
+    mtime_ns: int
+    sha256: str
 
 
 class ASTParser:
@@ -36,6 +58,26 @@ class ASTParser:
         Returns:
             List of FunctionInfo objects.
 
+        Raises:
+            FileNotFoundError: If file does not exist.
+            SyntaxError: If file contains invalid Python syntax.
+        """
+        functions, _ = self.parse_file_stamped(file_path)
+        return functions
+
+    def parse_file_stamped(self, file_path: str) -> Tuple[List[FunctionInfo], FileStamp]:
+        """
+        Parse a Python file and describe the exact bytes that were parsed.
+
+        The stamp is taken from the same read as the parse, so a cache entry
+        built from it never pairs an old parse with a newer file version.
+
+        Args:
+            file_path: Path to Python file.
+
+        Returns:
+            (functions, stamp) tuple.
+
         Raises:
             FileNotFoundError: If file does not exist.
             SyntaxError: If file contains invalid Python syntax.
@@ -45,8 +87,12 @@ class ASTParser:
         if not path.exists():
             raise FileNotFoundError(f"File not found: {file_path}")
 
-        with open(path, 'r', encoding='utf-8') as f:
-            source_code = f.read()
+        with open(path, 'rb') as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            data = f.read()
+        stamp = FileStamp(len(data), mtime_ns, hashlib.sha256(data).hexdigest())
+        # 与文本模式读取一致：UTF-8 解码并统一换行符
+        source_code = data.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
 
         try:
             tree = ast.parse(source_code, filename=file_path)
@@ -60,9 +106,127 @@ class ASTParser:
         functions = []
         visitor = FunctionVisitor(source_lines)
         visitor.visit(tree)
+        # 整个文件的导入和类定义收集完后再解析调用目标
+        visitor.resolve_calls()
         functions.extend(visitor.functions)
 
-        return functions
+        counts: Dict[str, int] = {}
+        for func in functions:
+            func.occurrence = counts.get(func.qualname, 0)
+            counts[func.qualname] = func.occurrence + 1
+
+        return functions, stamp
+
+    def parse_files(
+        self,
+        file_paths: Iterable[str],
+        workers: Optional[int] = None,
+        chunksize: int = 16,
+        max_pending_chunks: Optional[int] = None,
+        cache: Optional[Any] = None
+    ) -> Iterator[Tuple[str, List[FunctionInfo], Optional[str]]]:
+        """
+        Parse many files, optionally in a process pool.
+
+        Results are yielded in the same order as ``file_paths`` regardless of
+        which worker finished first, so the function order is deterministic.
+        ``file_paths`` is consumed lazily and at most ``max_pending_chunks``
+        chunks are in flight, so a slow consumer throttles parsing.
+
+        Args:
+            file_paths: Paths to Python files (may be a generator).
+            workers: Number of worker processes (default: CPU count).
+                1 parses serially in the current process.
+            chunksize: Number of files sent to a worker per task.
+            max_pending_chunks: Chunks submitted but not yet consumed
+                (default: 2 per worker).
+            cache: Optional ParseCache; files found in it are not read or
+                parsed, and newly parsed files are stored in it once per chunk.
+
+        Yields:
+            (file_path, functions, error) tuples. ``error`` is None on success;
+            otherwise it describes the failure and ``functions`` is empty.
+        """
+        workers = workers or os.cpu_count() or 1
+
+        if workers <= 1:
+            unstored = []
+            try:
+                for file_path in file_paths:
+                    cached = cache.get(file_path) if cache is not None else None
+                    if cached is not None:
+                        yield file_path, cached, None
+                        continue
+                    result = _parse_file_safe(file_path)
+                    unstored.append(result)
+                    if len(unstored) >= chunksize:
+                        _store_results(cache, unstored)
+                        unstored = []
+                    yield result[:3]
+            finally:
+                _store_results(cache, unstored)
+            return
+
+        max_pending_chunks = max_pending_chunks or workers * 2
+        path_iter = iter(file_paths)
+        pending = deque()
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            while True:
+                while len(pending) < max_pending_chunks:
+                    chunk = list(islice(path_iter, chunksize))
+                    if not chunk:
+                        break
+                    # 命中缓存的文件不发送给工作进程
+                    cached = {}
+                    if cache is not None:
+                        for file_path in chunk:
+                            functions = cache.get(file_path)
+                            if functions is not None:
+                                cached[file_path] = functions
+                    misses = [file_path for file_path in chunk if file_path not in cached]
+                    future = executor.submit(_parse_chunk, misses) if misses else None
+                    pending.append((chunk, cached, future))
+
+                if not pending:
+                    break
+
+                chunk, cached, future = pending.popleft()
+                results = future.result() if future is not None else []
+                _store_results(cache, results)
+                parsed = iter(results)
+                for file_path in chunk:
+                    if file_path in cached:
+                        yield file_path, cached[file_path], None
+                    else:
+                        yield next(parsed)[:3]
+
+
+# (file_path, functions, error, stamp)：stamp 描述实际解析的文件内容，失败时为 None
+_ParseResult = Tuple[str, List[FunctionInfo], Optional[str], Optional[FileStamp]]
+
+
+def _parse_chunk(file_paths: List[str]) -> List[_ParseResult]:
+    """Parse a batch of files in a pool worker."""
+    return [_parse_file_safe(file_path) for file_path in file_paths]
+
+
+def _store_results(cache: Optional[Any], results: List[_ParseResult]) -> None:
+    """Store the successful parse results in the cache, if any, in one transaction."""
+    if cache is not None:
+        cache.put_many(
+            (file_path, functions, stamp)
+            for file_path, functions, error, stamp in results if error is None
+        )
+
+
+def _parse_file_safe(file_path: str) -> _ParseResult:
+    """Parse one file, returning the error message instead of raising (pool worker)."""
+    try:
+        functions, stamp = ASTParser().parse_file_stamped(file_path)
+        return file_path, functions, None, stamp
+    except Exception as e:
+        return file_path, [], str(e), None
 
 
 class FunctionVisitor(ast.NodeVisitor):
@@ -77,19 +241,144 @@ class FunctionVisitor(ast.NodeVisitor):
         """
         self.source_lines = source_lines
         self.functions: List[FunctionInfo] = []
+        # 作用域栈：("class" | "function", 名称)
+        self.scopes: List[Tuple[str, str]] = []
+        # 导入表：别名 -> 模块（import a.b as x）
+        self.module_imports: Dict[str, str] = {}
+        # 导入表：别名 -> (模块, 名称)（from m import n as k）
+        self.name_imports: Dict[str, Tuple[str, str]] = {}
+        # 文件中定义的类的限定名
+        self.class_names: Set[str] = set()
+        # 每个函数的原始调用记录 (调用名, 接收者) 和所在类，resolve_calls() 使用
+        self._raw_calls: List[Tuple[FunctionInfo, List[Tuple[str, Optional[str]]], str]] = []
+        # 正在访问的函数（由外到内）及其原始调用记录
+        self._function_stack: List[Tuple[FunctionInfo, List[Tuple[str, Optional[str]]]]] = []
 
     def visit_FunctionDef(self, node: ast.FunctionDef):
         """Visit function definition node."""
-        self._process_function(node, is_async=False)
-        self.generic_visit(node)
+        self._visit_function(node, is_async=False)
 
     def visit_AsyncFunctionDef(self, node: ast.AsyncFunctionDef):
         """Visit async function definition node."""
-        self._process_function(node, is_async=True)
+        self._visit_function(node, is_async=True)
+
+    def _visit_function(self, node, is_async: bool):
+        """Extract a function, then visit its decorators, signature and body once."""
+        self._function_stack.append(self._process_function(node, is_async))
+        self.scopes.append(("function", node.name))
         self.generic_visit(node)
+        self.scopes.pop()
+        func_info, _ = self._function_stack.pop()
+        func_info.call_sites.sort(key=lambda site: site[1:3])
 
-    def _process_function(self, node, is_async: bool):
-        """Process function node and extract information."""
+    def visit_Call(self, node: ast.Call):
+        """Attribute a call to every enclosing function (their code contains it)."""
+        target = _call_target(node)
+        if target is not None:
+            name, receiver = target
+            site = (name, node.lineno, node.col_offset, node.end_lineno, node.end_col_offset)
+            for func_info, raw_calls in self._function_stack:
+                func_info.calls.add(name)
+                func_info.call_sites.append(site)
+                raw_calls.append((name, receiver))
+
+        # 参数中的调用以及链式调用 func()() 的内层调用由 generic_visit 访问
+        self.generic_visit(node)
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        """Visit class definition node."""
+        self.scopes.append(("class", node.name))
+        self.class_names.add(self._class_qualname())
+        self.generic_visit(node)
+        self.scopes.pop()
+
+    def visit_Import(self, node: ast.Import):
+        """Record ``import a.b [as x]``."""
+        for alias in node.names:
+            if alias.asname:
+                self.module_imports[alias.asname] = alias.name
+            else:
+                # import a.b 绑定的是顶层包 a
+                top = alias.name.split(".")[0]
+                self.module_imports[top] = top
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        """Record ``from m import n [as k]`` (relative modules keep their dots)."""
+        module = "." * (node.level or 0) + (node.module or "")
+        for alias in node.names:
+            if alias.name != "*":
+                self.name_imports[alias.asname or alias.name] = (module, alias.name)
+
+    def _class_qualname(self) -> str:
+        """Qualified name of the innermost class scope ("" outside classes)."""
+        names = []
+        for kind, name in reversed(self.scopes):
+            if kind != "class":
+                if names:
+                    break
+                continue
+            names.append(name)
+        return ".".join(reversed(names))
+
+    def _function_qualname(self, name: str) -> str:
+        """Qualified name of a function defined in the current scope."""
+        if self.scopes and self.scopes[-1][0] == "class":
+            return f"{self._class_qualname()}.{name}"
+        # 嵌套函数按模块级名称处理
+        return name
+
+    def resolve_calls(self) -> None:
+        """Fill ``qualified_calls`` of every function from the collected imports and classes."""
+        for func_info, raw_calls, class_name in self._raw_calls:
+            qualified: Dict[str, List[str]] = {}
+            for name, receiver in raw_calls:
+                targets = qualified.setdefault(name, [])
+                for target in self._resolve_call(name, receiver, class_name):
+                    if target not in targets:
+                        targets.append(target)
+            func_info.qualified_calls = qualified
+
+    def _resolve_call(self, name: str, receiver: Optional[str], class_name: str) -> List[str]:
+        """Candidate symbols of one call; see FunctionInfo.qualified_calls."""
+        if receiver is None:
+            # 直接调用 name()
+            if name in self.name_imports:
+                module, imported = self.name_imports[name]
+                return [f"{module}:{imported}"]
+            return [f":{name}"]
+
+        if receiver == "?":
+            return ["?"]
+
+        head, _, rest = receiver.partition(".")
+        suffix = f".{rest}" if rest else ""
+        if head in ("self", "cls") and class_name and not rest:
+            return [f":{class_name}.{name}"]
+        if head in self.module_imports:
+            return [f"{self.module_imports[head]}{suffix}:{name}"]
+        if head in self.name_imports:
+            module, imported = self.name_imports[head]
+            package = module if module.endswith(".") else f"{module}."
+            # 导入的名字可能是子模块，也可能是类
+            return [
+                f"{package}{imported}{suffix}:{name}",
+                f"{module}:{imported}{suffix}.{name}",
+            ]
+        if receiver in self.class_names:
+            return [f":{receiver}.{name}"]
+        return ["?"]
+
+    def _process_function(
+        self, node, is_async: bool
+    ) -> Tuple[FunctionInfo, List[Tuple[str, Optional[str]]]]:
+        """
+        Extract information of a function node, except its calls.
+
+        Calls are added by visit_Call while the node's subtree is visited.
+
+        Returns:
+            The FunctionInfo and its (initially empty) raw call list.
+        """
         # 提取参数和类型注解
         args = []
         arg_types = {}
@@ -116,10 +405,6 @@ class FunctionVisitor(ast.NodeVisitor):
         # 提取文档字符串
         docstring = ast.get_docstring(node) or ""
 
-        # 提取函数调用
-        call_visitor = CallVisitor()
-        call_visitor.visit(node)
-
         func_info = FunctionInfo(
             name=node.name,
             args=args,
@@ -130,12 +415,15 @@ class FunctionVisitor(ast.NodeVisitor):
             code=code,
             decorators=decorators,
             is_async=is_async,
-            calls=call_visitor.calls,
             docstring=docstring,
             arg_types=arg_types,
+            qualname=self._function_qualname(node.name),
         )
 
+        raw_calls: List[Tuple[str, Optional[str]]] = []
         self.functions.append(func_info)
+        self._raw_calls.append((func_info, raw_calls, self._class_qualname()))
+        return func_info, raw_calls
 
     def _extract_annotation(self, annotation) -> str:
         """
@@ -174,24 +462,30 @@ class FunctionVisitor(ast.NodeVisitor):
             return ast.unparse(annotation) if hasattr(ast, 'unparse') else str(type(annotation).__name__)
 
 
-class CallVisitor(ast.NodeVisitor):
-    """Visitor for extracting function calls."""
-
-    def __init__(self):
-        """Initialize call visitor."""
-        self.calls: Set[str] = set()
-
-    def visit_Call(self, node: ast.Call):
-        """Visit function call node."""
-        # 处理不同类型的调用
-        if isinstance(node.func, ast.Name):
-            # 直接函数调用: func()
-            self.calls.add(node.func.id)
-        elif isinstance(node.func, ast.Attribute):
-            # 方法调用: obj.method() 或 self.method()
-            self.calls.add(node.func.attr)
-        elif isinstance(node.func, ast.Call):
-            # 链式调用: func()()
-            self.visit(node.func)
-
-        self.generic_visit(node)
+def _call_target(node: ast.Call) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    (name, receiver) of a call, or None for calls not made by name.
+
+    The receiver is None for a direct call ``func()``, the dotted name for
+    ``a.b.method()`` (``self``/``cls`` included), and "?" when it is not a
+    chain of names (``f().x()``, ``a[0].x()``).
+    """
+    if isinstance(node.func, ast.Name):
+        # 直接函数调用: func()
+        return node.func.id, None
+    if isinstance(node.func, ast.Attribute):
+        # 方法调用: obj.method() 或 self.method()
+        return node.func.attr, _dotted_name(node.func.value) or "?"
+    return None
+
+
+def _dotted_name(node) -> Optional[str]:
+    """``a.b.c`` for a chain of names and attributes, else None."""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(node.id)
+    return ".".join(reversed(parts))
@@ -0,0 +1,156 @@
+"""Offline batch-job files in the OpenAI Batch API JSONL format."""
+import hashlib
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+
+BATCH_URL = "/v1/chat/completions"
+
+
+def batch_custom_id(function_id: str) -> str:
+    """
+    Stable custom id for a function.
+
+    The id only depends on the function id (file and qualified name, unique
+    within a scan), so re-submitting the same pending function
+    produces the same id and results can be matched across runs.
+    """
+    digest = hashlib.sha256(function_id.encode("utf-8")).hexdigest()
+    return f"pyscan-{digest[:24]}"
+
+
+def build_batch_request(custom_id: str, request_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    One line of a batch request file.
+
+    Args:
+        custom_id: Id echoed back in the result file.
+        request_kwargs: Body of the chat completion request
+            (BugDetector._request_kwargs).
+
+    Returns:
+        JSON-serializable request record.
+    """
+    return {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": BATCH_URL,
+        "body": request_kwargs,
+    }
+
+
+@dataclass
+class BatchResult:
+    """One entry of a batch result file."""
+
+    custom_id: str
+    content: Optional[str]  # 模型回复内容，请求失败时为 None
+    error: Optional[str]
+    usage: Dict[str, int]
+
+
+def read_batch_results(path: Path) -> Iterator[BatchResult]:
+    """
+    Read a batch result file.
+
+    Args:
+        path: JSONL file downloaded from the provider's batch endpoint.
+
+    Yields:
+        BatchResult per line; failed requests carry an error message.
+
+    Raises:
+        ValueError: If a line is not valid JSON or has no custom_id.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON: {e}")
+            if not isinstance(record, dict) or "custom_id" not in record:
+                raise ValueError(f"{path}:{line_number}: missing custom_id")
+            yield _to_batch_result(record)
+
+
+def _to_batch_result(record: Dict[str, Any]) -> BatchResult:
+    custom_id = record["custom_id"]
+    response = record.get("response") or {}
+    body = response.get("body") or {}
+    usage_data = body.get("usage") or {}
+    usage = {
+        "requests": 1,
+        "prompt_tokens": usage_data.get("prompt_tokens", 0),
+        "completion_tokens": usage_data.get("completion_tokens", 0),
+        "total_tokens": usage_data.get("total_tokens", 0),
+        "cached_tokens": (usage_data.get("prompt_tokens_details") or {}).get("cached_tokens", 0),
+    }
+
+    if record.get("error"):
+        error = record["error"]
+        message = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+        return BatchResult(custom_id, None, message, usage)
+
+    status_code = response.get("status_code", 200)
+    if status_code != 200:
+        return BatchResult(custom_id, None, f"HTTP {status_code}", usage)
+
+    try:
+        content = body["choices"][0]["message"]["content"]
+    except (KeyError, IndexError, TypeError):
+        return BatchResult(custom_id, None, "response has no message content", usage)
+    return BatchResult(custom_id, content, None, usage)
+
+
+class BatchManifest:
+    """
+    Functions submitted in batch jobs, keyed by custom id.
+
+    The request file only carries prompts; the manifest keeps what is needed
+    to turn a result back into BugReports (file path, function name, start
+    line, callers, ...). It lives in the progress directory and accumulates
+    over submissions, so results of an older submission can still be ingested.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Initialize manifest.
+
+        Args:
+            path: Manifest JSON file (created on save).
+        """
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+
+    def load(self) -> "BatchManifest":
+        """Load existing entries, if any."""
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        return self
+
+    def save(self) -> None:
+        """Write all entries to disk."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, ensure_ascii=False)
+
+    def add(self, custom_id: str, entry: Dict[str, Any]) -> None:
+        """Record a submitted function."""
+        self.entries[custom_id] = entry
+
+    def get(self, custom_id: str) -> Optional[Dict[str, Any]]:
+        """Entry for a custom id, or None if it was never submitted."""
+        return self.entries.get(custom_id)
+
+
+def write_jsonl(path: Path, records: List[Dict[str, Any]]) -> None:
+    """Write records as JSON lines."""
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False))
+            f.write("\n")
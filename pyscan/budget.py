@@ -0,0 +1,177 @@
+"""Token, cost and wall-clock budgets for a scan."""
+import time
+from typing import Any, Callable, Dict, Optional
+
+from pyscan import durations
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse a deadline such as "90", "45s", "30m", "2h" or "1h30m" into seconds.
+
+    Raises:
+        ValueError: If the value is not a valid, positive duration.
+    """
+    try:
+        seconds = durations.parse_duration(value)
+    except ValueError:
+        raise ValueError(f"Invalid duration: {value!r} (e.g. 90, 45s, 30m, 2h, 1h30m)")
+    if seconds <= 0:
+        raise ValueError(f"Duration must be positive: {value!r}")
+    return seconds
+
+
+class ScanBudget:
+    """
+    Enforce prompt-token, cost and deadline limits on the detection loop.
+
+    Requests that have been sent but not yet answered are counted with their
+    estimated prompt tokens, so concurrent requests cannot jointly overshoot
+    the budget. Once a response arrives its estimate is replaced by the
+    actual ``usage`` reported by the API.
+    """
+
+    def __init__(
+        self,
+        max_prompt_tokens: Optional[int] = None,
+        max_cost: Optional[float] = None,
+        deadline_seconds: Optional[float] = None,
+        prompt_price_per_1k: float = 0.0,
+        completion_price_per_1k: float = 0.0,
+        cached_prompt_price_per_1k: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize scan budget.
+
+        Args:
+            max_prompt_tokens: Maximum prompt tokens for the run, or None.
+            max_cost: Maximum cost for the run (pricing currency), or None.
+            deadline_seconds: Stop handing out work after this many seconds, or None.
+            prompt_price_per_1k: Price per 1K prompt tokens.
+            completion_price_per_1k: Price per 1K completion tokens.
+            cached_prompt_price_per_1k: Price per 1K prompt tokens served from
+                the provider's prompt cache (defaults to the prompt price).
+            clock: Monotonic clock in seconds (injectable for tests).
+        """
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_cost = max_cost
+        self.prompt_price_per_1k = prompt_price_per_1k
+        self.completion_price_per_1k = completion_price_per_1k
+        self.cached_prompt_price_per_1k = (
+            prompt_price_per_1k if cached_prompt_price_per_1k is None
+            else cached_prompt_price_per_1k
+        )
+        self.clock = clock
+        self.deadline = clock() + deadline_seconds if deadline_seconds else None
+
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.requests = 0
+        self.reserved_prompt_tokens = 0
+
+    @classmethod
+    def from_args(cls, config: Any, max_prompt_tokens=None, max_cost=None, deadline_seconds=None) -> "ScanBudget":
+        """Build a budget from CLI options and the pricing in Config."""
+        return cls(
+            max_prompt_tokens=max_prompt_tokens,
+            max_cost=max_cost,
+            deadline_seconds=deadline_seconds,
+            prompt_price_per_1k=config.llm_prompt_price_per_1k or 0.0,
+            completion_price_per_1k=config.llm_completion_price_per_1k or 0.0,
+            cached_prompt_price_per_1k=config.llm_cached_prompt_price_per_1k,
+        )
+
+    @property
+    def cost(self) -> float:
+        """Cost of the recorded usage."""
+        uncached = self.prompt_tokens - self.cached_prompt_tokens
+        return (
+            uncached * self.prompt_price_per_1k
+            + self.cached_prompt_tokens * self.cached_prompt_price_per_1k
+            + self.completion_tokens * self.completion_price_per_1k
+        ) / 1000
+
+    @property
+    def cache_hit_rate(self) -> float:
+        """Share of prompt tokens served from the provider's prompt cache."""
+        return self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    @property
+    def cache_savings(self) -> float:
+        """Cost saved by prompt caching compared to the full prompt price."""
+        return (
+            self.cached_prompt_tokens
+            * (self.prompt_price_per_1k - self.cached_prompt_price_per_1k) / 1000
+        )
+
+    def exceeded_reason(self, estimated_prompt_tokens: int = 0) -> Optional[str]:
+        """
+        Check whether starting a request of the given size would break a budget.
+
+        Args:
+            estimated_prompt_tokens: Estimated prompt tokens of the next request.
+
+        Returns:
+            Human-readable reason if the request must not start, else None.
+        """
+        if self.deadline is not None and self.clock() >= self.deadline:
+            return "deadline reached"
+
+        committed = self.prompt_tokens + self.reserved_prompt_tokens
+        if (
+            self.max_prompt_tokens is not None
+            and committed + estimated_prompt_tokens > self.max_prompt_tokens
+        ):
+            return (
+                f"prompt token budget would be exceeded "
+                f"({committed} + {estimated_prompt_tokens} > {self.max_prompt_tokens})"
+            )
+
+        if self.max_cost is not None:
+            projected = self.cost + (
+                (self.reserved_prompt_tokens + estimated_prompt_tokens)
+                * self.prompt_price_per_1k / 1000
+            )
+            if projected > self.max_cost:
+                return f"cost budget would be exceeded ({projected:.4f} > {self.max_cost})"
+
+        return None
+
+    def reserve(self, estimated_prompt_tokens: int) -> None:
+        """Count a request that is about to be sent."""
+        self.reserved_prompt_tokens += estimated_prompt_tokens
+
+    def settle(self, estimated_prompt_tokens: int, usage: Optional[Dict[str, int]]) -> None:
+        """
+        Replace a reservation by the actual usage of the finished request.
+
+        Args:
+            estimated_prompt_tokens: Amount passed to reserve().
+            usage: Usage dict from BugDetector (None if the request failed).
+        """
+        self.reserved_prompt_tokens -= estimated_prompt_tokens
+        self.record(usage)
+
+    def record(self, usage: Optional[Dict[str, int]]) -> None:
+        """Add actual usage reported by the API."""
+        if not usage:
+            return
+        self.requests += usage.get("requests", 1)
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+        self.cached_prompt_tokens += usage.get("cached_tokens", 0)
+
+    def summary(self) -> str:
+        """One-line usage summary for the run log."""
+        text = (
+            f"{self.requests} LLM requests, {self.prompt_tokens} prompt tokens "
+            f"({self.cached_prompt_tokens} cached, {self.cache_hit_rate:.1%} hit rate), "
+            f"{self.completion_tokens} completion tokens"
+        )
+        if self.prompt_price_per_1k or self.completion_price_per_1k:
+            text += f", cost {self.cost:.4f}"
+            if self.cache_savings:
+                text += f" (saved {self.cache_savings:.4f} by prompt caching)"
+        return text
@@ -1,17 +1,40 @@
 """Bug detector module using LLM."""
+import asyncio
 import json
 import logging
+import sqlite3
 import time
 from dataclasses import dataclass, field
-from typing import Dict, Any, List, Optional
-from openai import OpenAI
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from pyscan.config import Config
 from pyscan.ast_parser import FunctionInfo
+from pyscan.endpoint_pool import Endpoint, EndpointPool
+from pyscan.http_client import HttpSettings, SharedHttpClient, get_shared_client
+from pyscan.json_stream import JsonObjectScanner
+from pyscan.latency import LatencyTracker, TimeoutPolicy
+from pyscan.rate_limiter import RateLimiter
+from pyscan.result_cache import ResultCache
+from pyscan.retry import RetryPolicy, classify_error
 
 
 logger = logging.getLogger(__name__)
 
 
+# openai 包导入耗时较长（数百毫秒），在第一次创建客户端时才导入，
+# 不发送请求的运行（--help、结果全部命中缓存）不需要它
+def OpenAI(**kwargs: Any) -> Any:
+    """Create an ``openai.OpenAI`` client."""
+    import openai
+    return openai.OpenAI(**kwargs)
+
+
+def AsyncOpenAI(**kwargs: Any) -> Any:
+    """Create an ``openai.AsyncOpenAI`` client."""
+    import openai
+    return openai.AsyncOpenAI(**kwargs)
+
+
 @dataclass
 class BugReport:
     """Bug detection report for a single bug."""
@@ -32,6 +55,47 @@ class BugReport:
     callers: List[Dict[str, Any]] = field(default_factory=list)  # 调用者信息列表（包含文件路径、函数名、代码片段）
     callees: List[str] = field(default_factory=list)  # 被调用函数名列表
     inferred_callers: List[Dict[str, str]] = field(default_factory=list)  # 推断的调用者（包含 hint 和代码）
+    function_id: str = ""  # 所属函数的进度 ID（cli.get_function_id），旧版本的报告为空
+
+
+class _StreamCollector:
+    """Accumulate a streamed chat completion and decide when to stop reading."""
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.scanner = JsonObjectScanner()
+        self.chunks = 0
+        self.usage = None
+        self.truncated = False
+
+    def feed(self, chunk: Any) -> bool:
+        """Add a chunk; True means the stream can be closed."""
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = chunk.usage
+        for choice in getattr(chunk, "choices", None) or []:
+            text = getattr(choice.delta, "content", None)
+            if not text:
+                continue
+            # 每个内容块约对应一个 token
+            self.chunks += 1
+            if self.scanner.feed(text):
+                return True
+            if self.chunks >= self.max_tokens:
+                self.truncated = True
+                return True
+        return False
+
+    def finish(self, request_tokens: int) -> Tuple[str, Any, bool]:
+        """(content, usage, truncated) of the collected response."""
+        usage = self.usage
+        if usage is None:
+            # 提前关闭流时服务端不会返回 usage，按估算计入
+            usage = SimpleNamespace(
+                prompt_tokens=request_tokens,
+                completion_tokens=self.chunks,
+                total_tokens=request_tokens + self.chunks,
+            )
+        return self.scanner.text, usage, self.truncated
 
 
 class BugDetector:
@@ -104,18 +168,126 @@ class BugDetector:
 如果没有发现**真正的 bug**，返回 {"has_bug": false, "severity": "low", "bugs": []}
 """
 
-    def __init__(self, config: Config):
+    # user prompt 的固定开头，与 system prompt 一起构成所有请求共享的缓存前缀
+    PROMPT_INSTRUCTIONS = (
+        "请分析下面的函数是否存在潜在 bug。"
+        "请返回 JSON 格式的分析结果，只返回 JSON，不要其他说明文字。\n"
+        "下面依次给出函数所在文件、函数类型、调用者，最后是带行号的当前函数代码。\n\n"
+    )
+
+    BATCH_PROMPT_INSTRUCTIONS = (
+        "请分别分析下面的每个函数是否存在潜在 bug。"
+        "每个函数独立分析，行号均相对于该函数自身的第一行（从1开始）。\n"
+        "请返回 JSON 格式的分析结果，只返回 JSON，不要其他说明文字。"
+        "以函数 ID 为键，每个函数的结果格式与单个函数的分析结果相同，"
+        "每个函数都必须给出结果：\n"
+        '{"results": {"f1": {"has_bug": false, "severity": "low", "bugs": []}, '
+        '"f2": {"has_bug": false, "severity": "low", "bugs": []}, ...}}\n\n'
+    )
+
+    def __init__(self, config: Config, cache: Optional[ResultCache] = None):
         """
         Initialize bug detector.
 
         Args:
             config: Configuration object.
+            cache: Optional persistent result cache; identical prompts are
+                answered from it without a request.
         """
         self.config = config
-        self.client = OpenAI(
-            base_url=config.llm_base_url,
-            api_key=config.llm_api_key
+        self.cache = cache
+        # 所有端点和检测器共用一个连接池，第一次发送请求时才创建（并导入 httpx），
+        # 结果全部命中缓存的运行不需要它
+        self.http_settings = HttpSettings.from_config(config)
+        self._http: Optional[SharedHttpClient] = None
+        self.pool = EndpointPool([
+            self._create_endpoint(endpoint_config)
+            for endpoint_config in config.llm_endpoints
+        ])
+        self.retry_policy = RetryPolicy.from_config(config)
+        self.timeout_policy = TimeoutPolicy.from_config(config)
+        # 成功请求的延迟分布，用于计算对冲请求的等待时间
+        self.latency = LatencyTracker(
+            quantile=config.detector_hedge_quantile,
+            min_delay=config.detector_hedge_min_delay,
+            min_samples=config.detector_hedge_min_samples
         )
+        # system prompt 的 token 估算（与 ContextBuilder 的简单估算一致）
+        self.system_prompt_tokens = len(self.SYSTEM_PROMPT) // 4
+
+    @property
+    def http(self) -> SharedHttpClient:
+        """Shared connection pool, created on the first request that misses the cache."""
+        if self._http is None:
+            self._http = get_shared_client(self.http_settings)
+        return self._http
+
+    async def aclose(self) -> None:
+        """Close the async HTTP client; call it before the event loop ends."""
+        if self._http is not None:
+            await self._http.aclose()
+
+    def close(self) -> None:
+        """Close the shared HTTP connection pool, if a request created it."""
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    def connection_summary(self) -> str:
+        """One-line connection reuse summary for the run log."""
+        if self._http is None:
+            return "no requests sent"
+        return self._http.stats.summary()
+
+    def _create_endpoint(self, endpoint_config: Dict[str, Any]) -> Endpoint:
+        """Create an endpoint with its own rate limiter (clients are created on first use)."""
+        return Endpoint(
+            name=endpoint_config["name"],
+            base_url=endpoint_config["base_url"],
+            api_key=endpoint_config["api_key"],
+            model=endpoint_config["model"],
+            weight=endpoint_config["weight"],
+            max_concurrency=endpoint_config["concurrency"],
+            rate_limiter=RateLimiter(
+                rpm=endpoint_config["rpm"], tpm=endpoint_config["tpm"]
+            ),
+        )
+
+    def _get_client(self, endpoint: Endpoint) -> Any:
+        """Sync client of an endpoint, created on first use."""
+        if endpoint.client is None:
+            # 重试由 RetryPolicy 统一控制，关闭客户端内置重试
+            endpoint.client = OpenAI(
+                base_url=endpoint.base_url,
+                api_key=endpoint.api_key,
+                max_retries=0,
+                http_client=self.http.client
+            )
+        return endpoint.client
+
+    @property
+    def client(self) -> Any:
+        """Sync client of the default endpoint."""
+        return self._get_client(self.pool.endpoints[0])
+
+    def _get_async_client(self, endpoint: Endpoint) -> Any:
+        """Async client of an endpoint, created on first use."""
+        http_client = self.http.async_client()
+        if endpoint.async_client is None or endpoint.async_http_client is not http_client:
+            # 共享的异步连接池绑定事件循环，换了事件循环需要重建客户端
+            endpoint.async_client = AsyncOpenAI(
+                base_url=endpoint.base_url,
+                api_key=endpoint.api_key,
+                max_retries=0,
+                http_client=http_client
+            )
+            endpoint.async_http_client = http_client
+        return endpoint.async_client
+
+    @property
+    def async_client(self) -> Any:
+        """Async client of the default endpoint."""
+        return self._get_async_client(self.pool.endpoints[0])
 
     def detect(
         self,
@@ -126,7 +298,8 @@ class BugDetector:
         callers: List[Dict[str, Any]] = None,
         callees: List[str] = None,
         inferred_callers: List[Dict[str, str]] = None,
-        bug_id_start: int = 1
+        bug_id_start: int = 1,
+        estimated_tokens: Optional[int] = None
     ) -> Optional[Dict[str, Any]]:
         """
         Detect bugs in a function.
@@ -140,86 +313,699 @@ class BugDetector:
             callees: List of callee function names.
             inferred_callers: List of inferred caller dicts with hints and code.
             bug_id_start: Starting bug ID number.
+            estimated_tokens: Token count of the context (from ContextBuilder),
+                used to reserve rate-limit budget. Estimated from the prompt
+                if not given.
 
         Returns:
             Dictionary containing:
                 - reports: List of BugReport (one per bug found, empty if no bugs)
                 - prompt: The full prompt sent to LLM
                 - raw_response: The raw response from LLM
+                - usage: Token usage summed over all attempts
+                  (requests, prompt_tokens, completion_tokens, total_tokens,
+                  cached_tokens)
             None if failed after retries.
         """
         prompt = self._build_prompt(function, context)
+        request_tokens = self._estimate_request_tokens(prompt, estimated_tokens)
+
+        response = self._request(function.name, prompt, request_tokens, self._parse_response)
+        if response is None:
+            return None
+        result, content, usage = response
+        return {
+            "reports": self._build_reports(
+                function.name, result, file_path, function_start_line,
+                callers, callees, inferred_callers, bug_id_start
+            ),
+            "prompt": prompt,
+            "raw_response": content,
+            "usage": usage
+        }
 
-        for attempt in range(self.config.detector_max_retries):
+    async def detect_async(
+        self,
+        function: FunctionInfo,
+        context: Dict[str, Any],
+        file_path: str = "",
+        function_start_line: int = 0,
+        callers: List[Dict[str, Any]] = None,
+        callees: List[str] = None,
+        inferred_callers: List[Dict[str, str]] = None,
+        bug_id_start: int = 1,
+        estimated_tokens: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Async variant of detect(), used by the concurrent detection engine.
+
+        Takes the same arguments and returns the same result as detect().
+        """
+        prompt = self._build_prompt(function, context)
+        request_tokens = self._estimate_request_tokens(prompt, estimated_tokens)
+
+        response = await self._request_async(
+            function.name, prompt, request_tokens, self._parse_response
+        )
+        if response is None:
+            return None
+        result, content, usage = response
+        return {
+            "reports": self._build_reports(
+                function.name, result, file_path, function_start_line,
+                callers, callees, inferred_callers, bug_id_start
+            ),
+            "prompt": prompt,
+            "raw_response": content,
+            "usage": usage
+        }
+
+    def detect_batch(self, jobs: List[Any]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Detect bugs in several small functions with a single LLM request.
+
+        The functions are packed into one prompt under short function ids and
+        the response is keyed by those ids. Line numbers in each result stay
+        relative to the function's own first line, exactly as in detect().
+        Functions missing from an otherwise valid response are re-detected
+        one by one.
+
+        Args:
+            jobs: DetectionJob objects (function, context, file_path, callers,
+                callees, inferred_callers, estimated_tokens).
+
+        Returns:
+            One detect()-style result per job, in job order (None for jobs
+            that failed after retries). The batch's token usage is attached
+            to the first result; the others carry zero usage, so summing
+            usage over the results counts every request once.
+        """
+        prompt, function_ids = self._build_batch_prompt(jobs)
+        request_tokens = self._estimate_request_tokens(prompt, self._batch_tokens(jobs))
+
+        response = self._request(
+            self._batch_label(jobs), prompt, request_tokens,
+            lambda content: self._parse_batch_response(content, function_ids),
+            function_count=len(jobs)
+        )
+        if response is None:
+            return [None] * len(jobs)
+        results, content, usage = response
+
+        batch_results = []
+        for i, (job, function_id) in enumerate(zip(jobs, function_ids)):
+            if function_id in results:
+                batch_results.append(
+                    self._batch_result(job, results[function_id], prompt, content, usage, i)
+                )
+            else:
+                batch_results.append(self._detect_job(job))
+        return batch_results
+
+    async def detect_batch_async(self, jobs: List[Any]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Async variant of detect_batch(), used by the concurrent detection engine.
+
+        Takes the same arguments and returns the same result as detect_batch().
+        """
+        prompt, function_ids = self._build_batch_prompt(jobs)
+        request_tokens = self._estimate_request_tokens(prompt, self._batch_tokens(jobs))
+
+        response = await self._request_async(
+            self._batch_label(jobs), prompt, request_tokens,
+            lambda content: self._parse_batch_response(content, function_ids),
+            function_count=len(jobs)
+        )
+        if response is None:
+            return [None] * len(jobs)
+        results, content, usage = response
+
+        batch_results = []
+        for i, (job, function_id) in enumerate(zip(jobs, function_ids)):
+            if function_id in results:
+                batch_results.append(
+                    self._batch_result(job, results[function_id], prompt, content, usage, i)
+                )
+            else:
+                batch_results.append(await self._detect_job_async(job))
+        return batch_results
+
+    def _request(
+        self,
+        name: str,
+        prompt: str,
+        request_tokens: int,
+        parse: Callable[[str], Any],
+        function_count: int = 1
+    ) -> Optional[Tuple[Any, str, Dict[str, int]]]:
+        """
+        Send a prompt, retrying per RetryPolicy and failing over between endpoints.
+
+        Args:
+            name: Function (or batch) name used in log messages.
+            prompt: User prompt.
+            request_tokens: Estimated prompt tokens, for rate limiting.
+            parse: Parser applied to the response content; raising ValueError
+                makes the attempt count as a parse error.
+            function_count: Number of functions in the prompt, which scales
+                the output token budget.
+
+        Returns:
+            (parsed result, raw content, usage), or None if failed after retries.
+        """
+        cached = self._cache_lookup(prompt)
+        if cached is not None:
+            return cached
+
+        max_tokens = self._max_output_tokens(function_count)
+        failures: Dict[str, int] = {}
+        usage = self._empty_usage()
+        attempt = 0
+        endpoint = None
+
+        while True:
+            attempt += 1
+            # 重试时优先换到其他端点
+            endpoint = self.pool.acquire_sync(exclude=endpoint)
+            error = None
             try:
-                response = self.client.chat.completions.create(
-                    model=self.config.llm_model,
-                    messages=[
-                        {"role": "system", "content": self.SYSTEM_PROMPT},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=self.config.llm_temperature,
-                    max_tokens=self.config.llm_max_tokens
+                endpoint.rate_limiter.acquire_sync(request_tokens)
+                content, response_usage, truncated = self._complete(
+                    endpoint, prompt, request_tokens, max_tokens
                 )
 
-                content = response.choices[0].message.content
-                result = self._parse_response(content)
-
-                # 将每个 bug 转换为独立的 BugReport
-                reports = []
-                if result["has_bug"] and result["bugs"]:
-                    for idx, bug in enumerate(result["bugs"]):
-                        bug_id = f"BUG_{bug_id_start + idx:04d}"
-                        report = BugReport(
-                            bug_id=bug_id,
-                            function_name=function.name,
-                            file_path=file_path,
-                            function_start_line=function_start_line,
-                            severity=bug.get("severity", result.get("severity", "low")),
-                            bug_type=bug.get("type", "Unknown"),
-                            description=bug.get("description", ""),
-                            location=bug.get("location", ""),
-                            start_line=bug.get("start_line", 0),
-                            end_line=bug.get("end_line", 0),
-                            start_col=bug.get("start_col", 0),
-                            end_col=bug.get("end_col", 0),
-                            suggestion=bug.get("suggestion", ""),
-                            callers=callers or [],
-                            callees=callees or [],
-                            inferred_callers=inferred_callers or []
-                        )
-                        reports.append(report)
-
-                return {
-                    "reports": reports,
-                    "prompt": prompt,
-                    "raw_response": content
-                }
+                self._settle_rate_limit(endpoint, request_tokens, response_usage)
+                self._add_usage(usage, response_usage)
+                if truncated:
+                    raise ValueError(f"Response exceeded output budget of {max_tokens} tokens")
+                result = parse(content)
 
             except Exception as e:
-                logger.warning(
-                    f"Attempt {attempt + 1}/{self.config.detector_max_retries} "
-                    f"failed for function {function.name}: {e}"
+                error = e
+            except BaseException as e:
+                # KeyboardInterrupt 等不是 Exception，归还端点后继续传播
+                error = e
+                raise
+            finally:
+                self.pool.release(endpoint, error)
+
+            if error is not None:
+                delay = self._next_retry_delay(name, attempt, error, failures, endpoint)
+                if delay is None:
+                    return None
+                # 等待后重试
+                time.sleep(delay)
+                continue
+
+            self._cache_store(endpoint, prompt, content, result)
+            return result, content, usage
+
+    async def _request_async(
+        self,
+        name: str,
+        prompt: str,
+        request_tokens: int,
+        parse: Callable[[str], Any],
+        function_count: int = 1
+    ) -> Optional[Tuple[Any, str, Dict[str, int]]]:
+        """Async variant of _request()."""
+        cached = self._cache_lookup(prompt)
+        if cached is not None:
+            return cached
+
+        max_tokens = self._max_output_tokens(function_count)
+        failures: Dict[str, int] = {}
+        usage = self._empty_usage()
+        attempt = 0
+        endpoint = None
+
+        while True:
+            attempt += 1
+            endpoint = await self.pool.acquire(exclude=endpoint)
+            error = None
+            try:
+                await endpoint.rate_limiter.acquire(request_tokens)
+                content, response_usage, truncated = await self._complete_hedged(
+                    endpoint, prompt, request_tokens, max_tokens
                 )
 
-                if attempt < self.config.detector_max_retries - 1:
-                    # 等待后重试
-                    time.sleep(1)
-                else:
-                    logger.error(
-                        f"Failed to detect bugs for {function.name} "
-                        f"after {self.config.detector_max_retries} attempts"
-                    )
+                self._settle_rate_limit(endpoint, request_tokens, response_usage)
+                self._add_usage(usage, response_usage)
+                if truncated:
+                    raise ValueError(f"Response exceeded output budget of {max_tokens} tokens")
+                result = parse(content)
+
+            except Exception as e:
+                error = e
+            except BaseException as e:
+                # 任务被取消（CancelledError 不是 Exception），归还端点后继续传播
+                error = e
+                raise
+            finally:
+                self.pool.release(endpoint, error)
+
+            if error is not None:
+                delay = self._next_retry_delay(name, attempt, error, failures, endpoint)
+                if delay is None:
                     return None
+                await asyncio.sleep(delay)
+                continue
 
+            self._cache_store(endpoint, prompt, content, result)
+            return result, content, usage
+
+    def _cache_lookup(self, prompt: str) -> Optional[Tuple[Any, str, Dict[str, int]]]:
+        """
+        Cached (result, content, usage) for a prompt, or None on a miss.
+
+        Results are stored under the model that answered (_cache_store()).
+        A lookup accepts the result of any model configured on an endpoint:
+        the request itself could have been routed to any of them, so their
+        answers are treated as interchangeable. Results of models no longer
+        configured are not used.
+        """
+        if self.cache is None:
+            return None
+        # 按端点配置顺序查找，第一个端点的模型优先
+        for model in dict.fromkeys(endpoint.model for endpoint in self.pool.endpoints):
+            key = ResultCache.make_key(model, self.config.llm_temperature, self.SYSTEM_PROMPT, prompt)
+            hit = self.cache.get(key)
+            if hit is not None:
+                content, result = hit
+                return result, content, self._empty_usage()
         return None
 
+    def _cache_store(self, endpoint: Endpoint, prompt: str, content: str, result: Any) -> None:
+        """Store a successfully parsed response in the result cache."""
+        if self.cache is None:
+            return
+        key = ResultCache.make_key(endpoint.model, self.config.llm_temperature, self.SYSTEM_PROMPT, prompt)
+        try:
+            self.cache.put(key, content, result)
+        except sqlite3.Error as e:
+            # 缓存写入失败不影响检测结果
+            logger.warning(f"Failed to store result in cache: {e}")
+
+    def _detect_job(self, job: Any) -> Optional[Dict[str, Any]]:
+        """Run detect() for a single DetectionJob."""
+        logger.warning(f"Function {job.function.name} missing from batch response, detecting it alone")
+        return self.detect(**self._job_kwargs(job))
+
+    async def _detect_job_async(self, job: Any) -> Optional[Dict[str, Any]]:
+        """Run detect_async() for a single DetectionJob."""
+        logger.warning(f"Function {job.function.name} missing from batch response, detecting it alone")
+        return await self.detect_async(**self._job_kwargs(job))
+
+    @staticmethod
+    def _job_kwargs(job: Any) -> Dict[str, Any]:
+        """Arguments of detect() for a DetectionJob."""
+        return {
+            "function": job.function,
+            "context": job.context,
+            "file_path": job.file_path,
+            "function_start_line": job.function.lineno,
+            "callers": job.callers,
+            "callees": job.callees,
+            "inferred_callers": job.inferred_callers,
+            "estimated_tokens": job.estimated_tokens,
+        }
+
+    def _batch_result(
+        self,
+        job: Any,
+        result: Dict[str, Any],
+        prompt: str,
+        content: str,
+        usage: Dict[str, int],
+        index: int
+    ) -> Dict[str, Any]:
+        """detect()-style result for one function of a batch."""
+        return {
+            "reports": self._build_reports(
+                job.function.name, result, job.file_path, job.function.lineno,
+                job.callers, job.callees, job.inferred_callers, 1
+            ),
+            "prompt": prompt,
+            "raw_response": content,
+            # 整批的用量只计入第一个函数
+            "usage": usage if index == 0 else self._empty_usage()
+        }
+
+    @staticmethod
+    def _batch_tokens(jobs: List[Any]) -> Optional[int]:
+        """Summed context tokens of a batch, or None if any job lacks an estimate."""
+        if any(job.estimated_tokens is None for job in jobs):
+            return None
+        return sum(job.estimated_tokens for job in jobs)
+
+    @staticmethod
+    def _batch_label(jobs: List[Any]) -> str:
+        """Name of a batch in log messages."""
+        return f"batch of {len(jobs)} ({jobs[0].function.name}, ...)"
+
+    def _estimate_request_tokens(self, prompt: str, estimated_tokens: Optional[int]) -> int:
+        """Estimate prompt-side token cost of a request for rate limiting."""
+        if estimated_tokens is None:
+            estimated_tokens = len(prompt) // 4
+        return estimated_tokens + self.system_prompt_tokens
+
+    @staticmethod
+    def _empty_usage() -> Dict[str, int]:
+        """Usage counters accumulated over all attempts of one detection."""
+        return {
+            "requests": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "total_tokens": 0, "cached_tokens": 0
+        }
+
+    @staticmethod
+    def _add_usage(usage: Dict[str, int], response_usage: Any) -> None:
+        """Add the token usage reported for a response (failed parses still cost tokens)."""
+        usage["requests"] += 1
+        for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            value = getattr(response_usage, key, None)
+            if isinstance(value, int):
+                usage[key] += value
+        # 命中服务端前缀缓存的 prompt token 数
+        details = getattr(response_usage, "prompt_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", None)
+        if isinstance(cached_tokens, int):
+            usage["cached_tokens"] += cached_tokens
+
+    def _max_output_tokens(self, function_count: int = 1) -> int:
+        """Output token limit of a request covering ``function_count`` functions."""
+        per_function = self.config.llm_output_tokens_per_function
+        if per_function is None:
+            return self.config.llm_max_tokens
+        return min(self.config.llm_max_tokens, per_function * function_count)
+
+    def _request_kwargs(self, endpoint: Endpoint, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Arguments of chat.completions.create for an endpoint."""
+        return {
+            "model": endpoint.model,
+            "messages": self._build_messages(prompt),
+            "temperature": self.config.llm_temperature,
+            "max_tokens": max_tokens or self._max_output_tokens(),
+        }
+
+    def _complete(
+        self, endpoint: Endpoint, prompt: str, request_tokens: int, max_tokens: int
+    ) -> Tuple[str, Any, bool]:
+        """
+        Send one chat completion request.
+
+        In streaming mode the stream is closed as soon as the top-level JSON
+        object is complete, or once ``max_tokens`` content chunks arrived
+        (for gateways that ignore ``max_tokens``).
+
+        The request timeout is scaled to the prompt size (TimeoutPolicy).
+
+        Returns:
+            (content, usage, truncated); usage is estimated if the stream was
+            closed before the server reported it.
+        """
+        kwargs = self._request_kwargs(endpoint, prompt, max_tokens)
+        kwargs["timeout"] = self.timeout_policy.timeout(request_tokens)
+        if not self.config.llm_stream:
+            response = self._get_client(endpoint).chat.completions.create(**kwargs)
+            return response.choices[0].message.content, getattr(response, "usage", None), False
+
+        stream = self._get_client(endpoint).chat.completions.create(
+            **kwargs, stream=True, stream_options={"include_usage": True}
+        )
+        collector = _StreamCollector(max_tokens)
+        try:
+            for chunk in stream:
+                if collector.feed(chunk):
+                    break
+        finally:
+            stream.close()
+        return collector.finish(request_tokens)
+
+    async def _complete_hedged(
+        self, endpoint: Endpoint, prompt: str, request_tokens: int, max_tokens: int
+    ) -> Tuple[str, Any, bool]:
+        """
+        Send a request and, if it is still running after the hedging delay,
+        race a duplicate on another endpoint (or another slot of the same one).
+
+        The first successful answer wins and the other request is cancelled.
+        If both fail, the primary request's error is raised so retry and
+        failover treat it like an unhedged failure.
+
+        Returns:
+            Same as _complete().
+        """
+        delay = self.latency.hedge_delay() if self.config.detector_hedge_enabled else None
+        started = time.monotonic()
+        primary = asyncio.create_task(
+            self._complete_async(endpoint, prompt, request_tokens, max_tokens)
+        )
+        hedge = None
+        hedge_endpoint = None
+        reservation = None
+        winner_usage = None
+
+        try:
+            if delay is None:
+                result = await primary
+                self.latency.record(time.monotonic() - started)
+                return result
+
+            await asyncio.wait({primary}, timeout=delay)
+            if not primary.done():
+                # 主请求仍占用着自己的名额：所有端点都满时，等待名额不能阻塞主请求，
+                # 主请求先完成就放弃对冲
+                reservation = asyncio.create_task(self._reserve_hedge(endpoint, request_tokens))
+                await asyncio.wait({primary, reservation}, return_when=asyncio.FIRST_COMPLETED)
+                if not primary.done():
+                    hedge_endpoint = reservation.result()
+
+            if hedge_endpoint is not None:
+                self.latency.hedges_sent += 1
+                logger.debug(
+                    f"Request on {endpoint.name} exceeded {delay:.1f}s, "
+                    f"hedging on {hedge_endpoint.name}"
+                )
+                hedge = asyncio.create_task(
+                    self._complete_async(hedge_endpoint, prompt, request_tokens, max_tokens)
+                )
+
+            pending = {task for task in (primary, hedge) if task is not None}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, hedge):
+                    if task in done and task.exception() is None:
+                        if task is primary:
+                            self.latency.record(time.monotonic() - started)
+                        else:
+                            self.latency.hedges_won += 1
+                        winner_usage = task.result()[1]
+                        return task.result()
+            # 两个请求都失败：按主请求的错误处理
+            raise primary.exception()
+
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+            if reservation is not None and hedge_endpoint is None:
+                self._cancel_hedge_reservation(reservation, request_tokens)
+            if hedge_endpoint is not None:
+                hedge_error = None
+                if hedge is not None and hedge.done() and not hedge.cancelled():
+                    hedge_error = hedge.exception()
+                if hedge_error is None and winner_usage is not None:
+                    # 与主请求相同：按实际用量结算对冲请求的 token 预留
+                    # （被取消的一方按胜出响应的用量计）；失败的请求保留预估值
+                    self._settle_rate_limit(hedge_endpoint, request_tokens, winner_usage)
+                self.pool.release(hedge_endpoint, hedge_error)
+
+    async def _reserve_hedge(self, endpoint: Endpoint, request_tokens: int) -> Endpoint:
+        """Reserve an endpoint slot and rate-limit budget for a hedge request."""
+        hedge_endpoint = await self.pool.acquire(exclude=endpoint)
+        try:
+            await hedge_endpoint.rate_limiter.acquire(request_tokens)
+        except BaseException:
+            # 等待限流时被取消：请求没有发出，退还预留
+            hedge_endpoint.rate_limiter.refund(request_tokens)
+            self.pool.cancel(hedge_endpoint)
+            raise
+        return hedge_endpoint
+
+    def _cancel_hedge_reservation(self, reservation: asyncio.Task, request_tokens: int) -> None:
+        """Cancel an unused _reserve_hedge() task, undoing it if it already completed."""
+        def undo(task: asyncio.Task) -> None:
+            if not task.cancelled() and task.exception() is None:
+                # 主请求完成的同时对冲名额也已就绪
+                hedge_endpoint = task.result()
+                hedge_endpoint.rate_limiter.refund(request_tokens)
+                self.pool.cancel(hedge_endpoint)
+
+        reservation.cancel()
+        reservation.add_done_callback(undo)
+
+    async def _complete_async(
+        self, endpoint: Endpoint, prompt: str, request_tokens: int, max_tokens: int
+    ) -> Tuple[str, Any, bool]:
+        """
+        Async variant of _complete().
+
+        The whole request, including reading a stream, is bounded by the
+        scaled timeout, so a stream that trickles tokens cannot hang either.
+        """
+        timeout = self.timeout_policy.timeout(request_tokens)
+        return await asyncio.wait_for(
+            self._send_async(endpoint, prompt, request_tokens, max_tokens, timeout), timeout
+        )
+
+    async def _send_async(
+        self,
+        endpoint: Endpoint,
+        prompt: str,
+        request_tokens: int,
+        max_tokens: int,
+        timeout: float
+    ) -> Tuple[str, Any, bool]:
+        client = self._get_async_client(endpoint)
+        kwargs = self._request_kwargs(endpoint, prompt, max_tokens)
+        kwargs["timeout"] = timeout
+        if not self.config.llm_stream:
+            response = await client.chat.completions.create(**kwargs)
+            return response.choices[0].message.content, getattr(response, "usage", None), False
+
+        stream = await client.chat.completions.create(
+            **kwargs, stream=True, stream_options={"include_usage": True}
+        )
+        collector = _StreamCollector(max_tokens)
+        try:
+            async for chunk in stream:
+                if collector.feed(chunk):
+                    break
+        finally:
+            await stream.close()
+        return collector.finish(request_tokens)
+
+    def _settle_rate_limit(self, endpoint: Endpoint, request_tokens: int, response_usage: Any) -> None:
+        """Charge the real token usage of a response against the endpoint's TPM budget."""
+        total_tokens = getattr(response_usage, "total_tokens", None)
+        if isinstance(total_tokens, int):
+            endpoint.rate_limiter.settle(request_tokens, total_tokens)
+
+    def _next_retry_delay(
+        self,
+        name: str,
+        attempt: int,
+        error: Exception,
+        failures: Dict[str, int],
+        endpoint: Endpoint
+    ) -> Optional[float]:
+        """
+        Log a failed attempt and decide whether and when to retry.
+
+        Args:
+            name: Function (or batch) being analyzed.
+            attempt: One-based index of the failed attempt.
+            error: Exception raised by the attempt.
+            failures: Per-class failure counters for this request.
+            endpoint: Endpoint that served the failed attempt.
+
+        Returns:
+            Seconds to wait before retrying, or None to give up.
+        """
+        error_class = classify_error(error)
+        delay = self.retry_policy.next_delay(error, failures)
+        budget = self.retry_policy.budget(error_class)
+
+        logger.warning(
+            f"Attempt {attempt} failed for function {name} on {endpoint.name} "
+            f"({error_class} {failures[error_class]}/{budget}): {error}"
+        )
+
+        if (
+            delay is not None
+            and self.pool.is_endpoint_error(error)
+            and self.pool.has_alternative(endpoint)
+        ):
+            # 端点故障：立即切换到其他健康端点，无需等待
+            delay = 0.0
+
+        if delay is None:
+            logger.error(
+                f"Failed to detect bugs for {name} after {attempt} attempts "
+                f"(retry budget for {error_class} exhausted)"
+            )
+        return delay
+
+    def _build_messages(self, prompt: str) -> List[Dict[str, str]]:
+        """Build chat messages for a prompt."""
+        return [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _build_reports(
+        self,
+        function_name: str,
+        result: Dict[str, Any],
+        file_path: str,
+        function_start_line: int,
+        callers: Optional[List[Dict[str, Any]]],
+        callees: Optional[List[str]],
+        inferred_callers: Optional[List[Dict[str, str]]],
+        bug_id_start: int
+    ) -> List[BugReport]:
+        """
+        Convert a parsed LLM result into one BugReport per bug.
+
+        Args:
+            function_name: Name of the function that was analyzed.
+            result: Parsed response from _parse_response.
+            file_path: Path to the file containing the function.
+            function_start_line: Starting line number of function.
+            callers: Caller info dicts attached to every report.
+            callees: Callee names attached to every report.
+            inferred_callers: Inferred caller dicts attached to every report.
+            bug_id_start: Starting bug ID number.
+
+        Returns:
+            List of BugReport, empty if no bugs.
+        """
+        reports = []
+        if result["has_bug"] and result["bugs"]:
+            for idx, bug in enumerate(result["bugs"]):
+                bug_id = f"BUG_{bug_id_start + idx:04d}"
+                report = BugReport(
+                    bug_id=bug_id,
+                    function_name=function_name,
+                    file_path=file_path,
+                    function_start_line=function_start_line,
+                    severity=bug.get("severity", result.get("severity", "low")),
+                    bug_type=bug.get("type", "Unknown"),
+                    description=bug.get("description", ""),
+                    location=bug.get("location", ""),
+                    start_line=bug.get("start_line", 0),
+                    end_line=bug.get("end_line", 0),
+                    start_col=bug.get("start_col", 0),
+                    end_col=bug.get("end_col", 0),
+                    suggestion=bug.get("suggestion", ""),
+                    callers=callers or [],
+                    callees=callees or [],
+                    inferred_callers=inferred_callers or []
+                )
+                reports.append(report)
+        return reports
+
     def _build_prompt(
         self, function: FunctionInfo, context: Dict[str, Any]
     ) -> str:
         """
         Build prompt for LLM.
 
+        The layout follows provider prefix caching: static instructions
+        first, then per-file context, then per-function context with the
+        function's own code last, so consecutive requests share the longest
+        possible prefix.
+
         Args:
             function: Function to analyze.
             context: Function context.
@@ -227,9 +1013,50 @@ class BugDetector:
         Returns:
             Formatted prompt.
         """
+        parts = [self.PROMPT_INSTRUCTIONS]
+        parts.extend(self._build_function_sections(function, context))
+        return "".join(parts)
+
+    def _build_batch_prompt(self, jobs: List[Any]) -> Tuple[str, List[str]]:
+        """
+        Build one prompt covering several functions.
+
+        Uses the same cache-friendly layout as _build_prompt, with static
+        batch instructions first.
+
+        Args:
+            jobs: DetectionJob objects to pack.
+
+        Returns:
+            (prompt, function ids in job order).
+        """
+        function_ids = [f"f{i}" for i in range(1, len(jobs) + 1)]
+        parts = [self.BATCH_PROMPT_INSTRUCTIONS]
+
+        for function_id, job in zip(function_ids, jobs):
+            parts.append(f"## 函数 {function_id}\n\n")
+            parts.extend(self._build_function_sections(job.function, job.context))
+
+        return "".join(parts), function_ids
+
+    def _build_function_sections(self, function: FunctionInfo, context: Dict[str, Any]) -> List[str]:
+        """
+        Prompt sections describing one function: its file, type and callers,
+        then its numbered code.
+
+        Args:
+            function: Function to analyze.
+            context: Function context.
+
+        Returns:
+            Prompt fragments, to be joined.
+        """
         parts = []
 
-        parts.append("请分析以下函数是否存在潜在 bug：\n\n")
+        # 同一文件的函数共享此部分
+        file_path = getattr(function, "file_path", "")
+        if file_path:
+            parts.append(f"### 文件\n`{file_path}`\n\n")
 
         # 添加函数类型说明
         is_public_api = context.get("is_public_api", False)
@@ -240,14 +1067,6 @@ class BugDetector:
         else:
             parts.append("（此函数仅被项目内部代码调用，可以信任调用者已做验证）\n\n")
 
-        parts.append("### 当前函数\n")
-        parts.append("```python\n")
-        # 添加行号以帮助 LLM 定位
-        code_lines = context["current_function"].split('\n')
-        for i, line in enumerate(code_lines, 1):
-            parts.append(f"{i:3d} | {line}\n")
-        parts.append("```\n\n")
-
         if context.get("callers"):
             parts.append("### 调用者函数\n")
             for i, caller in enumerate(context["callers"], 1):
@@ -267,11 +1086,24 @@ class BugDetector:
 
         # 推断的 callees 已移除 - 不需要在 prompt 中展示
 
-        parts.append(
-            "请返回 JSON 格式的分析结果，只返回 JSON，不要其他说明文字。"
-        )
+        # 低置信度的调用者：调用目标未能解析，可能并不调用当前函数
+        if context.get("uncertain_callers"):
+            parts.append("### 可能的调用者函数(调用关系未能确认，仅供参考)\n")
+            for i, caller in enumerate(context["uncertain_callers"], 1):
+                parts.append(f"可能的调用者 {i}:\n```python\n")
+                parts.append(caller)
+                parts.append("\n```\n\n")
 
-        return "".join(parts)
+        # 当前函数放在最后：变化最频繁的内容不影响前面的缓存前缀
+        parts.append("### 当前函数\n")
+        parts.append("```python\n")
+        # 添加行号以帮助 LLM 定位
+        code_lines = context["current_function"].split('\n')
+        for i, line in enumerate(code_lines, 1):
+            parts.append(f"{i:3d} | {line}\n")
+        parts.append("```\n")
+
+        return parts
 
     def _parse_response(self, content: str) -> Dict[str, Any]:
         """
@@ -286,6 +1118,43 @@ class BugDetector:
         Raises:
             ValueError: If response cannot be parsed.
         """
+        return self._normalize_result(self._load_json(content))
+
+    def _parse_batch_response(self, content: str, function_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Parse a batched LLM response keyed by function id.
+
+        Args:
+            content: Response content.
+            function_ids: Ids used in the batch prompt.
+
+        Returns:
+            Parsed result per function id; ids missing from the response are
+            left out (unknown ids are ignored).
+
+        Raises:
+            ValueError: If response cannot be parsed.
+        """
+        data = self._load_json(content)
+        results = data.get("results", data) if isinstance(data, dict) else None
+        if not isinstance(results, dict):
+            raise ValueError("Missing 'results' object in batch response")
+
+        parsed = {}
+        for function_id in function_ids:
+            if isinstance(results.get(function_id), dict):
+                parsed[function_id] = self._normalize_result(results[function_id])
+        if not parsed:
+            raise ValueError("Batch response contains no known function ids")
+        return parsed
+
+    def _load_json(self, content: str) -> Any:
+        """
+        Decode the JSON payload of a response.
+
+        Raises:
+            ValueError: If the content is not valid JSON.
+        """
         # 尝试提取 JSON（可能包含在 markdown 代码块中）
         content = content.strip()
 
@@ -302,29 +1171,36 @@ class BugDetector:
                     content = content[:-3]
 
         try:
-            result = json.loads(content.strip())
-
-            # 验证必需字段
-            if "has_bug" not in result:
-                raise ValueError("Missing 'has_bug' field")
-            if "severity" not in result:
-                result["severity"] = "low"
-            if "bugs" not in result:
-                result["bugs"] = []
-
-            # 验证和补充 bug 位置信息
-            for bug in result["bugs"]:
-                if "start_line" not in bug:
-                    bug["start_line"] = 0
-                if "end_line" not in bug:
-                    bug["end_line"] = 0
-                if "start_col" not in bug:
-                    bug["start_col"] = 0
-                if "end_col" not in bug:
-                    bug["end_col"] = 0
-
-            return result
-
+            return json.loads(content.strip())
         except json.JSONDecodeError as e:
             logger.error(f"Failed to parse JSON response: {content}")
             raise ValueError(f"Invalid JSON response: {e}")
+
+    @staticmethod
+    def _normalize_result(result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Validate a single-function result and fill in defaults.
+
+        Raises:
+            ValueError: If the 'has_bug' field is missing.
+        """
+        # 验证必需字段
+        if "has_bug" not in result:
+            raise ValueError("Missing 'has_bug' field")
+        if "severity" not in result:
+            result["severity"] = "low"
+        if "bugs" not in result:
+            result["bugs"] = []
+
+        # 验证和补充 bug 位置信息
+        for bug in result["bugs"]:
+            if "start_line" not in bug:
+                bug["start_line"] = 0
+            if "end_line" not in bug:
+                bug["end_line"] = 0
+            if "start_col" not in bug:
+                bug["start_col"] = 0
+            if "end_col" not in bug:
+                bug["end_col"] = 0
+
+        return result
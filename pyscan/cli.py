@@ -1,18 +1,29 @@
 """Command line interface for pyscan."""
 import argparse
+import asyncio
 import json
 import logging
 import os
 import sys
+import threading
 from pathlib import Path
-from tqdm import tqdm
 
 from pyscan.config import Config, ConfigError
 from pyscan.scanner import Scanner
 from pyscan.ast_parser import ASTParser
-from pyscan.context_builder import ContextBuilder
+from pyscan.context_builder import ContextBuilder, warm_up_tokenizer
+from pyscan.batch_job import (
+    BatchManifest, batch_custom_id, build_batch_request, read_batch_results, write_jsonl
+)
+from pyscan.budget import ScanBudget, parse_duration
 from pyscan.bug_detector import BugDetector
+from pyscan.detection_engine import BatchPolicy, DetectionEngine, DetectionJob
+from pyscan.git_diff import GitDiffError, changed_line_ranges, overlaps
+from pyscan.parse_cache import ParseCache
+from pyscan.pipeline import StreamingPipeline
+from pyscan.scheduler import Scheduler, load_score_function
 from pyscan.reporter import Reporter
+from pyscan.result_cache import ResultCache
 
 
 # 设置日志
@@ -40,6 +51,10 @@ class ProgressManager:
         self.progress_file = progress_dir / "progress.json"
         self.reports_file = progress_dir / "reports.json"
         self.prompts_dir = progress_dir / "prompts"
+        self.batch_manifest_file = progress_dir / "batch_manifest.json"
+        self.cache_file = progress_dir / ResultCache.FILENAME
+        # 已完成函数的检测输入指纹（函数 ID -> {"code": ..., "context": ...}）
+        self.fingerprints = {}
 
         # 确保目录存在
         self.progress_dir.mkdir(parents=True, exist_ok=True)
@@ -59,6 +74,7 @@ class ProgressManager:
             with open(self.progress_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
             completed = set(data.get('completed_functions', []))
+            self.fingerprints = data.get('fingerprints', {})
 
             if self.reports_file.exists():
                 with open(self.reports_file, 'r', encoding='utf-8') as f:
@@ -82,7 +98,8 @@ class ProgressManager:
                         suggestion=r['suggestion'],
                         callers=r.get('callers', []),
                         callees=r.get('callees', []),
-                        inferred_callers=r.get('inferred_callers', [])
+                        inferred_callers=r.get('inferred_callers', []),
+                        function_id=r.get('function_id', '')
                     )
                     for r in reports_data
                 ]
@@ -108,7 +125,12 @@ class ProgressManager:
             # 保存已完成函数列表
             with open(self.progress_file, 'w', encoding='utf-8') as f:
                 json.dump({
-                    'completed_functions': list(completed_functions)
+                    'completed_functions': list(completed_functions),
+                    'fingerprints': {
+                        function_id: fingerprint
+                        for function_id, fingerprint in self.fingerprints.items()
+                        if function_id in completed_functions
+                    }
                 }, f, indent=2)
 
             # 保存报告（新格式：每个 bug 一个 report）
@@ -129,7 +151,8 @@ class ProgressManager:
                     'suggestion': r.suggestion,
                     'callers': r.callers,
                     'callees': r.callees,
-                    'inferred_callers': r.inferred_callers
+                    'inferred_callers': r.inferred_callers,
+                    'function_id': r.function_id
                 }
                 for r in reports
             ]
@@ -184,49 +207,41 @@ class ProgressManager:
             logger.error(f"Failed to save LLM interaction for {function_name}: {e}")
 
 
-def extract_caller_snippet(caller_code: str, target_func_name: str, context_lines: int = 5) -> str:
+def extract_caller_snippet(caller, call_sites, context_lines: int = 5) -> str:
     """
-    提取调用者函数的签名和调用目标函数的代码片段。
+    提取调用者函数的签名和每个调用点附近的代码片段。
 
     Args:
-        caller_code: 调用者函数的完整代码
-        target_func_name: 目标函数名（被调用的函数）
+        caller: 调用者函数（FunctionInfo）
+        call_sites: 调用点位置 (起始行, 起始列, 结束行, 结束列)，
+            来自 ContextBuilder.get_call_sites
         context_lines: 调用行上下文行数（±N行）
 
     Returns:
-        包含签名和调用上下文的代码片段，调用行用 >>>  标记
+        包含签名和调用上下文的代码片段，调用所在的行（多行调用的每一行）用 >>>  标记；
+        没有调用点时只返回签名
     """
-    lines = caller_code.split('\n')
-    if not lines:
-        return caller_code
+    lines = caller.code.split('\n')
 
     # 提取函数签名（第一行，通常是 def xxx(...): ）
-    signature = lines[0] if lines else ""
-
-    # 查找包含目标函数调用的所有行号
-    call_lines = []
-    for i, line in enumerate(lines):
-        # 简单检查：行中是否包含 target_func_name(
-        if f"{target_func_name}(" in line:
-            call_lines.append(i)
-
-    if not call_lines:
-        # 如果没找到调用行，返回签名
-        return signature
+    snippets = [lines[0]]
 
     # 对于每个调用点，提取 ±context_lines 的代码
-    snippets = [signature]
-
-    for call_line_idx in call_lines:
-        start = max(1, call_line_idx - context_lines)  # 跳过签名行
-        end = min(len(lines), call_line_idx + context_lines + 1)
+    for start_line, _, end_line, _ in call_sites:
+        # 转换为函数代码内的行索引；装饰器中的调用在代码之外，跳过
+        first = start_line - caller.lineno
+        last = min(end_line - caller.lineno, len(lines) - 1)
+        if first < 0 or first >= len(lines):
+            continue
+        start = max(1, first - context_lines)  # 跳过签名行
+        end = min(len(lines), last + context_lines + 1)
 
         # 添加上下文标记
-        snippets.append(f"\n    # ... (call at line {call_line_idx + 1})")
+        snippets.append(f"\n    # ... (call at line {first + 1})")
 
         # 添加代码行，调用行前面加上 ">>> " 标记
         for i in range(start, end):
-            if i == call_line_idx:
+            if first <= i <= last:
                 snippets.append(f">>> {lines[i]}")
             else:
                 snippets.append(lines[i])
@@ -234,10 +249,603 @@ def extract_caller_snippet(caller_code: str, target_func_name: str, context_line
     return '\n'.join(snippets)
 
 
-def main():
+def get_function_id(func) -> str:
+    """
+    生成函数唯一ID（用于进度记录）：文件路径 + 限定名。
+
+    不同类的同名方法按限定名区分；限定名也相同的函数（嵌套函数、
+    property 的 getter/setter）追加序号，如 ``a.py::wrapper#2``。
+    不包含行号，函数上方的改动不会改变其 ID。
+    """
+    function_id = f"{getattr(func, 'file_path', '')}::{func.qualname or func.name}"
+    occurrence = getattr(func, 'occurrence', 0)
+    if occurrence:
+        function_id += f"#{occurrence + 1}"
+    return function_id
+
+
+def get_report_function_id(report) -> str:
+    """报告所属函数的 ID；旧版本的报告没有记录，按文件路径 + 函数名推断。"""
+    return report.function_id or f"{report.file_path}::{report.function_name}"
+
+
+def build_caller_infos(func, context_builder):
+    """
+    构建报告中的 callers 信息：文件路径 + 函数名 + 调用点行号。
+
+    Args:
+        func: 目标函数
+        context_builder: 上下文构建器（提供调用者倒排索引）
+
+    Returns:
+        调用者信息字典列表
+    """
+    callers = []
+
+    # 从倒排索引中取出实际调用了目标函数的函数
+    for func_obj in context_builder.get_callers(func):
+        # 调用点所在的行（多行调用的每一行都高亮）
+        highlight_lines = sorted({
+            line
+            for start_line, _, end_line, _ in context_builder.get_call_sites(func_obj, func)
+            # 装饰器中的调用不在调用者代码范围内
+            if start_line >= func_obj.lineno
+            for line in range(start_line, end_line + 1)
+        })
+
+        callers.append({
+            'file_path': getattr(func_obj, 'file_path', ''),
+            'function_name': func_obj.name,
+            'start_line': func_obj.lineno,
+            'end_line': func_obj.end_lineno,
+            'start_col': func_obj.col_offset,
+            'end_col': func_obj.end_col_offset,
+            'code': func_obj.code,
+            'highlight_lines': highlight_lines
+        })
+
+    return callers
+
+
+def build_callee_names(func, context_builder):
+    """返回目标函数调用的、解析到项目内已定义函数的调用名列表。"""
+    return list(context_builder.resolve_callees(func))
+
+
+def build_inferred_caller_infos(context):
+    """
+    构建报告中的 inferred_callers 信息，并计算需要高亮的行。
+
+    Args:
+        context: ContextBuilder.build_context 返回的上下文
+
+    Returns:
+        推断调用者信息字典列表
+    """
+    inferred_callers = []
+    for inferred in context.get("inferred_callers", []):
+        # 找出需要高亮的行（包含类型注解的行）
+        highlight_lines = []
+        if 'arg_name' in inferred:
+            # 查找包含 Callable 类型注解的行
+            arg_name = inferred.get('arg_name', '')
+            lines = inferred.get("code", "").split('\n')
+            start_line = inferred.get('start_line', 1)
+            for i, line in enumerate(lines, start=start_line):
+                # 查找函数签名中包含该参数的行
+                if arg_name in line and 'Callable' in line:
+                    highlight_lines.append(i)
+                    break
+
+        inferred_callers.append({
+            'file_path': inferred.get('file_path', ''),
+            'function_name': inferred.get('function_name', ''),
+            'start_line': inferred.get('start_line', 1),
+            'end_line': inferred.get('end_line', 1),
+            'start_col': inferred.get('start_col', 0),
+            'end_col': inferred.get('end_col', 0),
+            'code': inferred.get('code', ''),
+            'highlight_lines': highlight_lines,
+            'hint': inferred.get('hint', '')
+        })
+
+    return inferred_callers
+
+
+def build_detection_job(func, context_builder):
+    """
+    构建单个函数的检测任务（上下文、报告用的调用者信息和 token 估算）。
+
+    Args:
+        func: 目标函数
+        context_builder: 上下文构建器
+
+    Returns:
+        DetectionJob
+
+    Raises:
+        RuntimeError: 构建上下文失败
+    """
+    try:
+        context = context_builder.build_context(func)
+        return DetectionJob(
+            function=func,
+            context=context,
+            file_path=getattr(func, 'file_path', ''),
+            callers=build_caller_infos(func, context_builder),
+            callees=build_callee_names(func, context_builder),
+            inferred_callers=build_inferred_caller_infos(context),
+            estimated_tokens=context_builder.count_context_tokens(context),
+            fingerprint=context_builder.fingerprint(func)
+        )
+    except Exception as e:
+        raise RuntimeError(
+            f"Error detecting bugs for function '{func.name}': {e}"
+        ) from e
+
+
+def next_bug_number(reports):
+    """返回下一个可用的 Bug 编号（增量扫描删除旧报告后编号可能不连续）。"""
+    numbers = [
+        int(r.bug_id.rsplit('_', 1)[-1])
+        for r in reports
+        if r.bug_id.rsplit('_', 1)[-1].isdigit()
+    ]
+    return max(numbers, default=0) + 1
+
+
+def invalidate_changed_functions(functions, context_builder, progress_manager,
+                                 completed_functions, reports, check_context=True):
+    """
+    将检测输入发生变化的已完成函数重新标记为待检测。
+
+    比较函数当前的指纹与上次检测时记录的指纹：函数自身代码变化，或
+    （check_context 为 True 时）调用者 / 推断调用者的代码变化，都会删除
+    该函数的完成标记和旧报告。没有记录指纹的函数视为未变化，并补记
+    当前指纹。本次扫描到的文件中不再存在的函数 ID（函数被删除或改名）
+    同样删除完成标记和旧报告。未变化的函数更新报告中的起始行号。
+
+    Args:
+        functions: 本次扫描到的函数
+        context_builder: 上下文构建器（计算指纹）
+        progress_manager: 进度管理器（保存指纹）
+        completed_functions: 已完成函数集合（原地更新）
+        reports: 报告列表（原地更新）
+        check_context: 是否比较调用者指纹（流式模式下调用者尚不完整，只比较函数自身）
+
+    Returns:
+        重新标记为待检测的函数数量
+    """
+    fingerprints = progress_manager.fingerprints
+    current = {get_function_id(func): func for func in functions}
+    files = {getattr(func, 'file_path', '') for func in functions}
+    changed = {
+        function_id for function_id in completed_functions
+        if function_id.partition("::")[0] in files and function_id not in current
+    }
+    for function_id, func in current.items():
+        if function_id not in completed_functions:
+            continue
+        fingerprint = context_builder.fingerprint(func)
+        previous = fingerprints.get(function_id)
+        if previous is None:
+            fingerprints[function_id] = fingerprint
+            continue
+        if previous.get('code') != fingerprint['code'] or (
+            check_context and previous.get('context') != fingerprint['context']
+        ):
+            changed.add(function_id)
+
+    # 函数未变化但可能整体移动了位置，更新报告中的起始行号
+    for report in reports:
+        func = current.get(get_report_function_id(report))
+        if func is not None:
+            report.function_start_line = func.lineno
+
+    if changed:
+        completed_functions.difference_update(changed)
+        for function_id in changed:
+            fingerprints.pop(function_id, None)
+        reports[:] = [r for r in reports if get_report_function_id(r) not in changed]
+    return len(changed)
+
+
+def select_changed_functions(functions, ranges, context_builder):
+    """
+    选出改动涉及的函数及其直接调用者和被调用者（--since）。
+
+    Args:
+        functions: 所有函数
+        ranges: 文件相对路径 -> 改动行范围（git_diff.changed_line_ranges）
+        context_builder: 上下文构建器（提供调用关系）
+
+    Returns:
+        (changed, selected): 改动涉及的函数数量，以及按原顺序排列的待检测函数列表
+    """
+    changed = [
+        func for func in functions
+        if overlaps(
+            ranges.get(os.path.normpath(getattr(func, 'file_path', '')), []),
+            func.lineno, func.end_lineno
+        )
+    ]
+
+    # 沿调用图扩展一跳：调用者可能受改动影响，被调用者可能被以新的方式调用
+    selected = {id(func) for func in changed}
+    for func in changed:
+        selected.update(id(caller) for caller in context_builder.get_callers(func))
+        selected.update(id(callee) for callee in context_builder.get_callees(func))
+
+    return len(changed), [func for func in functions if id(func) in selected]
+
+
+def parse_all_files(parser_ast, files, directory, config, parse_cache=None):
+    """
+    解析所有文件的 AST（可并行），函数的 file_path 记录为相对扫描目录的路径。
+
+    Args:
+        parser_ast: AST 解析器
+        files: 文件绝对路径列表
+        directory: 扫描目录
+        config: 配置对象
+        parse_cache: 可选的 ParseCache，未改动的文件直接从缓存加载
+
+    Returns:
+        所有函数列表（顺序与文件顺序一致）
+    """
+    logger.info("Parsing Python files...")
+    all_functions = []
+
+    # 获取扫描目录的绝对路径，用于计算相对路径
+    scan_dir = os.path.abspath(directory)
+
+    from tqdm import tqdm
+
+    parse_results = parser_ast.parse_files(
+        files, workers=config.scan_parse_workers, cache=parse_cache
+    )
+    for file_path, functions, error in tqdm(parse_results, total=len(files), desc="Parsing files"):
+        if error is not None:
+            logger.error(f"Failed to parse {file_path}: {error}")
+            continue
+        # 为每个函数记录相对于扫描目录的相对路径
+        for func in functions:
+            func.file_path = os.path.relpath(file_path, scan_dir)
+        all_functions.extend(functions)
+
+    if parse_cache is not None:
+        # 删除已不在扫描范围内的文件的缓存
+        parse_cache.retain(files)
+        logger.info(f"Parse cache: {parse_cache.summary()}")
+
+    return all_functions
+
+
+def duration_arg(value: str) -> float:
+    """argparse 类型：解析 --deadline 时长。"""
+    try:
+        return parse_duration(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def abort_scan(progress_manager, completed_functions, reports, output_path):
+    """保存当前进度和报告后以错误码退出。"""
+    progress_manager.save_progress(completed_functions, reports)
+    reporter = Reporter(reports)
+    reporter.to_json(output_path)
+
+    logger.info(
+        f"Progress saved to {progress_manager.progress_dir}. "
+        f"Run the command again to resume."
+    )
+    sys.exit(1)
+
+
+def build_batch_requests(detector, jobs, manifest):
+    """
+    为待检测函数生成批处理请求，并记录到 manifest。
+
+    Args:
+        detector: Bug 检测器（提供 prompt 和请求参数）
+        jobs: DetectionJob 可迭代对象
+        manifest: BatchManifest，记录 custom_id 对应的函数信息
+
+    Returns:
+        批处理请求记录列表
+    """
+    endpoint = detector.pool.endpoints[0]
+    requests = []
+    for job in jobs:
+        function_id = get_function_id(job.function)
+        custom_id = batch_custom_id(function_id)
+        prompt = detector._build_prompt(job.function, job.context)
+        requests.append(build_batch_request(custom_id, detector._request_kwargs(endpoint, prompt)))
+        manifest.add(custom_id, {
+            'function_id': function_id,
+            'function_name': job.function.name,
+            'file_path': job.file_path,
+            'function_start_line': job.function.lineno,
+            'callers': job.callers,
+            'callees': job.callees,
+            'inferred_callers': job.inferred_callers,
+            'fingerprint': job.fingerprint,
+            'prompt': prompt
+        })
+    return requests
+
+
+def ingest_batch_results(detector, manifest, results, progress_manager, completed_functions, reports):
+    """
+    将批处理结果解析为 bug 报告并更新进度。
+
+    失败或无法解析的条目不标记为完成，下次 submit-batch 或普通扫描会重新检测。
+
+    Args:
+        detector: Bug 检测器（解析响应）
+        manifest: 提交时记录的 BatchManifest
+        results: BatchResult 可迭代对象
+        progress_manager: 进度管理器
+        completed_functions: 已完成函数集合（原地更新）
+        reports: 报告列表（原地追加）
+
+    Returns:
+        (ingested, failed, usage): 成功导入数、失败数和累计 token 用量
+    """
+    ingested = 0
+    failed = 0
+    usage = detector._empty_usage()
+    bug_counter = next_bug_number(reports)
+
+    for result in results:
+        for key in usage:
+            usage[key] += result.usage.get(key, 0)
+
+        entry = manifest.get(result.custom_id)
+        if entry is None:
+            logger.warning(f"Unknown custom_id in batch results: {result.custom_id}")
+            failed += 1
+            continue
+        if entry['function_id'] in completed_functions:
+            continue
+        if result.error is not None:
+            logger.warning(f"Batch request failed for {entry['function_name']}: {result.error}")
+            failed += 1
+            continue
+
+        try:
+            parsed = detector._parse_response(result.content)
+        except ValueError as e:
+            logger.warning(f"Invalid batch response for {entry['function_name']}: {e}")
+            failed += 1
+            continue
+
+        bug_reports = detector._build_reports(
+            entry['function_name'], parsed, entry['file_path'], entry['function_start_line'],
+            entry['callers'], entry['callees'], entry['inferred_callers'], bug_counter
+        )
+        for bug_report in bug_reports:
+            bug_report.function_id = entry['function_id']
+            progress_manager.save_llm_interaction(
+                bug_id=bug_report.bug_id,
+                file_path=entry['file_path'],
+                function_name=entry['function_name'],
+                prompt=entry['prompt'],
+                raw_response=result.content
+            )
+        reports.extend(bug_reports)
+        bug_counter += len(bug_reports)
+        completed_functions.add(entry['function_id'])
+        if entry.get('fingerprint') is not None:
+            progress_manager.fingerprints[entry['function_id']] = entry['fingerprint']
+        ingested += 1
+
+    progress_manager.save_progress(completed_functions, reports)
+    return ingested, failed, usage
+
+
+def submit_batch(argv):
+    """pyscan submit-batch: 将所有待检测函数的 prompt 写入批处理请求文件。"""
+    parser = argparse.ArgumentParser(
+        prog='pyscan submit-batch',
+        description='Write every pending prompt to a JSONL batch request file'
+    )
+    parser.add_argument('directory', type=str, help='Directory to scan for Python files')
+    parser.add_argument(
+        '-c', '--config', type=str, default='config.yaml',
+        help='Path to configuration file (default: config.yaml)'
+    )
+    parser.add_argument(
+        '-o', '--output', type=str, default='batch_requests.jsonl',
+        help='Batch request file (default: batch_requests.jsonl)'
+    )
+    args = parser.parse_args(argv)
+
+    config = Config.from_file(args.config)
+    if config.detector_use_tiktoken:
+        warm_up_tokenizer()
+    scanner = Scanner(exclude_patterns=config.scan_exclude_patterns)
+    files = scanner.scan(args.directory)
+    all_functions = parse_all_files(
+        ASTParser(), files, args.directory, config,
+        parse_cache=open_parse_cache(config, args.directory)
+    )
+
+    context_builder = ContextBuilder(
+        all_functions,
+        config=config,
+        max_tokens=config.detector_context_token_limit,
+        use_tiktoken=config.detector_use_tiktoken,
+        enable_advanced_analysis=config.detector_enable_advanced_analysis
+    )
+    progress_manager = ProgressManager(Path(args.directory) / ".pyscan")
+    completed_functions, reports = progress_manager.load_progress()
+    if invalidate_changed_functions(
+        all_functions, context_builder, progress_manager, completed_functions, reports
+    ):
+        progress_manager.save_progress(completed_functions, reports)
+    manifest = BatchManifest(progress_manager.batch_manifest_file).load()
+
+    jobs = (
+        build_detection_job(func, context_builder)
+        for func in all_functions
+        if get_function_id(func) not in completed_functions
+    )
+    requests = build_batch_requests(BugDetector(config), jobs, manifest)
+    write_jsonl(Path(args.output), requests)
+    manifest.save()
+
+    logger.info(f"Wrote {len(requests)} batch requests to {args.output}")
+
+
+def ingest_batch(argv):
+    """pyscan ingest-batch: 读取批处理结果文件，更新进度和报告。"""
+    parser = argparse.ArgumentParser(
+        prog='pyscan ingest-batch',
+        description='Read a JSONL batch result file and update scan progress'
+    )
+    parser.add_argument('directory', type=str, help='Directory that was submitted')
+    parser.add_argument('results', type=str, help='Batch result file (JSONL)')
+    parser.add_argument(
+        '-c', '--config', type=str, default='config.yaml',
+        help='Path to configuration file (default: config.yaml)'
+    )
+    parser.add_argument(
+        '-o', '--output', type=str, default='report.json',
+        help='Output JSON file path (default: report.json)'
+    )
+    args = parser.parse_args(argv)
+
+    config = Config.from_file(args.config)
+    progress_manager = ProgressManager(Path(args.directory) / ".pyscan")
+    manifest = BatchManifest(progress_manager.batch_manifest_file).load()
+    if not manifest.entries:
+        raise ConfigError(
+            f"No batch manifest in {progress_manager.progress_dir}; run submit-batch first"
+        )
+    completed_functions, reports = progress_manager.load_progress()
+
+    ingested, failed, usage = ingest_batch_results(
+        BugDetector(config), manifest, read_batch_results(Path(args.results)),
+        progress_manager, completed_functions, reports
+    )
+    Reporter(reports).to_json(args.output)
+
+    logger.info(f"Ingested {ingested} batch results ({failed} failed)")
+    logger.info(f"Total bugs found: {len(reports)}")
+    budget = ScanBudget.from_args(config)
+    budget.record(usage)
+    logger.info(f"LLM usage: {budget.summary()}")
+    logger.info(f"Report generated: {args.output}")
+
+
+def reset_progress_dir(progress_dir: Path):
+    """删除进度目录中除缓存以外的所有内容（--force）。"""
+    import shutil
+    cache_names = (ResultCache.FILENAME, ParseCache.FILENAME)
+    for path in progress_dir.iterdir():
+        # 保留缓存数据库及 SQLite 的日志文件
+        if any(path.name == name or path.name.startswith(name + "-") for name in cache_names):
+            continue
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+
+def open_result_cache(config: Config, progress_dir: Path):
+    """按配置打开 LLM 结果缓存，未启用时返回 None。"""
+    if not config.cache_enabled:
+        return None
+    return ResultCache(
+        progress_dir / ResultCache.FILENAME,
+        max_bytes=config.cache_max_size_mb * 1024 * 1024
+    )
+
+
+def open_parse_cache(config: Config, directory: str):
+    """按配置打开解析缓存（.pyscan/parse_cache.sqlite3），未启用时返回 None。"""
+    # 扫描目录不存在时由 Scanner 报错，这里不创建目录
+    if not config.cache_parse_enabled or not Path(directory).is_dir():
+        return None
+    return ParseCache(Path(directory) / ".pyscan" / ParseCache.FILENAME)
+
+
+def cache_command(argv):
+    """pyscan cache: 查看或清理 LLM 结果缓存。"""
+    parser = argparse.ArgumentParser(
+        prog='pyscan cache',
+        description='Inspect or prune the LLM result cache of a scanned directory'
+    )
+    parser.add_argument('action', choices=['stats', 'prune'], help='Cache action')
+    parser.add_argument('directory', type=str, help='Scanned directory (containing .pyscan)')
+    parser.add_argument(
+        '-c', '--config', type=str, default=None,
+        help='Configuration file providing cache.max_size_mb for prune'
+    )
+    parser.add_argument(
+        '--max-size-mb', type=float, default=None,
+        help='Prune least recently used entries down to this size (0 clears the cache)'
+    )
+    args = parser.parse_args(argv)
+
+    cache_file = Path(args.directory) / ".pyscan" / ResultCache.FILENAME
+    if not cache_file.exists():
+        raise FileNotFoundError(str(cache_file))
+
+    if args.max_size_mb is not None:
+        if args.max_size_mb < 0:
+            raise ValueError("--max-size-mb must be non-negative")
+        max_size_mb = args.max_size_mb
+    elif args.config is not None:
+        max_size_mb = Config.from_file(args.config).cache_max_size_mb
+    else:
+        max_size_mb = Config.DEFAULT_CACHE_MAX_SIZE_MB
+
+    cache = ResultCache(cache_file)
+    try:
+        if args.action == 'prune':
+            evicted = cache.prune(int(max_size_mb * 1024 * 1024))
+            logger.info(f"Evicted {evicted} cache entries")
+        stats = cache.stats()
+    finally:
+        cache.close()
+
+    logger.info(f"Cache file: {cache_file}")
+    logger.info(f"Entries: {stats['entries']}")
+    logger.info(f"Size: {stats['bytes'] / (1024 * 1024):.2f} MB")
+
+
+SUBCOMMANDS = {
+    'submit-batch': submit_batch,
+    'ingest-batch': ingest_batch,
+    'cache': cache_command,
+}
+
+
+def main(argv=None):
     """Main entry point for pyscan CLI."""
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] in SUBCOMMANDS:
+        try:
+            SUBCOMMANDS[argv[0]](argv[1:])
+        except ConfigError as e:
+            logger.error(f"Configuration error: {e}")
+            sys.exit(1)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
+        except FileNotFoundError as e:
+            logger.error(f"File not found: {e}")
+            sys.exit(1)
+        return
+
     parser = argparse.ArgumentParser(
-        description='PyScan - Python code bug detection tool using LLM'
+        description='PyScan - Python code bug detection tool using LLM',
+        epilog='Offline batch mode: pyscan submit-batch DIR / pyscan ingest-batch DIR RESULTS; '
+               'result cache: pyscan cache stats|prune DIR'
     )
 
     parser.add_argument(
@@ -272,59 +880,126 @@ def main():
         help='Force scan from scratch (delete existing .pyscan directory and restart)'
     )
 
-    args = parser.parse_args()
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Stream files through scan → parse → context → detect so LLM requests '
+             'start immediately (callers are limited to files parsed so far)'
+    )
+
+    parser.add_argument(
+        '--since',
+        type=str,
+        default=None,
+        metavar='REV',
+        help='Only detect functions changed since this git revision, plus their '
+             'direct callers and callees'
+    )
+
+    parser.add_argument(
+        '--max-prompt-tokens',
+        type=int,
+        default=None,
+        help='Stop starting new LLM requests once this many prompt tokens would be used'
+    )
+
+    parser.add_argument(
+        '--max-cost',
+        type=float,
+        default=None,
+        help='Stop starting new LLM requests once this cost would be exceeded '
+             '(requires llm.pricing in the config)'
+    )
+
+    parser.add_argument(
+        '--deadline',
+        type=duration_arg,
+        default=None,
+        help='Stop starting new LLM requests after this wall-clock time, e.g. 90s, 30m, 2h'
+    )
+
+    args = parser.parse_args(argv)
+
+    if args.since and args.stream:
+        parser.error("--since cannot be combined with --stream")
 
     if args.verbose:
         logging.getLogger().setLevel(logging.DEBUG)
 
+    detector = None
     try:
         # 1. 加载配置
         logger.info(f"Loading configuration from {args.config}")
         config = Config.from_file(args.config)
+        if config.detector_use_tiktoken:
+            # 编码器在扫描和解析文件的同时加载
+            warm_up_tokenizer()
+
+        if args.max_cost is not None and not (
+            config.llm_prompt_price_per_1k or config.llm_completion_price_per_1k
+        ):
+            raise ConfigError("--max-cost requires llm.pricing.prompt_per_1k / completion_per_1k")
+
+        # 计时从启动开始，--deadline 包含扫描和解析时间
+        budget = ScanBudget.from_args(
+            config,
+            max_prompt_tokens=args.max_prompt_tokens,
+            max_cost=args.max_cost,
+            deadline_seconds=args.deadline
+        )
 
-        # 2. 扫描代码文件
-        logger.info(f"Scanning directory: {args.directory}")
         scanner = Scanner(exclude_patterns=config.scan_exclude_patterns)
-        files = scanner.scan(args.directory)
+        parser_ast = ASTParser()
+        context_builder = ContextBuilder(
+            [],
+            config=config,
+            max_tokens=config.detector_context_token_limit,
+            use_tiktoken=config.detector_use_tiktoken,
+            enable_advanced_analysis=config.detector_enable_advanced_analysis
+        )
 
-        if not files:
-            logger.warning("No Python files found!")
-            return
+        # 未改动的文件直接加载上次的解析结果
+        parse_cache = open_parse_cache(config, args.directory)
 
-        logger.info(f"Found {len(files)} Python files")
+        if args.stream:
+            # 2-3. 流式扫描和解析：边扫描边解析，解析结果逐文件交给检测阶段
+            logger.info(f"Streaming scan of directory: {args.directory}")
+            pipeline = StreamingPipeline(
+                scanner, parser_ast, args.directory,
+                parse_workers=config.scan_parse_workers,
+                parse_cache=parse_cache
+            )
+            function_batches = pipeline.iter_batches()
+        else:
+            # 2. 扫描代码文件
+            logger.info(f"Scanning directory: {args.directory}")
+            files = scanner.scan(args.directory)
 
-        # 3. 解析所有文件的 AST
-        logger.info("Parsing Python files...")
-        parser_ast = ASTParser()
-        all_functions = []
+            if not files:
+                logger.warning("No Python files found!")
+                return
 
-        # 获取扫描目录的绝对路径，用于计算相对路径
-        scan_dir = os.path.abspath(args.directory)
+            logger.info(f"Found {len(files)} Python files")
 
-        for file_path in tqdm(files, desc="Parsing files"):
-            try:
-                functions = parser_ast.parse_file(file_path)
-                # 为每个函数记录相对于扫描目录的相对路径
-                for func in functions:
-                    func.file_path = os.path.relpath(file_path, scan_dir)
-                all_functions.extend(functions)
-            except Exception as e:
-                logger.error(f"Failed to parse {file_path}: {e}")
+            # 3. 解析所有文件的 AST
+            all_functions = parse_all_files(
+                parser_ast, files, args.directory, config, parse_cache=parse_cache
+            )
 
-        if not all_functions:
-            logger.warning("No functions found!")
-            return
+            if not all_functions:
+                logger.warning("No functions found!")
+                return
 
-        logger.info(f"Found {len(all_functions)} functions")
+            logger.info(f"Found {len(all_functions)} functions")
+            function_batches = [all_functions]
 
         # 4. 初始化进度管理器
         progress_dir = Path(args.directory) / ".pyscan"
 
-        # 如果使用 --force 参数，删除现有的 .pyscan 目录
+        # 如果使用 --force 参数，清空现有的 .pyscan 目录（保留 LLM 结果缓存）
         if args.force and progress_dir.exists():
-            logger.info(f"Force mode enabled, removing existing progress directory: {progress_dir}")
-            import shutil
-            shutil.rmtree(progress_dir)
+            logger.info(f"Force mode enabled, removing existing progress in: {progress_dir}")
+            reset_progress_dir(progress_dir)
 
         progress_manager = ProgressManager(progress_dir)
 
@@ -340,173 +1015,183 @@ def main():
 
         # 4. 构建上下文并检测 bug
         logger.info("Building context and detecting bugs...")
-        context_builder = ContextBuilder(
-            all_functions,
-            config=config,
-            max_tokens=config.detector_context_token_limit,
-            use_tiktoken=config.detector_use_tiktoken,
-            enable_advanced_analysis=config.detector_enable_advanced_analysis
-        )
-        detector = BugDetector(config)
-
-        # 生成函数唯一ID
-        def get_function_id(func):
-            return f"{getattr(func, 'file_path', '')}::{func.name}"
-
-        # 过滤出需要检测的函数
-        functions_to_detect = [
-            f for f in all_functions
-            if get_function_id(f) not in completed_functions
-        ]
-
-        if len(functions_to_detect) < len(all_functions):
-            logger.info(
-                f"Resuming from previous run: {len(completed_functions)} "
-                f"functions already completed, {len(functions_to_detect)} remaining"
+        detector = BugDetector(config, cache=open_result_cache(config, progress_dir))
+        try:
+            scheduler = Scheduler(load_score_function(config.detector_scheduler))
+        except ValueError as e:
+            raise ConfigError(str(e))
+
+        if not args.stream:
+            context_builder.add_functions(all_functions)
+            # 增量扫描：函数或其调用者的代码变化后重新检测
+            changed = invalidate_changed_functions(
+                all_functions, context_builder, progress_manager, completed_functions, reports
             )
+            if changed:
+                logger.info(f"{changed} completed functions changed since the last scan, rescanning them")
+
+            if args.since:
+                # 只检测 git 改动涉及的函数及其一跳范围内的调用者和被调用者
+                changed_count, since_functions = select_changed_functions(
+                    all_functions,
+                    changed_line_ranges(args.directory, args.since),
+                    context_builder
+                )
+                logger.info(
+                    f"{changed_count} functions changed since {args.since}, "
+                    f"{len(since_functions)} including direct callers and callees"
+                )
+                function_batches = [since_functions]
+
+        # DetectionEngine 在工作线程中拉取任务生成器（流式模式下其中会更新进度），
+        # commit_result 在事件循环线程中更新并保存进度，两者通过该锁互斥
+        progress_lock = threading.Lock()
+
+        def iter_functions_to_detect():
+            """按调度顺序产出需要检测的函数，流式模式下同时增量更新上下文索引。"""
+            skipped = 0
+            for batch in function_batches:
+                if args.stream:
+                    context_builder.add_functions(batch)
+                with progress_lock:
+                    if args.stream:
+                        # 流式模式下调用者尚不完整，只比较函数自身的代码
+                        invalidate_changed_functions(
+                            batch, context_builder, progress_manager,
+                            completed_functions, reports, check_context=False
+                        )
+                    pending = [
+                        func for func in batch
+                        if get_function_id(func) not in completed_functions
+                    ]
+                skipped += len(batch) - len(pending)
+                # 按风险排序，最有价值的函数优先检测（流式模式下在每个文件内排序）
+                for func in scheduler.rank(pending, context_builder):
+                    yield func
+            if skipped and args.stream:
+                logger.info(
+                    f"Resumed from previous run: skipped {skipped} functions already completed"
+                )
 
-        # Bug ID 计数器 (从已有的 reports 开始计数)
-        bug_counter = len(reports) + 1
-
-        for func in tqdm(functions_to_detect, desc="Detecting bugs"):
-            func_id = get_function_id(func)
+        def prepare_jobs():
+            for func in iter_functions_to_detect():
+                yield build_detection_job(func, context_builder)
 
-            try:
-                context = context_builder.build_context(func)
-
-                # 提取 callers 信息：文件路径 + 函数名 + 调用点周围代码
-                callers = []
-                callees = []
-
-                # 从context中提取实际的函数调用关系
-                for func_obj in all_functions:
-                    if func.name in func_obj.calls:
-                        # 找出调用目标函数的行号
-                        highlight_lines = []
-                        lines = func_obj.code.split('\n')
-
-                        for i, line in enumerate(lines):
-                            if f"{func.name}(" in line:
-                                absolute_line = func_obj.lineno + i
-                                highlight_lines.append(absolute_line)
-
-                        callers.append({
-                            'file_path': getattr(func_obj, 'file_path', ''),
-                            'function_name': func_obj.name,
-                            'start_line': func_obj.lineno,
-                            'end_line': func_obj.end_lineno,
-                            'start_col': func_obj.col_offset,
-                            'end_col': func_obj.end_col_offset,
-                            'code': func_obj.code,
-                            'highlight_lines': highlight_lines
-                        })
-
-                for call_name in func.calls:
-                    if call_name in [f.name for f in all_functions]:
-                        callees.append(call_name)
-
-                # 提取 inferred_callers 并处理代码片段
-                inferred_callers = []
-                for inferred in context.get("inferred_callers", []):
-                    # 找出需要高亮的行（包含类型注解的行）
-                    highlight_lines = []
-                    if 'arg_name' in inferred:
-                        # 查找包含 Callable 类型注解的行
-                        arg_name = inferred.get('arg_name', '')
-                        lines = inferred.get("code", "").split('\n')
-                        start_line = inferred.get('start_line', 1)
-                        for i, line in enumerate(lines, start=start_line):
-                            # 查找函数签名中包含该参数的行
-                            if arg_name in line and 'Callable' in line:
-                                highlight_lines.append(i)
-                                break
-
-                    inferred_callers.append({
-                        'file_path': inferred.get('file_path', ''),
-                        'function_name': inferred.get('function_name', ''),
-                        'start_line': inferred.get('start_line', 1),
-                        'end_line': inferred.get('end_line', 1),
-                        'start_col': inferred.get('start_col', 0),
-                        'end_col': inferred.get('end_col', 0),
-                        'code': inferred.get('code', ''),
-                        'highlight_lines': highlight_lines,
-                        'hint': inferred.get('hint', '')
-                    })
-
-                result = detector.detect(
-                    func,
-                    context,
-                    file_path=getattr(func, 'file_path', ''),
-                    function_start_line=func.lineno,
-                    callers=callers,
-                    callees=callees,
-                    inferred_callers=inferred_callers,
-                    bug_id_start=bug_counter
+        if args.stream:
+            total = None
+        else:
+            total = sum(
+                1 for f in function_batches[0] if get_function_id(f) not in completed_functions
+            )
+            if total < len(function_batches[0]):
+                logger.info(
+                    f"Resuming from previous run: {len(completed_functions)} "
+                    f"functions already completed, {total} remaining"
                 )
 
-                if result is None:
-                    # 检测失败,立即退出
-                    error_msg = (
-                        f"Bug detection failed for function '{func.name}' "
-                        f"in {getattr(func, 'file_path', 'unknown')}. "
-                        f"Aborting scan."
+        # Bug ID 计数器 (从已有的 reports 开始计数)
+        bug_counter = next_bug_number(reports)
+        failed_function = None
+        from tqdm import tqdm
+        progress_bar = tqdm(total=total, desc="Detecting bugs")
+
+        def commit_result(job, result):
+            """按任务顺序提交检测结果，返回 False 表示终止扫描。"""
+            nonlocal bug_counter, failed_function
+            func = job.function
+
+            if result is None:
+                failed_function = func
+                return False
+
+            # 检测成功，提取结果（现在是 bug 列表）
+            bug_reports = result["reports"]
+            prompt = result["prompt"]
+            raw_response = result["raw_response"]
+
+            with progress_lock:
+                # 如果有 bug，保存 LLM 交互并添加到 reports
+                for bug_report in bug_reports:
+                    # 并发检测时按提交顺序分配 Bug ID
+                    bug_report.bug_id = f"BUG_{bug_counter:04d}"
+                    bug_report.function_id = get_function_id(func)
+                    progress_manager.save_llm_interaction(
+                        bug_id=bug_report.bug_id,
+                        file_path=job.file_path,
+                        function_name=func.name,
+                        prompt=prompt,
+                        raw_response=raw_response
                     )
-                    logger.error(error_msg)
+                    reports.append(bug_report)
+                    bug_counter += 1
 
-                    # 保存当前进度和报告
-                    progress_manager.save_progress(completed_functions, reports)
-                    reporter = Reporter(reports)
-                    reporter.to_json(args.output)
+                completed_functions.add(get_function_id(func))
+                progress_manager.fingerprints[get_function_id(func)] = job.fingerprint
 
-                    logger.info(
-                        f"Progress saved to {progress_manager.progress_dir}. "
-                        f"Run the command again to resume."
-                    )
-                    sys.exit(1)
+                # 每完成一个函数就保存进度和更新报告
+                progress_manager.save_progress(completed_functions, reports)
+                Reporter(reports).to_json(args.output)
+            progress_bar.update(1)
+            return True
 
-                # 检测成功，提取结果（现在是 bug 列表）
-                bug_reports = result["reports"]
-                prompt = result["prompt"]
-                raw_response = result["raw_response"]
+        if config.detector_concurrency > 1:
+            logger.info(f"Detecting with concurrency {config.detector_concurrency}")
 
-                # 如果有 bug，保存 LLM 交互并添加到 reports
-                if bug_reports:
-                    # 为每个 bug 保存 LLM 交互
-                    for bug_report in bug_reports:
-                        progress_manager.save_llm_interaction(
-                            bug_id=bug_report.bug_id,
-                            file_path=getattr(func, 'file_path', ''),
-                            function_name=func.name,
-                            prompt=prompt,
-                            raw_response=raw_response
-                        )
-                        reports.append(bug_report)
-                        bug_counter += 1
+        batch_policy = BatchPolicy.from_config(config)
+        if batch_policy is not None:
+            logger.info(
+                f"Batching functions of up to {batch_policy.max_lines} lines, "
+                f"{batch_policy.max_functions} per request"
+            )
 
-                completed_functions.add(func_id)
+        engine = DetectionEngine(
+            detector,
+            concurrency=config.detector_concurrency,
+            budget=budget,
+            batch_policy=batch_policy
+        )
+        jobs = prepare_jobs()
 
-                # 每完成一个函数就保存进度和更新报告
-                progress_manager.save_progress(completed_functions, reports)
-                reporter = Reporter(reports)
-                reporter.to_json(args.output)
+        async def run_engine():
+            try:
+                await engine.run(jobs, commit_result)
+            finally:
+                # 异步连接池绑定事件循环，在事件循环结束前关闭
+                await detector.aclose()
 
-            except Exception as e:
-                # 发生异常,立即退出
-                error_msg = (
-                    f"Error detecting bugs for function '{func.name}': {e}"
-                )
-                logger.error(error_msg, exc_info=True)
+        try:
+            asyncio.run(run_engine())
+        except Exception as e:
+            # 发生异常,立即退出
+            logger.error(str(e), exc_info=True)
+            abort_scan(progress_manager, completed_functions, reports, args.output)
+        finally:
+            jobs.close()
+            progress_bar.close()
+
+        if failed_function is not None:
+            # 检测失败,立即退出
+            logger.error(
+                f"Bug detection failed for function '{failed_function.name}' "
+                f"in {getattr(failed_function, 'file_path', 'unknown')}. "
+                f"Aborting scan."
+            )
+            abort_scan(progress_manager, completed_functions, reports, args.output)
 
-                # 保存当前进度和报告
-                progress_manager.save_progress(completed_functions, reports)
-                reporter = Reporter(reports)
-                reporter.to_json(args.output)
+        if args.stream:
+            logger.info(
+                f"Streamed {pipeline.files_scanned} Python files, "
+                f"{len(context_builder.functions)} functions"
+            )
 
-                logger.info(
-                    f"Progress saved to {progress_manager.progress_dir}. "
-                    f"Run the command again to resume."
-                )
-                sys.exit(1)
+        # 保存进度（包括更新过起始行号的旧报告）；预算用尽时下次运行从这里继续
+        progress_manager.save_progress(completed_functions, reports)
+        if engine.stop_reason is not None:
+            logger.warning(
+                f"Budget exhausted ({engine.stop_reason}), stopped handing out new work. "
+                f"Progress saved to {progress_manager.progress_dir}; "
+                f"run the command again to continue."
+            )
 
         # 5. 生成报告
         logger.info("Generating report...")
@@ -521,10 +1206,19 @@ def main():
         medium_severity = sum(1 for r in reports if r.severity == "medium")
         low_severity = sum(1 for r in reports if r.severity == "low")
 
-        logger.info(f"\nScan completed!")
+        if engine.stop_reason is not None:
+            logger.info(f"\nScan stopped early ({engine.stop_reason})")
+        else:
+            logger.info(f"\nScan completed!")
         logger.info(f"Total bugs found: {total_bugs}")
         logger.info(f"Affected functions: {affected_functions}")
         logger.info(f"Severity breakdown - High: {high_severity}, Medium: {medium_severity}, Low: {low_severity}")
+        logger.info(f"LLM usage: {budget.summary()}")
+        logger.info(f"HTTP connections: {detector.connection_summary()}")
+        if config.detector_hedge_enabled:
+            logger.info(f"Hedging: {detector.latency.summary()}")
+        if detector.cache is not None:
+            logger.info(f"Result cache: {detector.cache.summary()}")
 
     except ConfigError as e:
         logger.error(f"Configuration error: {e}")
@@ -532,12 +1226,18 @@ def main():
     except FileNotFoundError as e:
         logger.error(f"File not found: {e}")
         sys.exit(1)
+    except GitDiffError as e:
+        logger.error(f"Git error: {e}")
+        sys.exit(1)
     except KeyboardInterrupt:
         logger.info("\nScan interrupted by user")
         sys.exit(130)
     except Exception as e:
         logger.error(f"Unexpected error: {e}", exc_info=True)
         sys.exit(1)
+    finally:
+        if detector is not None:
+            detector.close()
 
 
 if __name__ == '__main__':
@@ -16,11 +16,36 @@ class Config:
     # 默认值
     DEFAULT_MAX_TOKENS = 8000
     DEFAULT_TEMPERATURE = 0.2
+    DEFAULT_STREAM = False
     DEFAULT_MAX_RETRIES = 3
+    DEFAULT_RETRY_BASE_DELAY = 1.0
+    DEFAULT_RETRY_MAX_DELAY = 60.0
+    # 限流错误通常需要更多次等待；未列出的错误类别使用 max_retries
+    DEFAULT_RETRY_BUDGETS = {"rate_limit": 8}
+    RETRY_ERROR_CLASSES = ["rate_limit", "server_error", "timeout", "parse_error", "other"]
+    DEFAULT_TIMEOUT = {"base": 60.0, "per_1k_tokens": 10.0, "max": 600.0}
+    DEFAULT_HEDGE = {"enabled": False, "quantile": 0.95, "min_delay": 2.0, "min_samples": 20}
     DEFAULT_CONCURRENCY = 1
+    DEFAULT_ENDPOINT_WEIGHT = 1.0
+    DEFAULT_HTTP = {
+        "max_connections": 100,
+        "max_keepalive_connections": 20,
+        "keepalive_expiry": 30.0,
+        "http2": False,
+        "connect_timeout": 5.0,
+        "read_timeout": 600.0,
+    }
     DEFAULT_CONTEXT_TOKEN_LIMIT = 6000
     DEFAULT_USE_TIKTOKEN = False
     DEFAULT_ENABLE_ADVANCED_ANALYSIS = True
+    DEFAULT_SCHEDULER = "risk"
+    DEFAULT_BATCH_ENABLED = False
+    DEFAULT_BATCH_MAX_FUNCTIONS = 8
+    DEFAULT_BATCH_MAX_LINES = 15
+    DEFAULT_BATCH_TOKEN_BUDGET = 3000
+    DEFAULT_CACHE_ENABLED = True
+    DEFAULT_CACHE_MAX_SIZE_MB = 500
+    DEFAULT_CACHE_PARSE_ENABLED = True
     DEFAULT_PUBLIC_API_DECORATORS = ["route", "get", "post", "put", "delete", "patch", "api_view", "endpoint"]
     DEFAULT_PUBLIC_API_FILE_PATTERNS = ["*/api/*", "*/endpoints/*", "*/handlers/*", "*/controllers/*", "*/views/*"]
     DEFAULT_PUBLIC_API_NAME_PREFIXES = ["api_", "handle_", "endpoint_"]
@@ -57,35 +82,104 @@ class Config:
 
         llm_config = config_dict["llm"]
         required_llm_fields = ["base_url", "api_key", "model"]
+        endpoints = llm_config.get("endpoints")
+        if endpoints:
+            # 配置了多个端点时，base_url/api_key 在每个端点中给出；
+            # 每个端点都设置了 model 时顶层 model 也可省略
+            required_llm_fields = []
+            if not all(isinstance(endpoint, dict) and "model" in endpoint for endpoint in endpoints):
+                required_llm_fields = ["model"]
 
         for field in required_llm_fields:
             if field not in llm_config:
                 raise ConfigError(f"Missing required field: llm.{field}")
 
+        for i, endpoint in enumerate(llm_config.get("endpoints") or []):
+            if not isinstance(endpoint, dict):
+                raise ConfigError(f"llm.endpoints[{i}] must be a mapping")
+            for field in ["base_url", "api_key"]:
+                if field not in endpoint:
+                    raise ConfigError(f"Missing required field: llm.endpoints[{i}].{field}")
+
     def _load_config(self, config_dict: Dict[str, Any]) -> None:
         """Load configuration from dictionary."""
         llm_config = config_dict["llm"]
         scan_config = config_dict.get("scan", {})
         detector_config = config_dict.get("detector", {})
+        cache_config = config_dict.get("cache", {})
 
         # LLM 配置
-        self.llm_base_url = llm_config["base_url"]
-        self.llm_api_key = llm_config["api_key"]
-        self.llm_model = llm_config["model"]
+        self.llm_endpoints = self._load_endpoints(llm_config)
+        # 未设置顶层 model 时（每个端点都设置了 model）取第一个端点的模型
+        self.llm_model = llm_config.get("model", self.llm_endpoints[0]["model"])
+        # 第一个端点作为默认端点
+        self.llm_base_url = self.llm_endpoints[0]["base_url"]
+        self.llm_api_key = self.llm_endpoints[0]["api_key"]
         self.llm_max_tokens = llm_config.get("max_tokens", self.DEFAULT_MAX_TOKENS)
         self.llm_temperature = llm_config.get("temperature", self.DEFAULT_TEMPERATURE)
+        # 流式响应：JSON 对象完整后立即关闭连接
+        self.llm_stream = llm_config.get("stream", self.DEFAULT_STREAM)
+        # 每个函数的输出 token 上限（None 表示只受 max_tokens 限制）
+        self.llm_output_tokens_per_function = llm_config.get("output_tokens_per_function")
+        # 速率限制（None 表示不限制）
+        self.llm_rpm = llm_config.get("rpm")
+        self.llm_tpm = llm_config.get("tpm")
+        # 共享 HTTP 连接池
+        self.llm_http = dict(self.DEFAULT_HTTP)
+        self.llm_http.update(llm_config.get("http") or {})
+        # 价格（每 1K token），用于 --max-cost 和成本统计
+        pricing_config = llm_config.get("pricing", {})
+        self.llm_prompt_price_per_1k = pricing_config.get("prompt_per_1k")
+        self.llm_completion_price_per_1k = pricing_config.get("completion_per_1k")
+        # 命中前缀缓存的 prompt token 价格（None 表示与 prompt_per_1k 相同）
+        self.llm_cached_prompt_price_per_1k = pricing_config.get("cached_prompt_per_1k")
 
         # 扫描配置
         self.scan_exclude_patterns = scan_config.get(
             "exclude_patterns", self.DEFAULT_EXCLUDE_PATTERNS
         )
+        self.scan_parse_workers = scan_config.get(
+            "parse_workers", os.cpu_count() or 1
+        )
 
         # 检测器配置
         self.detector_max_retries = detector_config.get(
             "max_retries", self.DEFAULT_MAX_RETRIES
         )
+        retry_config = detector_config.get("retry", {})
+        self.detector_retry_base_delay = retry_config.get(
+            "base_delay", self.DEFAULT_RETRY_BASE_DELAY
+        )
+        self.detector_retry_max_delay = retry_config.get(
+            "max_delay", self.DEFAULT_RETRY_MAX_DELAY
+        )
+        self.detector_retry_budgets = dict(self.DEFAULT_RETRY_BUDGETS)
+        self.detector_retry_budgets.update(retry_config.get("budgets", {}))
+
+        # 单次请求超时：base + per_1k_tokens * prompt token 数 / 1000，不超过 max
+        timeout_config = dict(self.DEFAULT_TIMEOUT)
+        timeout_config.update(detector_config.get("timeout") or {})
+        self.detector_timeout_base = timeout_config["base"]
+        self.detector_timeout_per_1k_tokens = timeout_config["per_1k_tokens"]
+        self.detector_timeout_max = timeout_config["max"]
+
+        # 对冲请求：请求耗时超过近期延迟的分位数后，向其他端点发送重复请求
+        hedge_config = dict(self.DEFAULT_HEDGE)
+        hedge_config.update(detector_config.get("hedge") or {})
+        self.detector_hedge_enabled = hedge_config["enabled"]
+        self.detector_hedge_quantile = hedge_config["quantile"]
+        self.detector_hedge_min_delay = hedge_config["min_delay"]
+        self.detector_hedge_min_samples = hedge_config["min_samples"]
+
+        # 所有端点都设置了并发上限时，默认并发为各端点上限之和
+        endpoint_limits = [ep["concurrency"] for ep in self.llm_endpoints]
+        default_concurrency = (
+            sum(endpoint_limits)
+            if "endpoints" in llm_config and all(endpoint_limits)
+            else self.DEFAULT_CONCURRENCY
+        )
         self.detector_concurrency = detector_config.get(
-            "concurrency", self.DEFAULT_CONCURRENCY
+            "concurrency", default_concurrency
         )
         self.detector_context_token_limit = detector_config.get(
             "context_token_limit", self.DEFAULT_CONTEXT_TOKEN_LIMIT
@@ -96,6 +190,24 @@ class Config:
         self.detector_enable_advanced_analysis = detector_config.get(
             "enable_advanced_analysis", self.DEFAULT_ENABLE_ADVANCED_ANALYSIS
         )
+        self.detector_scheduler = detector_config.get(
+            "scheduler", self.DEFAULT_SCHEDULER
+        )
+
+        # 小函数批量检测配置
+        batch_config = detector_config.get("batch", {})
+        self.detector_batch_enabled = batch_config.get(
+            "enabled", self.DEFAULT_BATCH_ENABLED
+        )
+        self.detector_batch_max_functions = batch_config.get(
+            "max_functions", self.DEFAULT_BATCH_MAX_FUNCTIONS
+        )
+        self.detector_batch_max_lines = batch_config.get(
+            "max_lines", self.DEFAULT_BATCH_MAX_LINES
+        )
+        self.detector_batch_token_budget = batch_config.get(
+            "token_budget", self.DEFAULT_BATCH_TOKEN_BUDGET
+        )
 
         # 公共 API 识别配置
         public_api_config = detector_config.get("public_api_indicators", {})
@@ -118,6 +230,42 @@ class Config:
             "max_inferred", self.DEFAULT_MAX_INFERRED
         )
 
+        # LLM 结果缓存配置
+        self.cache_enabled = cache_config.get("enabled", self.DEFAULT_CACHE_ENABLED)
+        self.cache_max_size_mb = cache_config.get(
+            "max_size_mb", self.DEFAULT_CACHE_MAX_SIZE_MB
+        )
+        self.cache_parse_enabled = cache_config.get(
+            "parse_enabled", self.DEFAULT_CACHE_PARSE_ENABLED
+        )
+
+    def _load_endpoints(self, llm_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Normalize llm.endpoints (or the single base_url/api_key) into a list.
+
+        Each endpoint has name, base_url, api_key, model, weight,
+        concurrency (None = unlimited), rpm and tpm. Unset model/rpm/tpm
+        fall back to the top-level llm settings.
+        """
+        raw_endpoints = llm_config.get("endpoints") or [{
+            "base_url": llm_config["base_url"],
+            "api_key": llm_config["api_key"],
+        }]
+
+        endpoints = []
+        for i, raw in enumerate(raw_endpoints):
+            endpoints.append({
+                "name": raw.get("name", f"endpoint-{i}"),
+                "base_url": raw["base_url"],
+                "api_key": raw["api_key"],
+                "model": raw.get("model", llm_config.get("model")),
+                "weight": raw.get("weight", self.DEFAULT_ENDPOINT_WEIGHT),
+                "concurrency": raw.get("concurrency"),
+                "rpm": raw.get("rpm", llm_config.get("rpm")),
+                "tpm": raw.get("tpm", llm_config.get("tpm")),
+            })
+        return endpoints
+
     def _validate_values(self) -> None:
         """Validate configuration values."""
         if self.llm_max_tokens <= 0:
@@ -126,15 +274,104 @@ class Config:
         if not (0 <= self.llm_temperature <= 2):
             raise ConfigError("llm.temperature must be between 0 and 2")
 
+        if (
+            self.llm_output_tokens_per_function is not None
+            and self.llm_output_tokens_per_function <= 0
+        ):
+            raise ConfigError("llm.output_tokens_per_function must be positive")
+
+        if self.llm_rpm is not None and self.llm_rpm <= 0:
+            raise ConfigError("llm.rpm must be positive")
+
+        if self.llm_tpm is not None and self.llm_tpm <= 0:
+            raise ConfigError("llm.tpm must be positive")
+
+        for i, endpoint in enumerate(self.llm_endpoints):
+            if endpoint["weight"] <= 0:
+                raise ConfigError(f"llm.endpoints[{i}].weight must be positive")
+            for field in ["concurrency", "rpm", "tpm"]:
+                if endpoint[field] is not None and endpoint[field] <= 0:
+                    raise ConfigError(f"llm.endpoints[{i}].{field} must be positive")
+
+        for key, value in self.llm_http.items():
+            if key not in self.DEFAULT_HTTP:
+                raise ConfigError(
+                    f"Unknown llm.http option: {key} "
+                    f"(expected one of {', '.join(self.DEFAULT_HTTP)})"
+                )
+            if key == "http2":
+                continue
+            if key == "max_keepalive_connections" and value < 0:
+                raise ConfigError("llm.http.max_keepalive_connections must be non-negative")
+            if key != "max_keepalive_connections" and value <= 0:
+                raise ConfigError(f"llm.http.{key} must be positive")
+
+        if self.llm_http["http2"]:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                raise ConfigError("llm.http.http2 requires the 'h2' package (pip install 'httpx[http2]')")
+
+        if self.llm_prompt_price_per_1k is not None and self.llm_prompt_price_per_1k < 0:
+            raise ConfigError("llm.pricing.prompt_per_1k must be non-negative")
+
+        if self.llm_completion_price_per_1k is not None and self.llm_completion_price_per_1k < 0:
+            raise ConfigError("llm.pricing.completion_per_1k must be non-negative")
+
+        if self.llm_cached_prompt_price_per_1k is not None and self.llm_cached_prompt_price_per_1k < 0:
+            raise ConfigError("llm.pricing.cached_prompt_per_1k must be non-negative")
+
+        if self.scan_parse_workers <= 0:
+            raise ConfigError("scan.parse_workers must be positive")
+
         if self.detector_max_retries < 0:
             raise ConfigError("detector.max_retries must be non-negative")
 
+        if self.detector_retry_base_delay < 0 or self.detector_retry_max_delay < 0:
+            raise ConfigError("detector.retry delays must be non-negative")
+
+        for error_class, budget in self.detector_retry_budgets.items():
+            if error_class not in self.RETRY_ERROR_CLASSES:
+                raise ConfigError(
+                    f"Unknown detector.retry.budgets class: {error_class} "
+                    f"(expected one of {', '.join(self.RETRY_ERROR_CLASSES)})"
+                )
+            if budget < 0:
+                raise ConfigError(f"detector.retry.budgets.{error_class} must be non-negative")
+
+        if self.detector_timeout_base <= 0 or self.detector_timeout_max <= 0:
+            raise ConfigError("detector.timeout.base and detector.timeout.max must be positive")
+
+        if self.detector_timeout_per_1k_tokens < 0:
+            raise ConfigError("detector.timeout.per_1k_tokens must be non-negative")
+
+        if not (0 < self.detector_hedge_quantile < 1):
+            raise ConfigError("detector.hedge.quantile must be between 0 and 1")
+
+        if self.detector_hedge_min_delay < 0:
+            raise ConfigError("detector.hedge.min_delay must be non-negative")
+
+        if self.detector_hedge_min_samples <= 0:
+            raise ConfigError("detector.hedge.min_samples must be positive")
+
         if self.detector_concurrency <= 0:
             raise ConfigError("detector.concurrency must be positive")
 
         if self.detector_context_token_limit <= 0:
             raise ConfigError("detector.context_token_limit must be positive")
 
+        if self.detector_batch_max_functions <= 0:
+            raise ConfigError("detector.batch.max_functions must be positive")
+
+        if self.detector_batch_max_lines <= 0:
+            raise ConfigError("detector.batch.max_lines must be positive")
+
+        if self.detector_batch_token_budget <= 0:
+            raise ConfigError("detector.batch.token_budget must be positive")
+
+        if self.cache_max_size_mb <= 0:
+            raise ConfigError("cache.max_size_mb must be positive")
+
     @classmethod
     def from_file(cls, config_path: str) -> "Config":
         """
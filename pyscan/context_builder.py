@@ -1,13 +1,56 @@
 """Context builder module for constructing function analysis context."""
-from typing import List, Dict, Any
+import functools
+import hashlib
+import heapq
+import textwrap
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 from pyscan.ast_parser import FunctionInfo
 from pyscan.config import Config
-import tiktoken
 import fnmatch
 import logging
 
 logger = logging.getLogger(__name__)
 
+# tiktoken 编码器每个进程只加载一次（加载 BPE 词表较慢）
+_tokenizer_lock = threading.Lock()
+_tokenizer_cache: Dict[str, Any] = {}
+
+
+def load_tokenizer() -> Any:
+    """
+    Load the tiktoken encoder used for token counting, once per process.
+
+    Blocks while another thread (see warm_up_tokenizer) is loading it.
+
+    Returns:
+        The encoder, or None if tiktoken is not installed.
+    """
+    with _tokenizer_lock:
+        if "encoder" not in _tokenizer_cache:
+            _tokenizer_cache["encoder"] = _create_tokenizer()
+        return _tokenizer_cache["encoder"]
+
+
+def warm_up_tokenizer() -> threading.Thread:
+    """Start loading the tiktoken encoder in a background thread."""
+    thread = threading.Thread(target=load_tokenizer, name="tokenizer-warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def _create_tokenizer() -> Any:
+    try:
+        import tiktoken
+    except ImportError:
+        logger.warning("tiktoken is not installed, using character-based token estimation")
+        return None
+    try:
+        return tiktoken.encoding_for_model("gpt-4")
+    except Exception:
+        # Fallback to cl100k_base encoding
+        return tiktoken.get_encoding("cl100k_base")
+
 
 class ContextBuilder:
     """Builder for constructing function analysis context."""
@@ -26,26 +69,77 @@ class ContextBuilder:
                          If False, use simple character-based estimation (1 token ≈ 4 chars).
             enable_advanced_analysis: If True, enable decorator and callable type inference.
         """
-        self.functions = functions
+        self.functions: List[FunctionInfo] = []
         self.config = config
         self.max_tokens = max_tokens
-        self.function_map = {f.name: f for f in functions}
+        self.function_map: Dict[str, FunctionInfo] = {}
+        # 函数名 -> 同名的所有函数（function_map 只保留最后一个）
+        self.name_index: Dict[str, List[FunctionInfo]] = {}
+        # 参数个数 -> 函数（按加入顺序）
+        self.arity_index: Dict[int, List[FunctionInfo]] = {}
+        # Callable 参数期望的参数个数（None 表示无法确定）-> Callable 参数
+        # 条目为 (函数序号, 参数位置, 所属函数, 参数名, 类型注解)，按加入顺序排列
+        self.callable_params_index: Dict[Optional[int], List[Tuple[int, int, FunctionInfo, str, str]]] = {}
+        # 符号 "模块:限定名" -> 函数（模块由文件路径得出，如 pkg/utils.py -> pkg.utils）
+        self.symbol_index: Dict[str, List[FunctionInfo]] = {}
+        # 模块名的后缀（"pkg.utils"、"utils"）-> 完整模块名，用于匹配扫描根目录不同的导入
+        self.modules_by_suffix: Dict[str, set] = {}
+        # 已解析的调用边：调用目标符号 -> 调用者（按加入顺序）
+        self.edges_by_key: Dict[str, List[FunctionInfo]] = {}
+        # 调用名 -> (调用者, 调用目标的候选符号)，接收者无法解析时候选中包含 None
+        self.call_edges_by_name: Dict[str, List[Tuple[FunctionInfo, List[Optional[str]]]]] = {}
+        self._order: Dict[int, int] = {}
+        self._modules: Dict[int, str] = {}
         self.use_tiktoken = use_tiktoken
         self.enable_advanced_analysis = enable_advanced_analysis
-        self.tokenizer = None
+        # tiktoken 编码器在第一次计数时加载（见 tokenizer 属性）
+        self._tokenizer = None
 
-        # Initialize tokenizer if requested
-        if self.use_tiktoken:
-            try:
-                self.tokenizer = tiktoken.encoding_for_model("gpt-4")
-            except Exception:
-                # Fallback to cl100k_base encoding
-                self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        # 上下文片段的大小缓存：同一个调用者会出现在多个函数的上下文中
+        self._piece_size = functools.lru_cache(maxsize=8192)(self._measure_piece)
 
         # Build decorator map (decorator_name -> list of decorated functions)
         self.decorator_map: Dict[str, List[FunctionInfo]] = {}
+        self.add_functions(functions)
+
+    @property
+    def tokenizer(self) -> Any:
+        """tiktoken encoder if use_tiktoken is on and tiktoken is available, else None."""
+        if self._tokenizer is None and self.use_tiktoken:
+            self._tokenizer = load_tokenizer()
+        return self._tokenizer
+
+    @tokenizer.setter
+    def tokenizer(self, tokenizer: Any) -> None:
+        self._tokenizer = tokenizer
+
+    def add_functions(self, functions: List[FunctionInfo]) -> None:
+        """
+        Add functions to the indexes.
+
+        Used by the streaming pipeline to update caller and decorator
+        indexes incrementally as parsed files arrive.
+
+        Args:
+            functions: Newly parsed functions.
+        """
+        start = len(self.functions)
+        self.functions.extend(functions)
+        for order, func in enumerate(functions, start):
+            self.function_map[func.name] = func
+            self.name_index.setdefault(func.name, []).append(func)
+            self._order[id(func)] = order
+            self._index_symbols(func)
+            self.arity_index.setdefault(len(func.args), []).append(func)
+            for position, (arg_name, arg_type) in enumerate(func.arg_types.items()):
+                if self._is_callable_type(arg_type):
+                    expected_arg_count = self._extract_callable_arg_count(arg_type)
+                    self.callable_params_index.setdefault(expected_arg_count, []).append(
+                        (order, position, func, arg_name, arg_type)
+                    )
+
         if self.enable_advanced_analysis:
-            self._build_decorator_map()
+            self._build_decorator_map(functions)
 
     def build_context(self, function: FunctionInfo) -> Dict[str, Any]:
         """
@@ -66,15 +160,18 @@ class ContextBuilder:
         }
 
         # 查找调用者（哪些函数调用了当前函数）
-        for func in self.functions:
-            if function.name in func.calls:
-                context["callers"].append(func.code)
+        for func in self.get_callers(function):
+            context["callers"].append(func.code)
+
+        # 调用目标未能解析、但可能是当前函数的调用者（低置信度，预算允许时才保留）
+        max_callers = self.config.detector_max_callers if self.config else 3
+        context["uncertain_callers"] = [
+            func.code for func in self.get_uncertain_callers(function)[:max_callers]
+        ]
 
         # 查找被调用者（当前函数调用了哪些函数）
-        for call_name in function.calls:
-            if call_name in self.function_map:
-                callee = self.function_map[call_name]
-                context["callees"].append(callee.code)
+        for callee in self.get_callees(function):
+            context["callees"].append(callee.code)
 
         # 高级分析：推断调用关系
         if self.enable_advanced_analysis:
@@ -89,6 +186,164 @@ class ContextBuilder:
 
         return context
 
+    def get_callers(self, function: FunctionInfo) -> List[FunctionInfo]:
+        """
+        Find functions that call the given function.
+
+        A call counts when it resolves, through the caller's imports and
+        classes, to the function's module and qualified name. Imports of
+        modules outside the scan also count when a scanned module is their
+        suffix, for scans rooted inside the imported package.
+
+        Args:
+            function: Callee function.
+
+        Returns:
+            Calling functions in the order they were added.
+        """
+        callers = {}
+        symbols = self._symbol_keys(function)
+        for key in symbols:
+            for caller in self.edges_by_key.get(key, []):
+                callers[id(caller)] = caller
+        for caller, keys in self.call_edges_by_name.get(function.name, []):
+            if any(key is not None and self._scanned_key(key) in symbols for key in keys):
+                callers[id(caller)] = caller
+        return sorted(callers.values(), key=lambda caller: self._order[id(caller)])
+
+    def get_uncertain_callers(self, function: FunctionInfo) -> List[FunctionInfo]:
+        """
+        Find functions that may call the given function through an unresolved call.
+
+        These are calls by the function's name whose target could not be
+        resolved: an unknown receiver (``obj.name()``), or only symbols of
+        scanned modules that define no such symbol (inherited methods,
+        dynamic attributes). Calls resolved to another function or to a
+        module outside the scan are not included.
+
+        Args:
+            function: Callee function.
+
+        Returns:
+            Possible callers not returned by get_callers(), in the order
+            they were added.
+        """
+        excluded = {id(caller) for caller in self.get_callers(function)}
+        excluded.add(id(function))
+        uncertain = []
+        for caller, keys in self.call_edges_by_name.get(function.name, []):
+            if id(caller) in excluded:
+                continue
+            if None in keys or (
+                not any(self._resolves(key) for key in keys)
+                and any(key.partition(":")[0] in self.modules_by_suffix for key in keys)
+            ):
+                excluded.add(id(caller))
+                uncertain.append(caller)
+        return uncertain
+
+    def get_call_sites(
+        self, caller: FunctionInfo, function: FunctionInfo
+    ) -> List[Tuple[int, int, int, int]]:
+        """
+        Positions of the caller's calls to the given function.
+
+        Args:
+            caller: Calling function (e.g. one returned by get_callers).
+            function: Called function.
+
+        Returns:
+            (start_line, start_col, end_line, end_col) of each call by the
+            function's name, in file coordinates, ordered by position.
+        """
+        return [site[1:] for site in caller.call_sites if site[0] == function.name]
+
+    def get_callees(self, function: FunctionInfo) -> List[FunctionInfo]:
+        """
+        Find known functions the given function calls.
+
+        Args:
+            function: Caller function.
+
+        Returns:
+            Functions returned by resolve_callees(), each once, in the order
+            they were added.
+        """
+        callees = {}
+        for matches in self.resolve_callees(function).values():
+            for callee in matches:
+                callees[id(callee)] = callee
+        return sorted(callees.values(), key=lambda callee: self._order[id(callee)])
+
+    def resolve_callees(self, function: FunctionInfo) -> Dict[str, List[FunctionInfo]]:
+        """
+        Resolve the function's calls to known functions.
+
+        Calls resolve like in get_callers(): through the function's imports
+        and classes to a module and qualified name. Only a call into a
+        scanned module that defines no such symbol (inherited methods,
+        dynamic attributes) falls back to every function with the called
+        name. Calls on unknown receivers and into modules outside the scan
+        have no callees.
+
+        Args:
+            function: Caller function.
+
+        Returns:
+            Call name -> called functions in the order they were added, for
+            calls with at least one known callee.
+        """
+        resolved = {}
+        for call_name, keys in self._call_keys(function).items():
+            callees = {}
+            for key in keys:
+                scanned = self._scanned_key(key) if key is not None else None
+                if scanned is None:
+                    continue
+                module, _, qualname = scanned.partition(":")
+                matches = [
+                    callee
+                    for full in self.modules_by_suffix.get(module, ())
+                    for callee in self.symbol_index.get(f"{full}:{qualname}", [])
+                ]
+                for callee in matches or self.name_index.get(call_name, []):
+                    callees[id(callee)] = callee
+            if callees:
+                resolved[call_name] = sorted(callees.values(), key=lambda callee: self._order[id(callee)])
+        return resolved
+
+    def fingerprint(self, function: FunctionInfo) -> Dict[str, str]:
+        """
+        Fingerprint the inputs of a function's detection.
+
+        Args:
+            function: Function to fingerprint.
+
+        Returns:
+            Dictionary with a ``code`` hash of the function's own normalized
+            code and a ``context`` hash of the code of its callers and
+            inferred callers. A changed hash means the function's prompt
+            would differ from the one it was last scanned with.
+        """
+        context = {"inferred_callers": [], "inferred_callees": []}
+        if self.enable_advanced_analysis:
+            self._infer_decorator_calls(function, context)
+            self._infer_callable_calls(function, context)
+
+        # 排序后再计算哈希，调用者的遍历顺序不影响指纹
+        max_callers = self.config.detector_max_callers if self.config else 3
+        dependencies = sorted(
+            [_normalize_code(caller.code) for caller in self.get_callers(function)]
+        ) + sorted(
+            [_normalize_code(caller.code) for caller in self.get_uncertain_callers(function)[:max_callers]]
+        ) + sorted(
+            [_normalize_code(inferred["code"]) for inferred in context["inferred_callers"]]
+        )
+        return {
+            "code": _hash_texts([_normalize_code(function.code)]),
+            "context": _hash_texts(dependencies),
+        }
+
     def is_public_api(self, function: FunctionInfo, context: Dict[str, Any] = None) -> bool:
         """
         判断函数是否是公共 API/接口。
@@ -139,9 +394,87 @@ class ContextBuilder:
 
         return False
 
-    def _build_decorator_map(self):
-        """Build map of decorators to decorated functions."""
-        for func in self.functions:
+    def _index_symbols(self, func: FunctionInfo) -> None:
+        """Add a function's symbol and its call edges to the symbol indexes."""
+        module = _module_name(getattr(func, 'file_path', ''))
+        self._modules[id(func)] = module
+        parts = module.split(".") if module else []
+        for i in range(len(parts) + 1):
+            self.modules_by_suffix.setdefault(".".join(parts[i:]), set()).add(module)
+        self.symbol_index.setdefault(f"{module}:{func.qualname or func.name}", []).append(func)
+
+        for call_name, keys in self._call_keys(func).items():
+            for key in keys:
+                if key is not None:
+                    self.edges_by_key.setdefault(key, []).append(func)
+            self.call_edges_by_name.setdefault(call_name, []).append((func, keys))
+
+    def _call_keys(self, func: FunctionInfo) -> Dict[str, List[Optional[str]]]:
+        """Absolute call target symbols per call name (None: unknown receiver)."""
+        module = self._modules.get(id(func))
+        if module is None:
+            module = _module_name(getattr(func, 'file_path', ''))
+        qualified_calls = func.qualified_calls
+        if not qualified_calls:
+            # 没有解析信息（手工构造的 FunctionInfo），按当前模块的同名函数处理
+            qualified_calls = {call_name: [f":{call_name}"] for call_name in func.calls}
+        is_package = getattr(func, 'file_path', '').replace("\\", "/").endswith("__init__.py")
+        return {
+            call_name: [
+                None if target == "?" else _absolute_symbol(target, module, is_package)
+                for target in targets
+            ]
+            for call_name, targets in qualified_calls.items()
+        }
+
+    def _symbol_keys(self, function: FunctionInfo) -> List[str]:
+        """Symbols a call may use for the function: every suffix of its module."""
+        module = self._modules.get(id(function))
+        if module is None:
+            module = _module_name(getattr(function, 'file_path', ''))
+        qualname = function.qualname or function.name
+        parts = module.split(".") if module else []
+        return [f"{'.'.join(parts[i:])}:{qualname}" for i in range(len(parts) + 1)]
+
+    def _scanned_key(self, key: str) -> Optional[str]:
+        """
+        Symbol of a call edge in terms of the scanned modules.
+
+        A module unknown to the scan is matched by its longest suffix that
+        names a scanned module defining the symbol, so ``mypkg.utils:helper``
+        finds ``utils.py`` when the scan is rooted at ``mypkg/``.
+
+        Returns:
+            The key itself, the key with leading packages dropped, or None
+            if no scanned module matches.
+        """
+        module, _, qualname = key.partition(":")
+        if module in self.modules_by_suffix:
+            return key
+        parts = module.split(".")
+        for i in range(1, len(parts)):
+            suffix = ".".join(parts[i:])
+            if any(
+                f"{full}:{qualname}" in self.symbol_index
+                for full in self.modules_by_suffix.get(suffix, ())
+            ):
+                return f"{suffix}:{qualname}"
+        return None
+
+    def _resolves(self, key: str) -> bool:
+        """True if a call edge's symbol matches a known function."""
+        scanned = self._scanned_key(key)
+        if scanned is None:
+            return False
+        module, _, qualname = scanned.partition(":")
+        return any(
+            f"{full}:{qualname}" in self.symbol_index
+            for full in self.modules_by_suffix.get(module, ())
+        )
+
+    def _build_decorator_map(self, functions: List[FunctionInfo]):
+        """Add functions to the map of decorators to decorated functions."""
+        for func in functions:
             for decorator in func.decorators:
                 if decorator not in self.decorator_map:
                     self.decorator_map[decorator] = []
@@ -190,45 +523,58 @@ class ContextBuilder:
         """
         # 情况1: 当前函数有 Callable 类型参数，找出签名匹配的函数
         for arg_name, arg_type in function.arg_types.items():
-            if "Callable" in arg_type or "callable" in arg_type.lower():
+            if self._is_callable_type(arg_type):
                 # 提取参数数量（宽松匹配）
                 expected_arg_count = self._extract_callable_arg_count(arg_type)
 
-                # 查找签名匹配的函数
-                for func in self.functions:
-                    if func.name != function.name:  # 排除自己
-                        if expected_arg_count is None or len(func.args) == expected_arg_count:
-                            hint = f"(推断): 可能作为参数 '{arg_name}: {arg_type}' 传入"
-                            context["inferred_callees"].append({
-                                "code": func.code,
-                                "hint": hint
-                            })
-                            break  # 只添加一个示例
+                # 查找签名匹配的第一个函数（排除自己）
+                candidates = (
+                    self.functions if expected_arg_count is None
+                    else self.arity_index.get(expected_arg_count, [])
+                )
+                for func in candidates:
+                    if func.name != function.name:
+                        hint = f"(推断): 可能作为参数 '{arg_name}: {arg_type}' 传入"
+                        context["inferred_callees"].append({
+                            "code": func.code,
+                            "hint": hint
+                        })
+                        break  # 只添加一个示例
 
         # 情况2: 其他函数有 Callable 参数可能调用当前函数
+        # 参数个数匹配的 Callable 参数按 (函数序号, 参数位置) 排序
         current_arg_count = len(function.args)
-        for func in self.functions:
-            if func.name != function.name:
-                for arg_name, arg_type in func.arg_types.items():
-                    if "Callable" in arg_type or "callable" in arg_type.lower():
-                        expected_arg_count = self._extract_callable_arg_count(arg_type)
-                        if expected_arg_count is None or current_arg_count == expected_arg_count:
-                            hint = f"(推断): 可能被作为参数 '{arg_name}: {arg_type}' 传入 {func.name}"
-                            context["inferred_callers"].append({
-                                "file_path": getattr(func, 'file_path', ''),
-                                "function_name": func.name,
-                                "code": func.code,
-                                "start_line": func.lineno,
-                                "end_line": func.end_lineno,
-                                "start_col": func.col_offset,
-                                "end_col": func.end_col_offset,
-                                "arg_name": arg_name,  # 保存参数名用于高亮
-                                "arg_type": arg_type,  # 保存参数类型用于高亮
-                                "hint": hint
-                            })
-                            break  # 每个函数只添加一个推断
-                    if context["inferred_callers"]:
-                        break
+        candidates = heapq.merge(
+            self.callable_params_index.get(current_arg_count, []),
+            self.callable_params_index.get(None, []),
+            key=lambda entry: entry[:2]
+        )
+        last_order = None
+        for order, position, func, arg_name, arg_type in candidates:
+            if order == last_order or func.name == function.name:
+                continue
+            # 每个函数只添加一个推断；已有推断的调用者时只检查函数的第一个带注解参数
+            if context["inferred_callers"] and position != 0:
+                continue
+            last_order = order
+            hint = f"(推断): 可能被作为参数 '{arg_name}: {arg_type}' 传入 {func.name}"
+            context["inferred_callers"].append({
+                "file_path": getattr(func, 'file_path', ''),
+                "function_name": func.name,
+                "code": func.code,
+                "start_line": func.lineno,
+                "end_line": func.end_lineno,
+                "start_col": func.col_offset,
+                "end_col": func.end_col_offset,
+                "arg_name": arg_name,  # 保存参数名用于高亮
+                "arg_type": arg_type,  # 保存参数类型用于高亮
+                "hint": hint
+            })
+
+    @staticmethod
+    def _is_callable_type(arg_type: str) -> bool:
+        """True if a type annotation looks like a Callable."""
+        return "Callable" in arg_type or "callable" in arg_type.lower()
 
     def _extract_callable_arg_count(self, type_annotation: str) -> int:
         """
@@ -307,6 +653,10 @@ class ContextBuilder:
         """
         Fit context to token limit using multi-level compression strategy.
 
+        Every piece (current function, each caller, each caller signature,
+        each inferred caller) is measured once; the compression levels only
+        add up piece sizes.
+
         Args:
             context: Original context.
             function: Current function.
@@ -314,95 +664,138 @@ class ContextBuilder:
         Returns:
             Adjusted context within token limit.
         """
-        context_text = self._build_context_text(context)
-        current_tokens = self._count_tokens(context_text)
-
-        if current_tokens <= self.max_tokens:
+        current_size = self._piece_size(self._current_piece(context["current_function"]))
+        callers = context.get("callers", [])
+        inferred_callers = context.get("inferred_callers", [])
+        inferred_sizes = [self._piece_size(self._inferred_piece(i)) for i in inferred_callers]
+        caller_sizes = [self._piece_size(self._caller_piece(code)) for code in callers]
+
+        if self._sum_tokens(current_size, caller_sizes, inferred_sizes) <= self.max_tokens:
+            # 低置信度的调用者只使用剩余预算，按顺序能放下几个放几个
+            uncertain = []
+            uncertain_sizes = []
+            for code in context.get("uncertain_callers", []):
+                size = self._piece_size(self._caller_piece(code))
+                if self._sum_tokens(
+                    current_size, caller_sizes, inferred_sizes, uncertain_sizes + [size]
+                ) > self.max_tokens:
+                    break
+                uncertain.append(code)
+                uncertain_sizes.append(size)
+            context["uncertain_callers"] = uncertain
             return context
 
         is_public_api = context.get("is_public_api", False)
+        signatures = {code: self._extract_signature(code) for code in callers}
+
+        def compressed(caller_codes, inferred):
+            return {
+                "current_function": context["current_function"],
+                "callers": [signatures[code] for code in caller_codes],
+                "is_public_api": is_public_api,
+                "inferred_callers": inferred
+            }
+
+        def fits(caller_codes, inferred_count):
+            caller_sizes = [
+                self._piece_size(self._caller_piece(signatures[code])) for code in caller_codes
+            ]
+            return self._sum_tokens(
+                current_size, caller_sizes, inferred_sizes[:inferred_count]
+            ) <= self.max_tokens
 
         # Level 1: 将 callers 转为签名，移除 callees（已在 build_context 中移除）
         logger.info(f"Applying compression level 1 for function {function.name}")
-        compressed_context = {
-            "current_function": context["current_function"],
-            "callers": [
-                self._extract_signature(code) for code in context.get("callers", [])
-            ],
-            "is_public_api": is_public_api,
-            "inferred_callers": context.get("inferred_callers", [])
-        }
-
-        context_text = self._build_context_text(compressed_context)
-        current_tokens = self._count_tokens(context_text)
-
-        if current_tokens <= self.max_tokens:
-            return compressed_context
+        if fits(callers, len(inferred_callers)):
+            return compressed(callers, inferred_callers)
 
         # Level 2: 限制 callers 数量 + 优先级排序
         logger.info(f"Applying compression level 2 for function {function.name}")
         max_callers = self.config.detector_max_callers if self.config else 3
-
-        # 优先级排序
-        callers = self._prioritize_callers(
-            context.get("callers", []),
-            is_public_api
-        )
-        compressed_context["callers"] = [
-            self._extract_signature(code) for code in callers[:max_callers]
-        ]
-
-        context_text = self._build_context_text(compressed_context)
-        current_tokens = self._count_tokens(context_text)
-
-        if current_tokens <= self.max_tokens:
-            return compressed_context
+        top_callers = self._prioritize_callers(callers, is_public_api)[:max_callers]
+        if fits(top_callers, len(inferred_callers)):
+            return compressed(top_callers, inferred_callers)
 
         # Level 3: 限制推断的 callers 数量
         logger.info(f"Applying compression level 3 for function {function.name}")
         max_inferred = self.config.detector_max_inferred if self.config else 2
-        compressed_context["inferred_callers"] = compressed_context.get(
-            "inferred_callers", []
-        )[:max_inferred]
-
-        context_text = self._build_context_text(compressed_context)
-        current_tokens = self._count_tokens(context_text)
-
-        if current_tokens <= self.max_tokens:
-            return compressed_context
+        if fits(top_callers, max_inferred):
+            return compressed(top_callers, inferred_callers[:max_inferred])
 
         # Level 4: 移除所有推断的 callers
         logger.info(f"Applying compression level 4 for function {function.name}")
-        compressed_context["inferred_callers"] = []
-
-        context_text = self._build_context_text(compressed_context)
-        current_tokens = self._count_tokens(context_text)
-
-        if current_tokens <= self.max_tokens:
-            return compressed_context
+        if fits(top_callers, 0):
+            return compressed(top_callers, [])
 
         # Level 5: 只保留 1-2 个最重要的 callers
         logger.info(f"Applying compression level 5 for function {function.name}")
-        compressed_context["callers"] = compressed_context["callers"][:2]
-
-        context_text = self._build_context_text(compressed_context)
-        current_tokens = self._count_tokens(context_text)
-
-        if current_tokens <= self.max_tokens:
-            return compressed_context
+        if fits(top_callers[:2], 0):
+            return compressed(top_callers[:2], [])
 
         # Level 6: 最小化 - 只保留当前函数
         logger.warning(
             f"Applying compression level 6 (minimal) for function {function.name}"
         )
-        compressed_context = {
-            "current_function": context["current_function"],
-            "callers": [],
-            "is_public_api": is_public_api,
-            "inferred_callers": []
-        }
+        return compressed([], [])
 
-        return compressed_context
+    def count_context_tokens(self, context: Dict[str, Any]) -> int:
+        """
+        Count tokens of a (possibly compressed) context.
+
+        Args:
+            context: Context dictionary returned by build_context.
+
+        Returns:
+            Number of tokens, using the same counting method as compression.
+        """
+        return self._sum_tokens(
+            self._piece_size(self._current_piece(context["current_function"])),
+            [self._piece_size(self._caller_piece(code)) for code in context.get("callers", [])],
+            [self._piece_size(self._inferred_piece(i)) for i in context.get("inferred_callers", [])],
+            [self._piece_size(self._caller_piece(code)) for code in context.get("uncertain_callers", [])]
+        )
+
+    # 上下文文本各部分的格式，与 _build_context_text 一致
+    _CALLERS_HEADER = "调用者函数:\n"
+    _INFERRED_HEADER = "推断的调用者函数:\n"
+    _UNCERTAIN_HEADER = "可能的调用者函数(调用未解析):\n"
+
+    @staticmethod
+    def _current_piece(code: str) -> str:
+        return f"当前函数:\n{code}\n\n"
+
+    @staticmethod
+    def _caller_piece(code: str) -> str:
+        return f"{code}\n"
+
+    @staticmethod
+    def _inferred_piece(inferred: Any) -> str:
+        if isinstance(inferred, dict):
+            return f"{inferred.get('hint', '')}:\n{inferred.get('code', '')}\n"
+        return f"{inferred}\n"
+
+    def _sum_tokens(
+        self, current_size: int, caller_sizes: List[int], inferred_sizes: List[int],
+        uncertain_sizes: List[int] = ()
+    ) -> int:
+        """Tokens of a context text made of the measured pieces."""
+        size = current_size
+        if caller_sizes:
+            size += self._piece_size(self._CALLERS_HEADER) + sum(caller_sizes) + self._piece_size("\n")
+        if inferred_sizes:
+            size += self._piece_size(self._INFERRED_HEADER) + sum(inferred_sizes) + self._piece_size("\n")
+        if uncertain_sizes:
+            size += self._piece_size(self._UNCERTAIN_HEADER) + sum(uncertain_sizes) + self._piece_size("\n")
+        if self.use_tiktoken and self.tokenizer is not None:
+            return size
+        # 字符估算时片段大小为字符数，合计后再换算，与整段文本的估算完全一致
+        return size // 4
+
+    def _measure_piece(self, text: str) -> int:
+        """Size of a context piece: tokens with tiktoken, characters otherwise."""
+        if self.use_tiktoken and self.tokenizer is not None:
+            return self._count_tokens(text)
+        return len(text)
 
     def _build_context_text(self, context: Dict[str, Any]) -> str:
         """
@@ -438,6 +831,13 @@ class ContextBuilder:
                 parts.append("\n")
             parts.append("\n")
 
+        if context.get("uncertain_callers"):
+            parts.append("可能的调用者函数(调用未解析):\n")
+            for caller in context["uncertain_callers"]:
+                parts.append(caller)
+                parts.append("\n")
+            parts.append("\n")
+
         # callees 已移除 - 不包含在上下文中
 
         return "".join(parts)
@@ -488,3 +888,54 @@ class ContextBuilder:
                     break
 
         return signature
+
+
+def _module_name(file_path: str) -> str:
+    """Dotted module name of a scanned file (``pkg/__init__.py`` -> ``pkg``)."""
+    if not file_path:
+        return ""
+    parts = [part for part in file_path.replace("\\", "/").split("/") if part not in ("", ".")]
+    if parts and parts[-1].endswith(".py"):
+        parts[-1] = parts[-1][:-3]
+    if parts and parts[-1] == "__init__":
+        parts.pop()
+    return ".".join(parts)
+
+
+def _absolute_symbol(target: str, module: str, is_package: bool) -> str:
+    """
+    Resolve a call target recorded by the parser against the calling module.
+
+    Args:
+        target: ``module:qualname`` where the module is empty for the
+            calling module and may be relative (leading dots).
+        module: Dotted name of the calling module.
+        is_package: Whether the calling module is a package ``__init__``.
+    """
+    target_module, _, qualname = target.partition(":")
+    if not target_module:
+        return f"{module}:{qualname}"
+    if not target_module.startswith("."):
+        return target
+    level = len(target_module) - len(target_module.lstrip("."))
+    package = module.split(".") if module else []
+    if not is_package:
+        package = package[:-1]
+    package = package[:max(len(package) - (level - 1), 0)]
+    rest = target_module[level:]
+    return f"{'.'.join(package + ([rest] if rest else []))}:{qualname}"
+
+
+def _normalize_code(code: str) -> str:
+    """Dedent code and strip trailing whitespace, keeping line structure."""
+    return "\n".join(line.rstrip() for line in textwrap.dedent(code).strip("\n").split("\n"))
+
+
+def _hash_texts(texts: List[str]) -> str:
+    """Hash a list of texts, keeping the boundaries between them."""
+    digest = hashlib.sha256()
+    for text in texts:
+        data = text.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
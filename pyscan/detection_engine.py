@@ -0,0 +1,239 @@
+"""Concurrent detection engine built on asyncio."""
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from pyscan.ast_parser import FunctionInfo
+from pyscan.budget import ScanBudget
+from pyscan.bug_detector import BugDetector
+
+
+logger = logging.getLogger(__name__)
+
+# next() 的哨兵值，表示任务源已耗尽
+_EXHAUSTED = object()
+
+
+@dataclass
+class DetectionJob:
+    """A single function waiting for bug detection."""
+
+    function: FunctionInfo
+    context: Dict[str, Any]
+    file_path: str = ""
+    callers: List[Dict[str, Any]] = field(default_factory=list)
+    callees: List[str] = field(default_factory=list)
+    inferred_callers: List[Dict[str, Any]] = field(default_factory=list)
+    estimated_tokens: Optional[int] = None  # 上下文 token 数，用于速率限制
+    fingerprint: Optional[Dict[str, str]] = None  # 检测输入的指纹，用于增量扫描
+
+
+@dataclass
+class BatchPolicy:
+    """
+    Which jobs may share one LLM request.
+
+    Small functions are dominated by the fixed system prompt, so consecutive
+    jobs for functions of at most ``max_lines`` lines are packed together
+    until ``max_functions`` or ``token_budget`` context tokens is reached.
+    """
+
+    max_functions: int = 8
+    max_lines: int = 15
+    token_budget: int = 3000
+
+    @classmethod
+    def from_config(cls, config: Any) -> Optional["BatchPolicy"]:
+        """Build the policy from Config, or None if batching is disabled."""
+        if not config.detector_batch_enabled:
+            return None
+        return cls(
+            max_functions=config.detector_batch_max_functions,
+            max_lines=config.detector_batch_max_lines,
+            token_budget=config.detector_batch_token_budget,
+        )
+
+    def is_batchable(self, job: DetectionJob) -> bool:
+        """True if the job is small enough to share a request."""
+        lines = job.function.end_lineno - job.function.lineno + 1
+        return lines <= self.max_lines and (job.estimated_tokens or 0) <= self.token_budget
+
+    def pack(self, jobs: Iterable[DetectionJob]) -> Iterator[List[DetectionJob]]:
+        """
+        Group consecutive batchable jobs, keeping job order.
+
+        Args:
+            jobs: Jobs in detection order.
+
+        Yields:
+            Lists of jobs; jobs that are not batchable come alone.
+        """
+        batch: List[DetectionJob] = []
+        batch_tokens = 0
+        for job in jobs:
+            if not self.is_batchable(job):
+                if batch:
+                    yield batch
+                    batch, batch_tokens = [], 0
+                yield [job]
+                continue
+
+            tokens = job.estimated_tokens or 0
+            if batch and batch_tokens + tokens > self.token_budget:
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(job)
+            batch_tokens += tokens
+            if len(batch) >= self.max_functions:
+                yield batch
+                batch, batch_tokens = [], 0
+        if batch:
+            yield batch
+
+
+class DetectionEngine:
+    """
+    Run BugDetector.detect_async with bounded concurrency.
+
+    Up to ``concurrency`` requests are in flight at once, but results are
+    delivered to the callback strictly in job order, so reports and resume
+    state are identical to a sequential scan.
+
+    With a ScanBudget, no new job is started once it would exceed the budget;
+    requests already in flight are finished and delivered, and
+    ``stop_reason`` records why the engine stopped early.
+
+    With a BatchPolicy, consecutive small functions are sent together via
+    BugDetector.detect_batch_async; their results are still delivered one
+    job at a time.
+    """
+
+    def __init__(
+        self,
+        detector: BugDetector,
+        concurrency: int = 1,
+        budget: Optional[ScanBudget] = None,
+        batch_policy: Optional[BatchPolicy] = None
+    ):
+        """
+        Initialize detection engine.
+
+        Args:
+            detector: Bug detector used for every job.
+            concurrency: Maximum number of LLM requests in flight.
+            budget: Optional token/cost/deadline budget.
+            batch_policy: Optional policy for packing small functions into
+                one request (None sends every function alone).
+        """
+        self.detector = detector
+        self.concurrency = max(1, concurrency)
+        self.budget = budget
+        self.batch_policy = batch_policy
+        self.stop_reason: Optional[str] = None
+        # 允许已完成但尚未按序交付的结果数量，避免队首慢请求阻塞过多任务
+        self.max_pending = self.concurrency * 4
+
+    async def run(
+        self,
+        jobs: Iterable[DetectionJob],
+        on_result: Callable[[DetectionJob, Optional[Dict[str, Any]]], bool]
+    ) -> None:
+        """
+        Detect bugs for all jobs.
+
+        Jobs are pulled lazily from ``jobs`` in a worker thread, so building
+        context for the next job does not block requests already in flight.
+
+        Args:
+            jobs: Iterable of jobs, consumed in order.
+            on_result: Called in job order with (job, result), where result
+                is the return value of detect_async (None on failure).
+                Returning False stops the engine; outstanding requests are
+                cancelled and no further jobs are pulled.
+
+        Raises:
+            Exception: Any error raised while producing jobs, re-raised after
+                all jobs produced before it have been delivered.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        if self.batch_policy is not None:
+            group_iter = self.batch_policy.pack(jobs)
+        else:
+            group_iter = ([job] for job in jobs)
+        window: deque = deque()
+        exhausted = False
+        producer_error: Optional[BaseException] = None
+
+        async def detect(group: List[DetectionJob]) -> List[Optional[Dict[str, Any]]]:
+            async with semaphore:
+                if len(group) > 1:
+                    results = await self.detector.detect_batch_async(group)
+                else:
+                    job = group[0]
+                    results = [await self.detector.detect_async(
+                        job.function,
+                        job.context,
+                        file_path=job.file_path,
+                        function_start_line=job.function.lineno,
+                        callers=job.callers,
+                        callees=job.callees,
+                        inferred_callers=job.inferred_callers,
+                        estimated_tokens=job.estimated_tokens
+                    )]
+            if self.budget is not None:
+                self.budget.settle(self._budget_tokens(group), None)
+                for result in results:
+                    self.budget.record(result.get("usage") if result else None)
+            return results
+
+        try:
+            while True:
+                while not exhausted and len(window) < self.max_pending:
+                    try:
+                        group = await asyncio.to_thread(next, group_iter, _EXHAUSTED)
+                    except Exception as e:
+                        # 先交付已提交的任务，再抛出异常，保持与顺序扫描一致
+                        producer_error = e
+                        exhausted = True
+                        break
+                    if group is _EXHAUSTED:
+                        exhausted = True
+                        break
+                    if self.budget is not None:
+                        reason = self.budget.exceeded_reason(self._budget_tokens(group))
+                        if reason is not None:
+                            # 预算不足：不再分发新任务，已发出的请求正常完成
+                            self.stop_reason = reason
+                            exhausted = True
+                            break
+                        self.budget.reserve(self._budget_tokens(group))
+                    window.append((group, asyncio.create_task(detect(group))))
+
+                if not window:
+                    break
+
+                group, task = window.popleft()
+                results = await task
+                for job, result in zip(group, results):
+                    if not on_result(job, result):
+                        return
+
+            if producer_error is not None:
+                raise producer_error
+
+        finally:
+            for _, task in window:
+                task.cancel()
+            if window:
+                await asyncio.gather(
+                    *(task for _, task in window), return_exceptions=True
+                )
+
+    def _budget_tokens(self, group: List[DetectionJob]) -> int:
+        """Estimated prompt tokens of one request, including the system prompt."""
+        return (
+            sum(job.estimated_tokens or 0 for job in group)
+            + self.detector.system_prompt_tokens
+        )
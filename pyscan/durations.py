@@ -0,0 +1,37 @@
+"""Parsing of duration strings shared by the CLI and retry handling."""
+import math
+import re
+
+
+# 只接受十进制数字（不接受 "nan"、"inf"、"1e3" 等 float() 能解析的写法）
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+# 时长由若干 "数字+单位" 组成，如 "90s"、"1h30m"、"6m0s"、"20ms"
+_DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_RE = re.compile(r"(?:\d+(?:\.\d+)?(?:ms|h|m|s))+")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+def parse_duration(value: str) -> float:
+    """
+    Parse a duration into seconds.
+
+    Accepts plain decimal seconds ("90", "1.5") and unit sequences with ``h``,
+    ``m``, ``s`` and ``ms`` ("45s", "2h", "1h30m", "6m0s", "20ms").
+
+    Raises:
+        ValueError: If the value is not a duration.
+    """
+    value = value.strip().lower()
+    if _NUMBER_RE.fullmatch(value):
+        seconds = float(value)
+    elif _DURATION_RE.fullmatch(value):
+        seconds = sum(
+            float(number) * _DURATION_UNITS[unit]
+            for number, unit in _DURATION_PART_RE.findall(value)
+        )
+    else:
+        raise ValueError(f"Invalid duration: {value!r}")
+    # 超长的数字串会溢出为 inf
+    if not math.isfinite(seconds):
+        raise ValueError(f"Invalid duration: {value!r}")
+    return seconds
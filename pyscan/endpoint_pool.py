@@ -0,0 +1,202 @@
+"""Pool of OpenAI-compatible endpoints with least-loaded routing and failover."""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional
+
+from pyscan.rate_limiter import RateLimiter
+from pyscan.retry import RATE_LIMIT, SERVER_ERROR, TIMEOUT, classify_error, retry_after_seconds
+
+
+logger = logging.getLogger(__name__)
+
+# 这些错误说明端点本身有问题，计入端点健康状态；解析错误等与端点无关
+_ENDPOINT_ERROR_CLASSES = (RATE_LIMIT, SERVER_ERROR, TIMEOUT)
+
+
+@dataclass
+class Endpoint:
+    """One OpenAI-compatible gateway/key with its own quota."""
+
+    name: str
+    base_url: str
+    api_key: str
+    model: str
+    weight: float = 1.0
+    max_concurrency: Optional[int] = None  # None 表示不限制
+    client: Any = None
+    async_client: Any = None
+    async_http_client: Any = None  # async_client 使用的共享 httpx 客户端
+    rate_limiter: RateLimiter = field(default_factory=RateLimiter)
+
+    # 运行时状态
+    in_flight: int = 0
+    consecutive_failures: int = 0
+    unhealthy_until: float = 0.0
+    requests: int = 0
+    errors: int = 0
+
+    @property
+    def load(self) -> float:
+        """In-flight requests relative to the endpoint's weight."""
+        return self.in_flight / self.weight
+
+    def has_capacity(self) -> bool:
+        """True if another request may be sent without exceeding max_concurrency."""
+        return self.max_concurrency is None or self.in_flight < self.max_concurrency
+
+    def is_healthy(self, now: float) -> bool:
+        """True unless the endpoint is cooling down after errors."""
+        return now >= self.unhealthy_until
+
+
+class EndpointPool:
+    """
+    Route each request to the least-loaded healthy endpoint.
+
+    An endpoint that returns ``failure_threshold`` consecutive rate-limit,
+    server or timeout errors is taken out of rotation for ``cooldown``
+    seconds (or for the server's Retry-After on 429), so retries fail over
+    to the remaining endpoints. If every endpoint is cooling down, the one
+    that recovers first is used rather than stalling the scan.
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        failure_threshold: int = 3,
+        cooldown: float = 30.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize endpoint pool.
+
+        Args:
+            endpoints: Endpoints to route between (at least one).
+            failure_threshold: Consecutive endpoint errors before cooldown.
+            cooldown: Seconds an unhealthy endpoint stays out of rotation.
+            clock: Monotonic clock in seconds (injectable for tests).
+        """
+        if not endpoints:
+            raise ValueError("EndpointPool requires at least one endpoint")
+        self.endpoints = endpoints
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.clock = clock
+        self._released: Optional[asyncio.Event] = None
+        self._released_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def select(self, exclude: Optional[Endpoint] = None) -> Optional[Endpoint]:
+        """
+        Pick the least-loaded healthy endpoint with free capacity.
+
+        Args:
+            exclude: Endpoint to avoid if any other endpoint qualifies
+                (the one that just failed).
+
+        Returns:
+            The chosen endpoint, or None if all endpoints are at capacity.
+        """
+        now = self.clock()
+        candidates = [ep for ep in self.endpoints if ep.has_capacity()]
+        if not candidates:
+            return None
+
+        healthy = [ep for ep in candidates if ep.is_healthy(now)]
+        if healthy:
+            if exclude is not None and len(healthy) > 1:
+                healthy = [ep for ep in healthy if ep is not exclude]
+            # 负载相同时按权重优先，再按配置顺序
+            return min(healthy, key=lambda ep: (ep.load, -ep.weight))
+
+        # 所有端点都在冷却：选择最早恢复的端点
+        return min(candidates, key=lambda ep: ep.unhealthy_until)
+
+    def acquire_sync(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        """
+        Reserve an endpoint for a synchronous request.
+
+        The synchronous path sends one request at a time, so capacity limits
+        never block it.
+        """
+        endpoint = self.select(exclude) or min(self.endpoints, key=lambda ep: ep.load)
+        self._start(endpoint)
+        return endpoint
+
+    async def acquire(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        """Reserve an endpoint, waiting while every endpoint is at capacity."""
+        while True:
+            endpoint = self.select(exclude)
+            if endpoint is not None:
+                self._start(endpoint)
+                return endpoint
+            loop = asyncio.get_running_loop()
+            if self._released is None or self._released_loop is not loop:
+                # Event 绑定事件循环，每次 asyncio.run 使用新的 Event
+                self._released = asyncio.Event()
+                self._released_loop = loop
+            self._released.clear()
+            await self._released.wait()
+
+    def release(self, endpoint: Endpoint, error: Optional[BaseException] = None) -> None:
+        """
+        Return an endpoint after a request and update its health.
+
+        Args:
+            endpoint: Endpoint returned by acquire()/acquire_sync().
+            error: Exception raised by the request, or None on success.
+        """
+        endpoint.in_flight -= 1
+        if self._released is not None:
+            self._released.set()
+
+        if error is None:
+            endpoint.consecutive_failures = 0
+            return
+        if not isinstance(error, Exception):
+            # 任务取消等中断与端点健康无关
+            return
+
+        error_class = classify_error(error)
+        if error_class not in _ENDPOINT_ERROR_CLASSES:
+            return
+
+        endpoint.errors += 1
+        endpoint.consecutive_failures += 1
+        now = self.clock()
+
+        if error_class == RATE_LIMIT:
+            # 限流：按服务端要求的时间暂停该端点
+            wait = retry_after_seconds(error)
+            endpoint.unhealthy_until = max(endpoint.unhealthy_until, now + (wait or 1.0))
+        if endpoint.consecutive_failures >= self.failure_threshold:
+            endpoint.unhealthy_until = max(endpoint.unhealthy_until, now + self.cooldown)
+            logger.warning(
+                f"Endpoint {endpoint.name} marked unhealthy for {self.cooldown:.0f}s "
+                f"after {endpoint.consecutive_failures} consecutive errors"
+            )
+
+    def cancel(self, endpoint: Endpoint) -> None:
+        """Return an endpoint reserved by acquire() without sending a request."""
+        endpoint.in_flight -= 1
+        endpoint.requests -= 1
+        if self._released is not None:
+            self._released.set()
+
+    @staticmethod
+    def is_endpoint_error(error: BaseException) -> bool:
+        """True if the error reflects on the endpoint (rate limit, 5xx, timeout)."""
+        return classify_error(error) in _ENDPOINT_ERROR_CLASSES
+
+    def has_alternative(self, endpoint: Endpoint) -> bool:
+        """True if another healthy endpoint could take the retry right away."""
+        now = self.clock()
+        return any(
+            ep is not endpoint and ep.is_healthy(now) and ep.has_capacity()
+            for ep in self.endpoints
+        )
+
+    def _start(self, endpoint: Endpoint) -> None:
+        endpoint.in_flight += 1
+        endpoint.requests += 1
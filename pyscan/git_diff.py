@@ -0,0 +1,108 @@
+"""Changed line ranges from the local git repository (``--since``)."""
+import os
+import re
+import subprocess
+from typing import Dict, List, Tuple
+
+
+# @@ -old_start[,old_count] +new_start[,new_count] @@
+_HUNK_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+class GitDiffError(Exception):
+    """Raised when the changed lines cannot be read from git."""
+    pass
+
+
+def _run_git(directory: str, args: List[str], error: str = None) -> str:
+    try:
+        result = subprocess.run(
+            ["git", "-c", "core.quotePath=false", *args],
+            cwd=directory,
+            capture_output=True,
+            text=True,
+            encoding="utf-8",
+        )
+    except FileNotFoundError:
+        raise GitDiffError("git executable not found")
+    if result.returncode != 0:
+        raise GitDiffError(error or result.stderr.strip() or f"git {args[0]} failed")
+    return result.stdout
+
+
+def parse_diff_ranges(diff_text: str) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Parse the new-side line ranges of a ``git diff --unified=0`` output.
+
+    A pure deletion is recorded as the line before the deleted block, so the
+    function that lost lines still counts as changed.
+
+    Args:
+        diff_text: Output of ``git diff --unified=0``.
+
+    Returns:
+        Mapping of file path (as printed by git) to inclusive (start, end)
+        line ranges in the current version of the file.
+    """
+    ranges: Dict[str, List[Tuple[int, int]]] = {}
+    current = None
+    for line in diff_text.splitlines():
+        if line.startswith("+++ "):
+            path = line[4:]
+            # 删除的文件没有新版本
+            current = None if path == "/dev/null" else path[2:] if path.startswith("b/") else path
+            continue
+        match = _HUNK_RE.match(line)
+        if match and current is not None:
+            start = int(match.group(1))
+            count = int(match.group(2)) if match.group(2) is not None else 1
+            if count == 0:
+                ranges.setdefault(current, []).append((max(start, 1), max(start, 1)))
+            else:
+                ranges.setdefault(current, []).append((start, start + count - 1))
+    return ranges
+
+
+def changed_line_ranges(directory: str, rev: str) -> Dict[str, List[Tuple[int, int]]]:
+    """
+    Lines changed in the working tree since ``rev``.
+
+    Covers committed, staged and unstaged changes to tracked files, plus
+    untracked (not ignored) files, which count as changed in full.
+
+    Args:
+        directory: Scanned directory inside a git repository.
+        rev: Any revision git understands (branch, tag, commit, ``HEAD~3``).
+
+    Returns:
+        Mapping of path relative to ``directory`` to inclusive line ranges;
+        a range of (1, inf) marks a whole file.
+
+    Raises:
+        GitDiffError: If ``directory`` is not in a git repository or ``rev``
+            cannot be resolved.
+    """
+    _run_git(directory, ["rev-parse", "--show-toplevel"])
+    _run_git(
+        directory, ["rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"],
+        error=f"Unknown revision: {rev}"
+    )
+    diff_text = _run_git(
+        directory,
+        ["diff", "--unified=0", "--relative", "--no-color", "--no-ext-diff", rev, "--", "."]
+    )
+    ranges = {
+        os.path.normpath(path): path_ranges
+        for path, path_ranges in parse_diff_ranges(diff_text).items()
+    }
+
+    untracked = _run_git(directory, ["ls-files", "--others", "--exclude-standard"])
+    for path in untracked.splitlines():
+        if path:
+            ranges[os.path.normpath(path)] = [(1, float("inf"))]
+    return ranges
+
+
+def overlaps(ranges: List[Tuple[int, int]], start: int, end: int) -> bool:
+    """True if any range intersects the inclusive span [start, end]."""
+    return any(range_start <= end and start <= range_end for range_start, range_end in ranges)
@@ -0,0 +1,198 @@
+"""Shared HTTP connection pool for all LLM clients."""
+import asyncio
+import threading
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+# httpx 在创建共享客户端时才导入，不发送请求的运行（--help、结果全部命中缓存）不需要它
+if TYPE_CHECKING:
+    import httpx
+
+
+@dataclass(frozen=True)
+class HttpSettings:
+    """Connection pool and timeout settings (``llm.http``)."""
+
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    connect_timeout: float = 5.0
+    read_timeout: float = 600.0
+
+    @classmethod
+    def from_config(cls, config: Any) -> "HttpSettings":
+        """Build settings from the ``llm_http`` dict in Config."""
+        return cls(**config.llm_http)
+
+    def limits(self) -> "httpx.Limits":
+        import httpx
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> "httpx.Timeout":
+        import httpx
+        # write/pool 超时与 read 相同：请求体较小，等待连接池的时间受并发控制
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+
+class ConnectionStats:
+    """
+    Count HTTP requests and newly opened connections.
+
+    Every request whose connection was not opened for it reused a pooled
+    keep-alive connection (or an HTTP/2 stream on an open connection).
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self._lock = threading.Lock()
+
+    @property
+    def reused(self) -> int:
+        """Requests served on an already open connection."""
+        return max(0, self.requests - self.connections_opened)
+
+    def record_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def record_trace(self, event_name: str) -> None:
+        # httpcore 在建立 TCP/Unix 连接后发出 connection.connect_*.complete
+        if event_name.startswith("connection.connect_") and event_name.endswith(".complete"):
+            with self._lock:
+                self.connections_opened += 1
+
+    def summary(self) -> str:
+        """One-line connection reuse summary for the run log."""
+        ratio = self.reused / self.requests if self.requests else 0.0
+        return (
+            f"{self.requests} HTTP requests over {self.connections_opened} connections "
+            f"({self.reused} reused, {ratio:.0%})"
+        )
+
+
+class SharedHttpClient:
+    """
+    One sync and one async httpx client shared by every LLM client.
+
+    Reusing the clients keeps TCP/TLS connections alive across requests,
+    endpoints and BugDetector instances instead of opening a pool per client.
+    The async client is bound to the event loop it was first used in, so it
+    is recreated when a new loop (a new ``asyncio.run``) needs it.
+    """
+
+    def __init__(self, settings: HttpSettings):
+        """
+        Initialize shared clients.
+
+        Args:
+            settings: Pool and timeout settings.
+
+        Raises:
+            ImportError: If http2 is enabled but the 'h2' package is missing.
+        """
+        import httpx
+        self.settings = settings
+        self.stats = ConnectionStats()
+        self.client = httpx.Client(
+            limits=settings.limits(),
+            timeout=settings.timeout(),
+            http2=settings.http2,
+            event_hooks={"request": [self._on_request]},
+        )
+        self._async_client: Optional["httpx.AsyncClient"] = None
+        self._async_loop = None
+        # 换事件循环时被替换的异步客户端的关闭任务（保留引用，避免任务被回收）
+        self._closing = set()
+        self.closed = False
+
+    def async_client(self) -> "httpx.AsyncClient":
+        """Async client for the running event loop."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if self._async_client is None or self._async_loop is not loop:
+            import httpx
+            if self._async_client is not None and loop is not None:
+                task = loop.create_task(_close_stale(self._async_client))
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+            self._async_client = httpx.AsyncClient(
+                limits=self.settings.limits(),
+                timeout=self.settings.timeout(),
+                http2=self.settings.http2,
+                event_hooks={"request": [self._on_async_request]},
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    async def aclose(self) -> None:
+        """Close the async client; call it in the event loop that used the client."""
+        if self._async_client is not None:
+            client, self._async_client, self._async_loop = self._async_client, None, None
+            await client.aclose()
+
+    def close(self) -> None:
+        """
+        Close the sync client and any async client left open.
+
+        Must be called outside a running event loop (at the end of a run).
+        Close the async client with aclose() before its event loop ends;
+        otherwise its connections can only be released best-effort here.
+        """
+        self.closed = True
+        self.client.close()
+        if self._async_client is not None:
+            client, self._async_client, self._async_loop = self._async_client, None, None
+            asyncio.run(_close_stale(client))
+
+    def _on_request(self, request: "httpx.Request") -> None:
+        self.stats.record_request()
+        request.extensions["trace"] = self._trace
+
+    async def _on_async_request(self, request: "httpx.Request") -> None:
+        self.stats.record_request()
+        request.extensions["trace"] = self._async_trace
+
+    def _trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        self.stats.record_trace(event_name)
+
+    async def _async_trace(self, event_name: str, info: Dict[str, Any]) -> None:
+        self.stats.record_trace(event_name)
+
+
+async def _close_stale(client: "httpx.AsyncClient") -> None:
+    """Close an async client whose event loop may already be closed."""
+    try:
+        await client.aclose()
+    except RuntimeError:
+        # 连接绑定的事件循环已关闭，无法正常关闭传输层，套接字随对象回收释放
+        pass
+
+
+_shared_clients: Dict[HttpSettings, SharedHttpClient] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_client(settings: HttpSettings) -> SharedHttpClient:
+    """
+    Return the process-wide shared client for the given settings.
+
+    Args:
+        settings: Pool and timeout settings.
+
+    Returns:
+        SharedHttpClient, created on first use (and again after close()).
+    """
+    with _shared_lock:
+        shared = _shared_clients.get(settings)
+        if shared is None or shared.closed:
+            shared = SharedHttpClient(settings)
+            _shared_clients[settings] = shared
+        return shared
@@ -0,0 +1,72 @@
+"""Incremental detection of a complete top-level JSON object in streamed text."""
+from typing import Optional
+
+
+class JsonObjectScanner:
+    """
+    Track streamed text until the first top-level JSON object is closed.
+
+    Only the structure is tracked (nesting depth, strings and escapes), so
+    feeding a chunk costs O(len(chunk)) and the object is decoded once, by
+    the regular response parser, after the stream is closed. Text before the
+    first ``{`` (such as a markdown code fence) is kept but ignored.
+    """
+
+    def __init__(self):
+        self._parts = []
+        self._length = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._end: Optional[int] = None
+
+    @property
+    def complete(self) -> bool:
+        """True once the top-level object has been closed."""
+        return self._end is not None
+
+    @property
+    def text(self) -> str:
+        """Text received so far, up to the end of the object if complete."""
+        text = "".join(self._parts)
+        return text if self._end is None else text[:self._end]
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Add a chunk of streamed text.
+
+        Args:
+            chunk: Next piece of the response.
+
+        Returns:
+            True if the top-level object is complete.
+        """
+        if self._end is not None or not chunk:
+            return self.complete
+
+        offset = self._length
+        self._parts.append(chunk)
+        self._length += len(chunk)
+
+        for i, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                # 顶层对象开始之前的引号（说明文字）不影响结构
+                if self._depth > 0:
+                    self._in_string = True
+            elif char in "{[":
+                if char == "{" or self._depth > 0:
+                    self._depth += 1
+            elif char in "}]" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._end = offset + i + 1
+                    break
+
+        return self.complete
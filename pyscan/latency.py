@@ -0,0 +1,85 @@
+"""Per-request timeouts and hedging delays for LLM requests."""
+import math
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+
+@dataclass
+class TimeoutPolicy:
+    """
+    Request timeout that grows with the prompt size.
+
+    A request for a large prompt legitimately takes longer, while a small
+    prompt that has not answered after ``base`` seconds is most likely hung.
+    """
+
+    base: float = 60.0
+    per_1k_tokens: float = 10.0
+    max: float = 600.0
+
+    @classmethod
+    def from_config(cls, config: Any) -> "TimeoutPolicy":
+        """Build the policy from Config."""
+        return cls(
+            base=config.detector_timeout_base,
+            per_1k_tokens=config.detector_timeout_per_1k_tokens,
+            max=config.detector_timeout_max,
+        )
+
+    def timeout(self, prompt_tokens: int) -> float:
+        """Timeout in seconds for a request with the given prompt tokens."""
+        return min(self.max, self.base + self.per_1k_tokens * prompt_tokens / 1000)
+
+
+class LatencyTracker:
+    """
+    Sliding window of successful request latencies.
+
+    Used to derive the hedging delay: a request still running after the
+    ``quantile`` latency of recent requests is in the tail and worth hedging.
+    """
+
+    def __init__(
+        self,
+        quantile: float = 0.95,
+        min_delay: float = 2.0,
+        min_samples: int = 20,
+        window: int = 200
+    ):
+        """
+        Initialize latency tracker.
+
+        Args:
+            quantile: Latency quantile after which a request is hedged.
+            min_delay: Lower bound of the hedging delay in seconds.
+            min_samples: Samples needed before hedging starts.
+            window: Number of recent latencies kept.
+        """
+        self.quantile = quantile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.samples: deque = deque(maxlen=window)
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def record(self, seconds: float) -> None:
+        """Record the latency of a successful request."""
+        self.samples.append(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Seconds to wait before sending a hedged duplicate.
+
+        Returns:
+            The delay, or None while there are too few samples.
+        """
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, math.ceil(self.quantile * len(ordered)) - 1)
+        return max(self.min_delay, ordered[index])
+
+    def summary(self) -> str:
+        """One-line hedging summary for the run log."""
+        return f"{self.hedges_sent} hedged requests sent, {self.hedges_won} won"
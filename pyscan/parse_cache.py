@@ -0,0 +1,178 @@
+"""Persistent cache of parsed FunctionInfo lists, keyed by file identity."""
+import dataclasses
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from pyscan.ast_parser import FileStamp, FunctionInfo
+
+
+# 解析结果格式变化（FunctionInfo 字段或提取逻辑）时递增，使旧缓存失效
+PARSE_CACHE_VERSION = 4
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    functions TEXT NOT NULL
+);
+"""
+
+
+def function_to_dict(function: FunctionInfo) -> Dict[str, Any]:
+    """JSON-serializable form of a FunctionInfo."""
+    data = dataclasses.asdict(function)
+    data["calls"] = sorted(function.calls)
+    return data
+
+
+def function_from_dict(data: Dict[str, Any]) -> FunctionInfo:
+    """Rebuild a FunctionInfo serialized by function_to_dict()."""
+    data = dict(data)
+    data["calls"] = set(data.get("calls", []))
+    data["call_sites"] = [tuple(site) for site in data.get("call_sites", [])]
+    return FunctionInfo(**data)
+
+
+class ParseCache:
+    """
+    Parsed functions per file, stored in SQLite.
+
+    A file is looked up by path; the entry is valid when size and mtime
+    match, or, if only the mtime changed (checkout, touch), when the content
+    hash still matches. Valid entries skip reading and parsing the file.
+    """
+
+    FILENAME = "parse_cache.sqlite3"
+
+    def __init__(self, path: Path):
+        """
+        Open (or create) a parse cache database.
+
+        Args:
+            path: SQLite database file.
+        """
+        self.path = Path(path)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 流式扫描时在后台线程中访问
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, file_path: str) -> Optional[List[FunctionInfo]]:
+        """
+        Cached functions of a file, or None if the file changed or is unknown.
+
+        Args:
+            file_path: Path of the Python file.
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, size, mtime_ns, sha256, functions FROM files WHERE path = ?",
+                (file_path,)
+            ).fetchone()
+        if row is None or row[0] != PARSE_CACHE_VERSION or row[1] != stat.st_size:
+            self.misses += 1
+            return None
+
+        version, size, mtime_ns, sha256, functions = row
+        if mtime_ns != stat.st_mtime_ns:
+            # 只有修改时间变化时，比较内容哈希
+            if _file_sha256(file_path) != sha256:
+                self.misses += 1
+                return None
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE files SET mtime_ns = ? WHERE path = ?", (stat.st_mtime_ns, file_path)
+                )
+                self._conn.commit()
+
+        self.hits += 1
+        return [function_from_dict(data) for data in json.loads(functions)]
+
+    def put(self, file_path: str, functions: List[FunctionInfo], stamp: Optional[FileStamp] = None) -> None:
+        """Store the parsed functions of a file (see put_many())."""
+        self.put_many([(file_path, functions, stamp)])
+
+    def put_many(self, entries: Iterable[Tuple[str, List[FunctionInfo], Optional[FileStamp]]]) -> None:
+        """
+        Store the parsed functions of several files in one transaction.
+
+        Args:
+            entries: (file_path, functions, stamp) tuples. ``stamp`` describes
+                the bytes the functions were parsed from
+                (ASTParser.parse_file_stamped); if None, the file is stamped
+                now, which is only correct if it has not changed since.
+                Files that can no longer be read are skipped.
+        """
+        rows = []
+        for file_path, functions, stamp in entries:
+            if stamp is None:
+                try:
+                    stat = os.stat(file_path)
+                    stamp = FileStamp(stat.st_size, stat.st_mtime_ns, _file_sha256(file_path))
+                except OSError:
+                    continue
+            data = json.dumps([function_to_dict(f) for f in functions], ensure_ascii=False)
+            rows.append((file_path, PARSE_CACHE_VERSION, stamp.size, stamp.mtime_ns, stamp.sha256, data))
+        if not rows:
+            return
+        # 每次提交都要同步写盘，逐个文件提交在大项目上会明显拖慢首次扫描
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, version, size, mtime_ns, sha256, functions) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+
+    def retain(self, file_paths: Iterable[str]) -> int:
+        """
+        Drop entries of files that are no longer scanned.
+
+        Args:
+            file_paths: All files of the current scan.
+
+        Returns:
+            Number of dropped entries.
+        """
+        keep = set(file_paths)
+        with self._lock:
+            stale = [
+                (path,) for (path,) in self._conn.execute("SELECT path FROM files")
+                if path not in keep
+            ]
+            self._conn.executemany("DELETE FROM files WHERE path = ?", stale)
+            self._conn.commit()
+        return len(stale)
+
+    def summary(self) -> str:
+        """One-line summary of this session's cache use for the run log."""
+        return f"{self.hits} files loaded from cache, {self.misses} parsed"
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
+
+
+def _file_sha256(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
@@ -0,0 +1,123 @@
+"""Streaming scan → parse pipeline with bounded queues."""
+import logging
+import os
+import queue
+import threading
+from typing import Any, Iterator, List, Optional
+
+from pyscan.ast_parser import ASTParser, FunctionInfo
+from pyscan.scanner import Scanner
+
+
+logger = logging.getLogger(__name__)
+
+# 队列结束标记
+_DONE = object()
+
+
+class StreamingPipeline:
+    """
+    Stream parsed functions file by file while the tree is still being walked.
+
+    A background thread walks the directory and feeds files into
+    ASTParser.parse_files; parsed files are handed to the consumer through a
+    bounded queue. When the consumer (context building and detection) falls
+    behind, the queue fills up, the producer blocks, and parsing and
+    scanning pause with it, so memory stays flat on huge trees.
+    """
+
+    def __init__(
+        self,
+        scanner: Scanner,
+        parser: ASTParser,
+        directory: str,
+        parse_workers: Optional[int] = None,
+        queue_size: int = 64,
+        parse_cache: Optional[Any] = None
+    ):
+        """
+        Initialize streaming pipeline.
+
+        Args:
+            scanner: Scanner used to walk the directory.
+            parser: Parser used for each file.
+            directory: Directory to scan.
+            parse_workers: Number of parse processes (see ASTParser.parse_files).
+            queue_size: Maximum number of parsed files buffered ahead of the consumer.
+            parse_cache: Optional ParseCache for unchanged files.
+        """
+        self.scanner = scanner
+        self.parser = parser
+        self.directory = directory
+        self.parse_workers = parse_workers
+        self.queue_size = queue_size
+        self.parse_cache = parse_cache
+        self.files_scanned = 0
+
+    def iter_batches(self) -> Iterator[List[FunctionInfo]]:
+        """
+        Yield the functions of each parsed file, in scan order.
+
+        ``file_path`` of every function is set relative to the scanned
+        directory. Files that fail to parse are logged and skipped.
+
+        Yields:
+            List of FunctionInfo per file (files without functions are skipped).
+
+        Raises:
+            Exception: Any error raised while scanning the directory.
+        """
+        results: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        scan_dir = os.path.abspath(self.directory)
+
+        def put(item) -> bool:
+            # 带超时的 put，以便消费者提前退出时生产者线程也能结束
+            while not stop.is_set():
+                try:
+                    results.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def produce():
+            try:
+                files = self._count_files(self.scanner.iter_scan(self.directory))
+                for result in self.parser.parse_files(
+                    files, workers=self.parse_workers, cache=self.parse_cache
+                ):
+                    if not put(result):
+                        return
+                put(_DONE)
+            except BaseException as e:
+                put(e)
+
+        producer = threading.Thread(target=produce, name="pyscan-parse", daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                item = results.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+
+                file_path, functions, error = item
+                if error is not None:
+                    logger.error(f"Failed to parse {file_path}: {error}")
+                    continue
+                if not functions:
+                    continue
+                for func in functions:
+                    func.file_path = os.path.relpath(file_path, scan_dir)
+                yield functions
+        finally:
+            stop.set()
+            producer.join(timeout=5)
+
+    def _count_files(self, files: Iterator[str]) -> Iterator[str]:
+        for file_path in files:
+            self.files_scanned += 1
+            yield file_path
@@ -0,0 +1,134 @@
+"""Client-side rate limiting for LLM requests."""
+import asyncio
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at ``rate_per_minute / 60`` per second.
+
+    Reservations are taken immediately and may drive the level negative;
+    the returned delay is how long the caller must wait before the
+    reservation is covered. Later callers therefore queue up behind earlier
+    ones in FIFO order without any locking.
+    """
+
+    def __init__(self, rate_per_minute: float, clock: Callable[[], float] = time.monotonic):
+        """
+        Initialize token bucket.
+
+        Args:
+            rate_per_minute: Budget per minute (also the burst capacity).
+            clock: Monotonic clock in seconds (injectable for tests).
+        """
+        self.capacity = float(rate_per_minute)
+        self.fill_rate = self.capacity / 60.0
+        self.clock = clock
+        self.level = self.capacity
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Reserve ``amount`` from the bucket.
+
+        Args:
+            amount: Amount to reserve. Clipped to the capacity so a single
+                oversized request can still go through once the bucket is full.
+
+        Returns:
+            Seconds to wait before the reservation is covered (0 if available now).
+        """
+        self._refill()
+        self.level -= min(float(amount), self.capacity)
+        if self.level >= 0:
+            return 0.0
+        return -self.level / self.fill_rate
+
+    def adjust(self, delta: float) -> None:
+        """Charge (positive) or refund (negative) ``delta`` after the fact."""
+        self._refill()
+        self.level = min(self.capacity, self.level - delta)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limiter in front of the LLM client."""
+
+    def __init__(
+        self,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize rate limiter.
+
+        Args:
+            rpm: Requests per minute, or None for unlimited.
+            tpm: Tokens per minute, or None for unlimited.
+            clock: Monotonic clock in seconds (injectable for tests).
+        """
+        self.request_bucket = TokenBucket(rpm, clock) if rpm else None
+        self.token_bucket = TokenBucket(tpm, clock) if tpm else None
+
+    @property
+    def enabled(self) -> bool:
+        """True if any budget is configured."""
+        return self.request_bucket is not None or self.token_bucket is not None
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserve one request and ``tokens`` tokens.
+
+        Args:
+            tokens: Estimated token cost of the request.
+
+        Returns:
+            Seconds to wait before sending the request.
+        """
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket is not None:
+            delay = max(delay, self.token_bucket.reserve(tokens))
+        return delay
+
+    def settle(self, estimated_tokens: int, actual_tokens: int) -> None:
+        """
+        Correct the token budget once the real usage of a request is known.
+
+        Args:
+            estimated_tokens: Tokens reserved before sending.
+            actual_tokens: Tokens reported by the API (prompt + completion).
+        """
+        if self.token_bucket is not None:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    def refund(self, tokens: int) -> None:
+        """
+        Return a reservation whose request was never sent.
+
+        Args:
+            tokens: Tokens passed to reserve().
+        """
+        if self.request_bucket is not None:
+            self.request_bucket.adjust(-1)
+        if self.token_bucket is not None:
+            self.token_bucket.adjust(-min(float(tokens), self.token_bucket.capacity))
+
+    def acquire_sync(self, tokens: int) -> None:
+        """Block the current thread until the request fits the budget."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait (without blocking the event loop) until the request fits the budget."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
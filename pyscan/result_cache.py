@@ -0,0 +1,166 @@
+"""Content-addressed cache of LLM results stored in SQLite."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    raw_response TEXT NOT NULL,
+    result TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used);
+"""
+
+
+class ResultCache:
+    """
+    Persistent LLM result cache keyed by everything that determines a response.
+
+    The key is a hash of model, temperature, system prompt and user prompt,
+    so identical requests are answered from disk regardless of progress
+    state (``--force``, changed exclude patterns, fresh checkouts). The cache
+    is capped in size and evicts least recently used entries.
+    """
+
+    FILENAME = "cache.sqlite3"
+
+    def __init__(self, path: Path, max_bytes: Optional[int] = None, clock=time.time):
+        """
+        Open (or create) a cache database.
+
+        Args:
+            path: SQLite database file.
+            max_bytes: Size cap of the stored entries, or None for no cap.
+            clock: Wall clock in seconds (injectable for tests).
+        """
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+
+    @staticmethod
+    def make_key(model: str, temperature: float, system_prompt: str, prompt: str) -> str:
+        """Content hash identifying one LLM request."""
+        digest = hashlib.sha256()
+        for part in (model, repr(temperature), system_prompt, prompt):
+            data = part.encode("utf-8")
+            # 长度前缀避免不同字段拼接后产生相同的内容
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[str, Any]]:
+        """
+        Look up a cached result and mark it as recently used.
+
+        Returns:
+            (raw_response, parsed result), or None on a miss.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT raw_response, result FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute(
+                "UPDATE results SET last_used = ? WHERE key = ?", (self.clock(), key)
+            )
+            self._conn.commit()
+        return row[0], json.loads(row[1])
+
+    def put(self, key: str, raw_response: str, result: Any) -> None:
+        """Store a result, evicting old entries if the cache exceeds its cap."""
+        result_json = json.dumps(result, ensure_ascii=False)
+        size = len(key) + len(raw_response.encode("utf-8")) + len(result_json.encode("utf-8"))
+        now = self.clock()
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT size FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, raw_response, result, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, raw_response, result_json, size, now, now)
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self.max_bytes is not None:
+                self._evict(self.max_bytes)
+            self._conn.commit()
+
+    def prune(self, max_bytes: int) -> int:
+        """
+        Evict least recently used entries until the cache fits ``max_bytes``.
+
+        Returns:
+            Number of evicted entries.
+        """
+        with self._lock:
+            evicted = self._evict(max_bytes)
+            self._conn.commit()
+        if evicted:
+            # 释放被删除记录占用的磁盘空间
+            self._conn.execute("VACUUM")
+        return evicted
+
+    def _evict(self, max_bytes: int) -> int:
+        evicted = 0
+        while self._total_bytes > max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM results ORDER BY last_used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._total_bytes <= max_bytes:
+                    break
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                self._total_bytes -= size
+                evicted += 1
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count, stored size and this session's hits/misses."""
+        with self._lock:
+            entries, oldest, newest = self._conn.execute(
+                "SELECT COUNT(*), MIN(created_at), MAX(last_used) FROM results"
+            ).fetchone()
+        return {
+            "entries": entries,
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "oldest": oldest,
+            "last_used": newest,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def summary(self) -> str:
+        """One-line summary of this session's cache use for the run log."""
+        lookups = self.hits + self.misses
+        rate = self.hits / lookups if lookups else 0.0
+        return f"{self.hits} hits, {self.misses} misses ({rate:.0%} hit rate)"
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self._conn.close()
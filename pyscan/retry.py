@@ -0,0 +1,211 @@
+"""Retry classification and backoff for LLM requests."""
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+from pyscan import durations
+
+
+# 错误分类
+RATE_LIMIT = "rate_limit"
+SERVER_ERROR = "server_error"
+TIMEOUT = "timeout"
+PARSE_ERROR = "parse_error"
+OTHER = "other"
+
+ERROR_CLASSES = (RATE_LIMIT, SERVER_ERROR, TIMEOUT, PARSE_ERROR, OTHER)
+
+# 响应头中表示重置时间的字段（OpenAI 及兼容网关）
+_RESET_HEADERS = (
+    "x-ratelimit-reset-requests",
+    "x-ratelimit-reset-tokens",
+    "x-ratelimit-reset",
+)
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Classify a failed LLM request.
+
+    Args:
+        error: Exception raised by the request or by response parsing.
+
+    Returns:
+        One of RATE_LIMIT, SERVER_ERROR, TIMEOUT, PARSE_ERROR, OTHER.
+    """
+    # 延迟导入：只有请求失败时才需要 openai 的异常类型
+    from openai import APIConnectionError, APITimeoutError, RateLimitError
+
+    if isinstance(error, (APITimeoutError, asyncio.TimeoutError, TimeoutError)):
+        return TIMEOUT
+    if isinstance(error, RateLimitError):
+        return RATE_LIMIT
+
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        return RATE_LIMIT
+    if isinstance(status_code, int) and status_code >= 500:
+        return SERVER_ERROR
+    if isinstance(error, APIConnectionError):
+        # 连接被重置等瞬时网络错误，按服务端错误处理
+        return SERVER_ERROR
+
+    if isinstance(error, ValueError):
+        return PARSE_ERROR
+
+    return OTHER
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """
+    Parse a reset duration header value into seconds.
+
+    Accepts plain seconds ("20", "1.5"), Go-style durations used by OpenAI
+    ("6m0s", "20ms", "1h2m") and HTTP dates.
+    """
+    value = value.strip()
+    if not value:
+        return None
+
+    try:
+        return max(0.0, durations.parse_duration(value))
+    except ValueError:
+        pass
+
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """
+    Extract the server-requested wait time from an error's response headers.
+
+    Honors ``retry-after-ms``, ``Retry-After`` and ``x-ratelimit-reset*``.
+
+    Args:
+        error: Exception raised by the request.
+
+    Returns:
+        Seconds to wait, or None if the server gave no hint.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        seconds = _parse_duration(retry_after)
+        if seconds is not None:
+            return seconds
+
+    waits = []
+    for name in _RESET_HEADERS:
+        value = headers.get(name)
+        if value:
+            seconds = _parse_duration(value)
+            if seconds is not None:
+                # x-ratelimit-reset 有时是 Unix 时间戳
+                if seconds > 10 ** 9:
+                    seconds = max(0.0, seconds - time.time())
+                waits.append(seconds)
+    return max(waits) if waits else None
+
+
+class RetryPolicy:
+    """
+    Per-error-class retry budgets with exponential backoff and jitter.
+
+    Each class gets its own budget: the number of failures of that class
+    tolerated for one request before giving up. Classes without an explicit
+    budget fall back to ``default_budget`` (detector.max_retries).
+    """
+
+    def __init__(
+        self,
+        default_budget: int,
+        budgets: Optional[Dict[str, int]] = None,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+        rng: Callable[[], float] = random.random
+    ):
+        """
+        Initialize retry policy.
+
+        Args:
+            default_budget: Budget for classes not listed in ``budgets``.
+            budgets: Mapping of error class to budget.
+            base_delay: Delay of the first retry in seconds.
+            max_delay: Upper bound of the computed backoff in seconds.
+            rng: Uniform [0, 1) random source (injectable for tests).
+        """
+        self.default_budget = default_budget
+        self.budgets = dict(budgets or {})
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng
+
+    @classmethod
+    def from_config(cls, config: Any) -> "RetryPolicy":
+        """Build a policy from Config.detector_retry_* settings."""
+        return cls(
+            default_budget=config.detector_max_retries,
+            budgets=config.detector_retry_budgets,
+            base_delay=config.detector_retry_base_delay,
+            max_delay=config.detector_retry_max_delay,
+        )
+
+    def budget(self, error_class: str) -> int:
+        """Return the failure budget for an error class."""
+        return self.budgets.get(error_class, self.default_budget)
+
+    def backoff(self, failures: int) -> float:
+        """
+        Exponential backoff with equal jitter.
+
+        Args:
+            failures: Number of failures so far for this class (>= 1).
+
+        Returns:
+            Delay in seconds, in [d/2, d) where d = min(max_delay, base * 2^(failures-1)).
+        """
+        delay = min(self.max_delay, self.base_delay * (2 ** (failures - 1)))
+        return delay / 2 + self.rng() * delay / 2
+
+    def next_delay(self, error: BaseException, failures: Dict[str, int]) -> Optional[float]:
+        """
+        Record a failure and compute how long to wait before retrying.
+
+        Args:
+            error: Exception raised by the attempt.
+            failures: Per-class failure counters for the current request,
+                updated in place.
+
+        Returns:
+            Seconds to wait before the next attempt, or None if the budget
+            of the error's class is exhausted.
+        """
+        error_class = classify_error(error)
+        failures[error_class] = failures.get(error_class, 0) + 1
+
+        if failures[error_class] >= self.budget(error_class):
+            return None
+
+        delay = self.backoff(failures[error_class])
+        server_hint = retry_after_seconds(error)
+        if server_hint is not None:
+            # 服务端给出的等待时间优先，加少量抖动避免并发请求同时重试
+            delay = server_hint + self.rng() * self.base_delay
+        return delay
@@ -1,7 +1,7 @@
 """Code scanner module."""
 import os
 from pathlib import Path
-from typing import List
+from typing import Iterator, List
 from fnmatch import fnmatch
 
 
@@ -27,6 +27,21 @@ class Scanner:
         Returns:
             List of absolute paths to Python files.
 
+        Raises:
+            FileNotFoundError: If directory does not exist.
+        """
+        return list(self.iter_scan(directory))
+
+    def iter_scan(self, directory: str) -> Iterator[str]:
+        """
+        Lazily yield Python files under directory, in the same order as scan().
+
+        Args:
+            directory: Directory path to scan.
+
+        Yields:
+            Absolute paths to Python files.
+
         Raises:
             FileNotFoundError: If directory does not exist.
         """
@@ -38,8 +53,6 @@ class Scanner:
         if not dir_path.is_dir():
             raise ValueError(f"Path is not a directory: {directory}")
 
-        python_files = []
-
         for root, dirs, files in os.walk(dir_path):
             # 过滤目录
             dirs[:] = [
@@ -51,9 +64,7 @@ class Scanner:
                 if file.endswith('.py'):
                     file_path = Path(root) / file
                     if not self._should_exclude(file_path):
-                        python_files.append(str(file_path.absolute()))
-
-        return python_files
+                        yield str(file_path.absolute())
 
     def _should_exclude(self, path: Path) -> bool:
         """
@@ -1,7 +1,9 @@
 """Tests for AST parser module."""
+import time
+
 import pytest
 from pathlib import Path
-from pyscan.ast_parser import ASTParser, FunctionInfo
+from pyscan.ast_parser import ASTParser, FunctionInfo, FunctionVisitor
 
 
 class TestASTParser:
@@ -57,6 +59,29 @@ class TestASTParser:
         assert "self" in add_method.args
         assert "add" in multiply_method.calls  # 调用 self.add
 
+    def test_duplicate_qualname_occurrence(self, tmp_path):
+        """测试限定名相同的函数按出现顺序编号。"""
+        code_file = tmp_path / "dup.py"
+        code_file.write_text(
+            "def outer_a():\n"
+            "    def wrapper():\n"
+            "        pass\n"
+            "\n"
+            "def outer_b():\n"
+            "    def wrapper():\n"
+            "        pass\n"
+            "\n"
+            "class Box:\n"
+            "    def wrapper(self):\n"
+            "        pass\n"
+        )
+
+        functions = ASTParser().parse_file(str(code_file))
+
+        assert [(f.qualname, f.occurrence) for f in functions] == [
+            ("outer_a", 0), ("wrapper", 0), ("outer_b", 0), ("wrapper", 1), ("Box.wrapper", 0)
+        ]
+
     def test_async_function(self, sample_code_path):
         """测试 async 函数。"""
         parser = ASTParser()
@@ -132,3 +157,128 @@ def callable_param(callback: Callable[[int, str], None], data: List[int]):
         assert "Callable" in callable_func.arg_types["callback"]
         assert "data" in callable_func.arg_types
         assert "List" in callable_func.arg_types["data"]
+
+    def test_parse_files_parallel_order(self, tmp_path):
+        """测试并行解析结果顺序与输入顺序一致。"""
+        paths = []
+        for i in range(12):
+            code_file = tmp_path / f"mod_{i}.py"
+            code_file.write_text(f"def func_{i}(x):\n    return x + {i}\n")
+            paths.append(str(code_file))
+        bad_file = tmp_path / "bad.py"
+        bad_file.write_text("def broken(:\n")
+        paths.insert(5, str(bad_file))
+
+        parser = ASTParser()
+        serial = list(parser.parse_files(paths, workers=1))
+        parallel = list(parser.parse_files(paths, workers=3, chunksize=2))
+
+        assert [r[0] for r in parallel] == paths
+        assert [[f.name for f in r[1]] for r in parallel] == [[f.name for f in r[1]] for r in serial]
+        assert parallel[5][1] == []
+        assert parallel[5][2] is not None
+        assert parallel[0][1][0].name == "func_0"
+
+    def test_qualified_calls(self, tmp_path):
+        """测试根据导入和所在类解析调用目标。"""
+        code_file = tmp_path / "mod.py"
+        code_file.write_text(
+            "import requests\n"
+            "import pkg.utils as u\n"
+            "from .models import Model\n"
+            "from . import helpers\n"
+            "\n"
+            "def top(obj):\n"
+            "    helper()\n"
+            "    requests.get('x')\n"
+            "    u.load()\n"
+            "    helpers.run()\n"
+            "    Model.create()\n"
+            "    obj.save()\n"
+            "\n"
+            "class Store:\n"
+            "    def get(self):\n"
+            "        return self.load()\n"
+            "\n"
+            "    def load(self):\n"
+            "        return Store.build()\n"
+        )
+
+        functions = {f.qualname: f for f in ASTParser().parse_file(str(code_file))}
+
+        assert set(functions) == {"top", "Store.get", "Store.load"}
+        top = functions["top"].qualified_calls
+        assert top["helper"] == [":helper"]
+        assert top["get"] == ["requests:get"]
+        assert top["load"] == ["pkg.utils:load"]
+        assert top["run"] == [".helpers:run", ".:helpers.run"]
+        assert top["create"] == [".models.Model:create", ".models:Model.create"]
+        assert top["save"] == ["?"]
+        assert functions["Store.get"].qualified_calls == {"load": [":Store.load"]}
+        assert functions["Store.load"].qualified_calls == {"build": [":Store.build"]}
+
+    def test_call_sites(self, tmp_path):
+        """测试记录每个调用点的位置，包括多行调用。"""
+        code_file = tmp_path / "mod.py"
+        code_file.write_text(
+            "def caller(x):\n"
+            "    a = helper(x)\n"
+            "    return helper(\n"
+            "        x,\n"
+            "        other(a),\n"
+            "    )\n"
+        )
+
+        func = ASTParser().parse_file(str(code_file))[0]
+
+        assert func.call_sites == [
+            ("helper", 2, 8, 2, 17),
+            ("helper", 3, 11, 6, 5),
+            ("other", 5, 8, 5, 16),
+        ]
+
+
+class TestNestedFunctionsBenchmark:
+    """Benchmark extraction on deeply nested functions (decorator factories, closures)."""
+
+    DEPTH = 90
+
+    @pytest.fixture
+    def nested_code_path(self, tmp_path):
+        """生成 DEPTH 层嵌套的函数，每层带一个装饰器调用和一个函数体调用。"""
+        lines = []
+        for level in range(self.DEPTH):
+            indent = "    " * level
+            lines.append(f"{indent}@decorate_{level}()")
+            lines.append(f"{indent}def level_{level}(x):")
+            lines.append(f"{indent}    step_{level}(x)")
+        lines.append("    " * self.DEPTH + "return x")
+        code_file = tmp_path / "nested.py"
+        code_file.write_text("\n".join(lines) + "\n")
+        return str(code_file)
+
+    def test_single_traversal(self, nested_code_path, monkeypatch):
+        """测试每个调用节点只访问一次，并归属到包含它的所有函数。"""
+        visited = []
+        visit_call = FunctionVisitor.visit_Call
+
+        def counting_visit_call(visitor, node):
+            visited.append(node)
+            return visit_call(visitor, node)
+
+        monkeypatch.setattr(FunctionVisitor, "visit_Call", counting_visit_call)
+        start = time.perf_counter()
+        functions = ASTParser().parse_file(nested_code_path)
+        elapsed = time.perf_counter() - start
+
+        # 逐函数重新遍历子树时调用节点会被访问 DEPTH * (DEPTH + 1) 次
+        assert len(visited) == 2 * self.DEPTH, (
+            f"{len(visited)} call visits, parsed {self.DEPTH} nested functions in {elapsed * 1000:.1f} ms"
+        )
+        assert [f.name for f in functions] == [f"level_{i}" for i in range(self.DEPTH)]
+        for level, func in enumerate(functions):
+            expected = {f"step_{i}" for i in range(level, self.DEPTH)}
+            expected |= {f"decorate_{i}" for i in range(level, self.DEPTH)}
+            assert func.calls == expected
+            assert [site[0] for site in func.call_sites][:2] == [f"decorate_{level}", f"step_{level}"]
+
@@ -0,0 +1,158 @@
+"""Tests for offline batch-job mode."""
+import json
+
+import pytest
+from pyscan.batch_job import batch_custom_id, read_batch_results
+from pyscan.cli import main
+
+
+def make_result(custom_id, content=None, status_code=200, error=None):
+    """构造一条批处理结果记录（OpenAI Batch API 输出格式）。"""
+    body = {
+        "choices": [{"message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 20, "total_tokens": 120},
+    }
+    return {
+        "id": f"batch_req_{custom_id}",
+        "custom_id": custom_id,
+        "response": None if error else {"status_code": status_code, "body": body},
+        "error": error,
+    }
+
+
+class TestBatchResults:
+    """Test batch result parsing."""
+
+    def test_custom_id_is_stable(self):
+        """测试 custom_id 只取决于函数 ID。"""
+        assert batch_custom_id("a.py::f") == batch_custom_id("a.py::f")
+        assert batch_custom_id("a.py::f") != batch_custom_id("a.py::g")
+
+    def test_read_results(self, tmp_path):
+        """测试读取成功、HTTP 错误和请求错误条目。"""
+        results_file = tmp_path / "results.jsonl"
+        records = [
+            make_result("ok", content='{"has_bug": false}'),
+            make_result("http", content="", status_code=500),
+            make_result("err", error={"code": "expired", "message": "batch expired"}),
+        ]
+        results_file.write_text("\n".join(json.dumps(r) for r in records) + "\n\n")
+
+        results = list(read_batch_results(results_file))
+
+        assert [r.custom_id for r in results] == ["ok", "http", "err"]
+        assert results[0].content == '{"has_bug": false}'
+        assert results[0].usage["prompt_tokens"] == 100
+        assert results[1].error == "HTTP 500"
+        assert results[2].error == "batch expired"
+
+    def test_invalid_line(self, tmp_path):
+        """测试非法 JSON 行。"""
+        results_file = tmp_path / "results.jsonl"
+        results_file.write_text("not json\n")
+
+        with pytest.raises(ValueError, match="invalid JSON"):
+            list(read_batch_results(results_file))
+
+
+class TestBatchCommands:
+    """Test submit-batch / ingest-batch commands."""
+
+    @pytest.fixture
+    def project(self, tmp_path):
+        """创建待扫描项目和配置文件。"""
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "calc.py").write_text(
+            "def divide(a, b):\n"
+            "    return a / b\n"
+            "\n"
+            "def average(items):\n"
+            "    return divide(sum(items), len(items))\n"
+        )
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  base_url: "https://api.openai.com/v1"
+  api_key: "sk-test-key"
+  model: "gpt-4"
+
+scan:
+  parse_workers: 1
+""")
+        return src, config_file
+
+    def test_submit_and_ingest(self, tmp_path, project):
+        """测试提交生成请求文件，导入伪造的结果文件后更新进度和报告。"""
+        src, config_file = project
+        requests_file = tmp_path / "requests.jsonl"
+        main(["submit-batch", str(src), "-c", str(config_file), "-o", str(requests_file)])
+
+        requests = [json.loads(line) for line in requests_file.read_text().splitlines()]
+        assert len(requests) == 2
+        assert all(r["url"] == "/v1/chat/completions" for r in requests)
+        assert requests[0]["body"]["model"] == "gpt-4"
+        assert "def divide" in requests[0]["body"]["messages"][1]["content"]
+
+        bug = {
+            "has_bug": True, "severity": "medium",
+            "bugs": [{"type": "ZeroDivisionError", "description": "b 可能为 0", "start_line": 2, "end_line": 2}]
+        }
+        results_file = tmp_path / "results.jsonl"
+        results_file.write_text("\n".join([
+            json.dumps(make_result(requests[0]["custom_id"], content=json.dumps(bug))),
+            json.dumps(make_result(requests[1]["custom_id"], content="", status_code=500)),
+        ]))
+        report_file = tmp_path / "report.json"
+        main(["ingest-batch", str(src), str(results_file), "-c", str(config_file), "-o", str(report_file)])
+
+        progress = json.loads((src / ".pyscan" / "progress.json").read_text())
+        assert progress["completed_functions"] == ["calc.py::divide"]
+        reports = json.loads((src / ".pyscan" / "reports.json").read_text())
+        assert [r["function_name"] for r in reports] == ["divide"]
+        assert reports[0]["bug_id"] == "BUG_0001"
+        assert reports[0]["function_start_line"] == 1
+        assert report_file.exists()
+
+        # 再次提交只包含未完成的函数，custom_id 保持不变
+        main(["submit-batch", str(src), "-c", str(config_file), "-o", str(requests_file)])
+        resubmitted = [json.loads(line) for line in requests_file.read_text().splitlines()]
+        assert [r["custom_id"] for r in resubmitted] == [requests[1]["custom_id"]]
+
+    def test_same_name_methods_get_distinct_ids(self, tmp_path, project):
+        """测试同一文件中的同名方法生成不同的 custom_id，结果分别导入。"""
+        src, config_file = project
+        (src / "calc.py").write_text(
+            "class Reader:\n"
+            "    def run(self):\n"
+            "        return 1\n"
+            "\n"
+            "class Writer:\n"
+            "    def run(self):\n"
+            "        return 2\n"
+        )
+        requests_file = tmp_path / "requests.jsonl"
+        main(["submit-batch", str(src), "-c", str(config_file), "-o", str(requests_file)])
+
+        requests = [json.loads(line) for line in requests_file.read_text().splitlines()]
+        assert len({r["custom_id"] for r in requests}) == 2
+
+        no_bug = json.dumps({"has_bug": False, "severity": "low", "bugs": []})
+        results_file = tmp_path / "results.jsonl"
+        results_file.write_text("\n".join(
+            json.dumps(make_result(r["custom_id"], content=no_bug)) for r in requests
+        ))
+        main(["ingest-batch", str(src), str(results_file), "-c", str(config_file),
+              "-o", str(tmp_path / "report.json")])
+
+        progress = json.loads((src / ".pyscan" / "progress.json").read_text())
+        assert sorted(progress["completed_functions"]) == ["calc.py::Reader.run", "calc.py::Writer.run"]
+
+    def test_ingest_without_submit(self, tmp_path, project):
+        """测试未提交过批处理时导入报错退出。"""
+        src, config_file = project
+        results_file = tmp_path / "results.jsonl"
+        results_file.write_text("")
+
+        with pytest.raises(SystemExit):
+            main(["ingest-batch", str(src), str(results_file), "-c", str(config_file)])
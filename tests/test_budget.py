@@ -0,0 +1,96 @@
+"""Tests for budget module."""
+import pytest
+from pyscan.budget import ScanBudget, parse_duration
+
+
+class FakeClock:
+    """可手动推进的时钟。"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestParseDuration:
+    """Test parse_duration function."""
+
+    def test_valid_durations(self):
+        """测试合法时长格式。"""
+        assert parse_duration("90") == 90
+        assert parse_duration("45s") == 45
+        assert parse_duration("30m") == 1800
+        assert parse_duration("2h") == 7200
+        assert parse_duration("1h30m") == 5400
+        assert parse_duration("1m30s") == 90
+        assert parse_duration("500ms") == 0.5
+
+    def test_invalid_durations(self):
+        """测试非法时长格式。"""
+        with pytest.raises(ValueError):
+            parse_duration("soon")
+        with pytest.raises(ValueError):
+            parse_duration("0")
+        for value in ("nan", "inf", "1e3", "-5", "9" * 400):
+            with pytest.raises(ValueError):
+                parse_duration(value)
+
+
+class TestScanBudget:
+    """Test ScanBudget class."""
+
+    def test_unlimited(self):
+        """测试未设置预算时不限制。"""
+        budget = ScanBudget()
+        budget.record({"prompt_tokens": 10 ** 9, "completion_tokens": 10 ** 9})
+
+        assert budget.exceeded_reason(10 ** 6) is None
+
+    def test_prompt_token_budget_counts_in_flight(self):
+        """测试 prompt token 预算包含进行中请求的预估值。"""
+        budget = ScanBudget(max_prompt_tokens=1000)
+
+        assert budget.exceeded_reason(400) is None
+        budget.reserve(400)
+        assert budget.exceeded_reason(400) is None
+        budget.reserve(400)
+        assert "prompt token" in budget.exceeded_reason(400)
+
+        # 按实际 usage 结算后预算释放
+        budget.settle(400, {"prompt_tokens": 100, "completion_tokens": 50})
+        assert budget.exceeded_reason(400) is None
+        assert budget.prompt_tokens == 100
+
+    def test_cost_budget(self):
+        """测试成本预算。"""
+        budget = ScanBudget(max_cost=0.10, prompt_price_per_1k=0.01, completion_price_per_1k=0.03)
+        budget.record({"prompt_tokens": 4000, "completion_tokens": 1000})
+
+        assert budget.cost == pytest.approx(0.07)
+        assert budget.exceeded_reason(2000) is None
+        assert "cost" in budget.exceeded_reason(4000)
+
+    def test_deadline(self):
+        """测试截止时间。"""
+        clock = FakeClock()
+        budget = ScanBudget(deadline_seconds=60, clock=clock)
+
+        assert budget.exceeded_reason() is None
+        clock.now = 61
+        assert budget.exceeded_reason() == "deadline reached"
+
+    def test_cached_tokens(self):
+        """测试命中前缀缓存的 token 按缓存价格计费，并统计命中率和节省金额。"""
+        budget = ScanBudget(
+            prompt_price_per_1k=0.01,
+            completion_price_per_1k=0.03,
+            cached_prompt_price_per_1k=0.005
+        )
+        budget.record({"prompt_tokens": 4000, "completion_tokens": 1000, "cached_tokens": 3000})
+
+        assert budget.cost == pytest.approx(0.01 + 0.015 + 0.03)
+        assert budget.cache_hit_rate == pytest.approx(0.75)
+        assert budget.cache_savings == pytest.approx(0.015)
+        assert "75.0% hit rate" in budget.summary()
+        assert "saved 0.0150" in budget.summary()
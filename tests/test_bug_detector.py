@@ -247,3 +247,459 @@ detector:
         assert 'result = test_func' in bug_report.callers[0]['code_snippet']
         assert len(bug_report.inferred_callers) == 1
         assert bug_report.inferred_callers[0]['hint'] == '(推断): @decorator装饰器'
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_detect_async(self, mock_async_openai, mock_config, sample_function):
+        """测试异步检测与同步检测返回相同结构。"""
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        mock_client = Mock()
+        mock_async_openai.return_value = mock_client
+        mock_client.chat.completions.create = AsyncMock(return_value=Mock(
+            choices=[
+                Mock(
+                    message=Mock(
+                        content='{"has_bug": true, "severity": "low", "bugs": [{"type": "LogicError", "description": "逻辑错误", "start_line": 2}]}'
+                    )
+                )
+            ]
+        ))
+
+        detector = BugDetector(mock_config)
+        context = {
+            "current_function": sample_function.code,
+            "callers": [],
+            "is_public_api": False,
+            "inferred_callers": []
+        }
+
+        result = asyncio.run(detector.detect_async(sample_function, context, bug_id_start=5))
+
+        assert result is not None
+        assert len(result["reports"]) == 1
+        assert result["reports"][0].bug_id == "BUG_0005"
+        assert result["reports"][0].start_line == 2
+
+    @patch('pyscan.bug_detector.time.sleep')
+    @patch('pyscan.bug_detector.OpenAI')
+    def test_retry_honors_retry_after(
+        self, mock_openai, mock_sleep, mock_config, sample_function
+    ):
+        """测试 429 重试时遵循 Retry-After。"""
+        class RateLimited(Exception):
+            status_code = 429
+            response = Mock(headers={"retry-after": "20"})
+
+        mock_client = Mock()
+        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create.side_effect = [
+            RateLimited("Too Many Requests"),
+            Mock(
+                choices=[
+                    Mock(
+                        message=Mock(
+                            content='{"has_bug": false, "severity": "low", "bugs": []}'
+                        )
+                    )
+                ]
+            )
+        ]
+
+        detector = BugDetector(mock_config)
+        context = {
+            "current_function": sample_function.code,
+            "callers": [],
+            "is_public_api": False,
+            "inferred_callers": []
+        }
+
+        result = detector.detect(sample_function, context)
+
+        assert result is not None
+        assert mock_sleep.call_count == 1
+        assert mock_sleep.call_args[0][0] >= 20
+
+    @patch('pyscan.bug_detector.time.sleep')
+    @patch('pyscan.bug_detector.OpenAI')
+    def test_failover_to_second_endpoint(
+        self, mock_openai, mock_sleep, tmp_path, sample_function
+    ):
+        """测试端点返回 5xx 时立即切换到另一个端点。"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  model: "gpt-4"
+  endpoints:
+    - base_url: "https://gw-a/v1"
+      api_key: "sk-a"
+    - base_url: "https://gw-b/v1"
+      api_key: "sk-b"
+      model: "gpt-4o"
+""")
+        config = Config.from_file(str(config_file))
+
+        class ServerError(Exception):
+            status_code = 503
+
+        client_a, client_b = Mock(), Mock()
+        mock_openai.side_effect = [client_a, client_b]
+        client_a.chat.completions.create.side_effect = ServerError("Service Unavailable")
+        client_b.chat.completions.create.return_value = Mock(
+            choices=[
+                Mock(
+                    message=Mock(
+                        content='{"has_bug": false, "severity": "low", "bugs": []}'
+                    )
+                )
+            ]
+        )
+
+        detector = BugDetector(config)
+        context = {
+            "current_function": sample_function.code,
+            "callers": [],
+            "is_public_api": False,
+            "inferred_callers": []
+        }
+
+        result = detector.detect(sample_function, context)
+
+        assert result is not None
+        assert client_b.chat.completions.create.call_args.kwargs["model"] == "gpt-4o"
+        assert mock_sleep.call_args[0][0] == 0
+
+    @patch('pyscan.bug_detector.OpenAI')
+    def test_detect_batch_splits_results(self, mock_openai, mock_config):
+        """测试批量检测按函数 ID 拆分结果，行号保持相对各自函数。"""
+        from pyscan.detection_engine import DetectionJob
+
+        mock_client = Mock()
+        mock_openai.return_value = mock_client
+        mock_response = Mock()
+        mock_response.choices = [Mock(message=Mock(content='''{"results": {
+            "f1": {"has_bug": false, "severity": "low", "bugs": []},
+            "f2": {"has_bug": true, "severity": "medium", "bugs": [{"type": "IndexError", "description": "越界", "start_line": 2, "end_line": 2}]}
+        }}'''))]
+        mock_response.usage = Mock(prompt_tokens=500, completion_tokens=80, total_tokens=580)
+        mock_client.chat.completions.create.return_value = mock_response
+
+        jobs = []
+        for name, lineno in [("first", 10), ("second", 40)]:
+            code = f"def {name}(items):\n    return items[0]"
+            func = FunctionInfo(
+                name=name, args=["items"], lineno=lineno, end_lineno=lineno + 1,
+                col_offset=0, end_col_offset=0, code=code
+            )
+            jobs.append(DetectionJob(
+                function=func,
+                context={"current_function": code, "callers": [], "is_public_api": False},
+                file_path="mod.py",
+                estimated_tokens=20
+            ))
+
+        detector = BugDetector(mock_config)
+        results = detector.detect_batch(jobs)
+
+        assert mock_client.chat.completions.create.call_count == 1
+        prompt = mock_client.chat.completions.create.call_args.kwargs["messages"][1]["content"]
+        assert "## 函数 f1" in prompt and "## 函数 f2" in prompt
+        # 每个函数的行号都从 1 开始
+        assert prompt.count("  1 | def ") == 2
+
+        assert results[0]["reports"] == []
+        report = results[1]["reports"][0]
+        assert report.function_name == "second"
+        assert report.function_start_line == 40
+        assert report.start_line == 2
+        assert report.file_path == "mod.py"
+        # 整批用量只计入第一个结果
+        assert results[0]["usage"]["prompt_tokens"] == 500
+        assert results[1]["usage"]["prompt_tokens"] == 0
+
+    @patch('pyscan.bug_detector.OpenAI')
+    def test_detect_batch_missing_function_falls_back(self, mock_openai, mock_config, sample_function):
+        """测试批量响应缺少某个函数时单独检测该函数。"""
+        from pyscan.detection_engine import DetectionJob
+
+        mock_client = Mock()
+        mock_openai.return_value = mock_client
+        batch_response = Mock()
+        batch_response.choices = [Mock(message=Mock(
+            content='{"results": {"f1": {"has_bug": false, "severity": "low", "bugs": []}}}'
+        ))]
+        single_response = Mock()
+        single_response.choices = [Mock(message=Mock(
+            content='{"has_bug": false, "severity": "low", "bugs": []}'
+        ))]
+        mock_client.chat.completions.create.side_effect = [batch_response, single_response]
+
+        context = {"current_function": sample_function.code, "callers": [], "is_public_api": False}
+        jobs = [DetectionJob(function=sample_function, context=context) for _ in range(2)]
+
+        detector = BugDetector(mock_config)
+        results = detector.detect_batch(jobs)
+
+        assert mock_client.chat.completions.create.call_count == 2
+        assert results[0]["raw_response"] == batch_response.choices[0].message.content
+        assert results[1]["raw_response"] == single_response.choices[0].message.content
+
+    @staticmethod
+    def _stream(texts, usage=None):
+        """构造模拟的流式响应。"""
+        class FakeStream:
+            def __init__(self):
+                self.closed = False
+                self.consumed = 0
+
+            def __iter__(self):
+                for text in texts:
+                    self.consumed += 1
+                    yield Mock(choices=[Mock(delta=Mock(content=text))], usage=None)
+                yield Mock(choices=[], usage=usage)
+
+            def close(self):
+                self.closed = True
+
+        return FakeStream()
+
+    @patch('pyscan.bug_detector.OpenAI')
+    def test_stream_stops_when_object_complete(self, mock_openai, mock_config, sample_function):
+        """测试流式模式在 JSON 对象完整后立即关闭流。"""
+        mock_config.llm_stream = True
+        mock_client = Mock()
+        mock_openai.return_value = mock_client
+        stream = self._stream(['{"has_bug": false,', ' "severity": "low", "bugs": []}', "多余的说明"] * 3)
+        mock_client.chat.completions.create.return_value = stream
+
+        detector = BugDetector(mock_config)
+        context = {"current_function": sample_function.code, "callers": [], "is_public_api": False}
+        result = detector.detect(sample_function, context, estimated_tokens=50)
+
+        assert result["reports"] == []
+        assert result["raw_response"] == '{"has_bug": false, "severity": "low", "bugs": []}'
+        assert stream.consumed == 2
+        assert stream.closed
+        assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+        # 提前关闭时按估算计入用量
+        assert result["usage"]["completion_tokens"] == 2
+
+    @patch('pyscan.bug_detector.OpenAI')
+    def test_stream_output_budget(self, mock_openai, mock_config, sample_function):
+        """测试超过单函数输出预算的响应被截断并按解析错误重试。"""
+        mock_config.llm_stream = True
+        mock_config.llm_output_tokens_per_function = 5
+        mock_config.detector_retry_budgets = {"parse_error": 1}
+        mock_client = Mock()
+        mock_openai.return_value = mock_client
+        stream = self._stream(['{"has_bug": true, "bugs": ['] + ['{"type": "x"}, '] * 50)
+        mock_client.chat.completions.create.return_value = stream
+
+        detector = BugDetector(mock_config)
+        context = {"current_function": sample_function.code, "callers": [], "is_public_api": False}
+        result = detector.detect(sample_function, context)
+
+        assert result is None
+        assert stream.consumed == 5
+        assert mock_client.chat.completions.create.call_args.kwargs["max_tokens"] == 5
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_hedged_request_wins(self, mock_async_openai, tmp_path, sample_function):
+        """测试慢请求超过对冲延迟后向另一端点发送重复请求，先返回者胜出。"""
+        import asyncio
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  model: "gpt-4"
+  endpoints:
+    - base_url: "https://gw-a/v1"
+      api_key: "sk-a"
+    - base_url: "https://gw-b/v1"
+      api_key: "sk-b"
+
+detector:
+  hedge:
+    enabled: true
+    min_delay: 0.01
+    min_samples: 1
+""")
+        config = Config.from_file(str(config_file))
+        slow_cancelled = []
+
+        def make_client(delay, content):
+            async def create(**kwargs):
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    slow_cancelled.append(kwargs["model"])
+                    raise
+                return Mock(choices=[Mock(message=Mock(content=content))])
+            client = Mock()
+            client.chat.completions.create = create
+            return client
+
+        clients = {
+            "https://gw-a/v1": make_client(5, '{"has_bug": false, "bugs": []}'),
+            "https://gw-b/v1": make_client(0, '{"has_bug": false, "severity": "low", "bugs": []}'),
+        }
+        mock_async_openai.side_effect = lambda **kwargs: clients[kwargs["base_url"]]
+
+        detector = BugDetector(config)
+        detector.latency.record(0.01)
+        context = {"current_function": sample_function.code, "callers": [], "is_public_api": False}
+
+        result = asyncio.run(detector.detect_async(sample_function, context))
+
+        assert result["raw_response"] == '{"has_bug": false, "severity": "low", "bugs": []}'
+        assert detector.latency.hedges_sent == 1
+        assert detector.latency.hedges_won == 1
+        assert slow_cancelled == ["gpt-4"]
+        assert all(ep.in_flight == 0 for ep in detector.pool.endpoints)
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_hedge_without_free_capacity(self, mock_async_openai, tmp_path, sample_function):
+        """测试没有空闲名额时不会因等待对冲名额而死锁，且对冲的限流预留被退还。"""
+        import asyncio
+
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  base_url: "https://gw-a/v1"
+  api_key: "sk-a"
+  model: "gpt-4"
+  tpm: 100000
+
+detector:
+  concurrency: 1
+  hedge:
+    enabled: true
+    min_delay: 0.01
+    min_samples: 1
+""")
+        config = Config.from_file(str(config_file))
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs["model"])
+            await asyncio.sleep(0.2)
+            return Mock(
+                choices=[Mock(message=Mock(content='{"has_bug": false, "severity": "low", "bugs": []}'))],
+                usage=Mock(total_tokens=100)
+            )
+
+        client = Mock()
+        client.chat.completions.create = create
+        mock_async_openai.return_value = client
+
+        detector = BugDetector(config)
+        endpoint = detector.pool.endpoints[0]
+        endpoint.max_concurrency = 1
+        # 冻结令牌桶的时钟，避免测试期间自动补充
+        bucket = endpoint.rate_limiter.token_bucket
+        bucket.clock = lambda: bucket.updated
+        detector.latency.record(0.01)
+        context = {"current_function": sample_function.code, "callers": [], "is_public_api": False}
+
+        async def run():
+            result = await asyncio.wait_for(detector.detect_async(sample_function, context), 2)
+            # 让被取消的对冲预留完成清理
+            await asyncio.sleep(0)
+            return result
+
+        result = asyncio.run(run())
+
+        assert result is not None
+        assert calls == ["gpt-4"]
+        assert detector.latency.hedges_sent == 0
+        assert endpoint.in_flight == 0
+        assert endpoint.requests == 1
+        # 只有主请求按实际用量计入
+        assert bucket.capacity - bucket.level == pytest.approx(100, abs=1)
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_request_timeout(self, mock_async_openai, mock_config, sample_function):
+        """测试请求超过按 prompt 大小计算的超时后按超时错误重试。"""
+        import asyncio
+
+        mock_config.detector_timeout_base = 0.05
+        mock_config.detector_timeout_per_1k_tokens = 0
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs["timeout"])
+            if len(calls) == 1:
+                await asyncio.sleep(5)
+            return Mock(choices=[Mock(message=Mock(content='{"has_bug": false}'))])
+
+        mock_client = Mock()
+        mock_client.chat.completions.create = create
+        mock_async_openai.return_value = mock_client
+
+        detector = BugDetector(mock_config)
+        detector.retry_policy.base_delay = 0
+        context = {"current_function": sample_function.code, "callers": [], "is_public_api": False}
+
+        result = asyncio.run(detector.detect_async(sample_function, context))
+
+        assert result is not None
+        assert calls == [0.05, 0.05]
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_cancelled_request_releases_endpoint(self, mock_async_openai, mock_config, sample_function):
+        """测试请求任务被取消时归还端点，不计入端点错误。"""
+        import asyncio
+
+        started = asyncio.Event()
+
+        async def create(**kwargs):
+            started.set()
+            await asyncio.sleep(5)
+
+        mock_client = Mock()
+        mock_client.chat.completions.create = create
+        mock_async_openai.return_value = mock_client
+
+        detector = BugDetector(mock_config)
+        context = {"current_function": sample_function.code, "callers": [], "is_public_api": False}
+
+        async def run():
+            task = asyncio.create_task(detector.detect_async(sample_function, context))
+            await started.wait()
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+
+        endpoint = detector.pool.endpoints[0]
+        assert endpoint.in_flight == 0
+        assert endpoint.errors == 0
+
+    @patch('pyscan.bug_detector.OpenAI')
+    def test_prompt_layout_and_cached_tokens(self, mock_openai, mock_config, sample_function):
+        """测试 prompt 固定说明在前、当前函数代码在最后，并记录缓存命中的 token。"""
+        mock_client = Mock()
+        mock_openai.return_value = mock_client
+        mock_client.chat.completions.create.return_value = Mock(
+            choices=[Mock(message=Mock(content='{"has_bug": false}'))],
+            usage=Mock(
+                prompt_tokens=1200, completion_tokens=10, total_tokens=1210,
+                prompt_tokens_details=Mock(cached_tokens=1024)
+            )
+        )
+
+        sample_function.file_path = "pkg/mod.py"
+        context = {
+            "current_function": sample_function.code,
+            "callers": ["def caller():\n    test_func(1, 0)"],
+            "is_public_api": False,
+        }
+        detector = BugDetector(mock_config)
+        result = detector.detect(sample_function, context)
+
+        prompt = result["prompt"]
+        assert prompt.startswith(BugDetector.PROMPT_INSTRUCTIONS)
+        assert prompt.index("pkg/mod.py") < prompt.index("### 调用者函数") < prompt.index("### 当前函数")
+        assert prompt.rstrip().endswith("```")
+        assert result["usage"]["cached_tokens"] == 1024
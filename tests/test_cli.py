@@ -0,0 +1,314 @@
+"""Tests for the scan command line interface."""
+import json
+import shutil
+import subprocess
+import sys
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from pyscan.ast_parser import ASTParser
+from pyscan.cli import build_caller_infos, extract_caller_snippet, main
+from pyscan.context_builder import ContextBuilder
+
+
+class TestIncrementalScan:
+    """Test fingerprint-based incremental scanning."""
+
+    @pytest.fixture
+    def project(self, tmp_path):
+        """创建待扫描项目和配置文件（关闭结果缓存以统计请求数）。"""
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "calc.py").write_text(
+            "def divide(a, b):\n"
+            "    return a / b\n"
+            "\n"
+            "def average(items):\n"
+            "    return divide(sum(items), len(items))\n"
+            "\n"
+            "def unrelated():\n"
+            "    return 1\n"
+        )
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  base_url: "https://api.openai.com/v1"
+  api_key: "sk-test-key"
+  model: "gpt-4"
+
+scan:
+  parse_workers: 1
+
+cache:
+  enabled: false
+""")
+        return src, config_file
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_rescan_changed_functions(self, mock_async_openai, tmp_path, project):
+        """测试只重新检测代码变化的函数及调用者变化的函数。"""
+        src, config_file = project
+        mock_client = Mock()
+        mock_async_openai.return_value = mock_client
+        create = AsyncMock(return_value=Mock(
+            choices=[Mock(message=Mock(content='{"has_bug": false, "severity": "low", "bugs": []}'))],
+            usage=None
+        ))
+        mock_client.chat.completions.create = create
+        args = [str(src), "-c", str(config_file), "-o", str(tmp_path / "report.json")]
+
+        main(args)
+        assert create.await_count == 3
+        progress = json.loads((src / ".pyscan" / "progress.json").read_text())
+        assert set(progress["fingerprints"]) == set(progress["completed_functions"])
+
+        # 未变化时不发送请求
+        main(args)
+        assert create.await_count == 3
+
+        # 修改 average：average 自身和被它调用的 divide 需要重新检测
+        source = (src / "calc.py").read_text()
+        (src / "calc.py").write_text(source.replace("len(items))", "len(items) or 1)"))
+        create.reset_mock()
+        main(args)
+
+        prompts = [call.kwargs["messages"][1]["content"] for call in create.await_args_list]
+        assert len(prompts) == 2
+        assert not any("def unrelated" in prompt.split("### 当前函数")[-1] for prompt in prompts)
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_same_name_methods_and_moved_functions(self, mock_async_openai, tmp_path, project):
+        """测试同一文件中的同名方法分别记录进度，移动位置的函数不重新检测。"""
+        src, config_file = project
+        (src / "calc.py").write_text(
+            "class Reader:\n"
+            "    def run(self):\n"
+            "        return 1\n"
+            "\n"
+            "class Writer:\n"
+            "    def run(self):\n"
+            "        return 2\n"
+        )
+        mock_client = Mock()
+        mock_async_openai.return_value = mock_client
+        create = AsyncMock(return_value=Mock(
+            choices=[Mock(message=Mock(content=json.dumps({
+                "has_bug": True, "severity": "low",
+                "bugs": [{"type": "logic", "severity": "low", "description": "x",
+                          "start_line": 1, "end_line": 1, "suggestion": ""}]
+            })))],
+            usage=None
+        ))
+        mock_client.chat.completions.create = create
+        args = [str(src), "-c", str(config_file), "-o", str(tmp_path / "report.json")]
+
+        main(args)
+        progress = json.loads((src / ".pyscan" / "progress.json").read_text())
+        assert sorted(progress["completed_functions"]) == ["calc.py::Reader.run", "calc.py::Writer.run"]
+        assert set(progress["fingerprints"]) == set(progress["completed_functions"])
+
+        main(args)
+        assert create.await_count == 2
+
+        # 文件开头插入一行：函数 ID 不变，不重新检测，报告中的起始行号随之更新
+        source = (src / "calc.py").read_text()
+        (src / "calc.py").write_text("import os\n" + source)
+        main(args)
+        assert create.await_count == 2
+        reports = json.loads((src / ".pyscan" / "reports.json").read_text())
+        assert sorted((r["function_name"], r["function_start_line"]) for r in reports) == [
+            ("run", 3), ("run", 7)
+        ]
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+class TestSinceScan:
+    """Test --since git diff mode."""
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_since_selects_changed_and_neighbours(self, mock_async_openai, tmp_path):
+        """测试只检测改动的函数及其直接调用者和被调用者。"""
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "calc.py").write_text(
+            "def divide(a, b):\n"
+            "    return a / b\n"
+            "\n"
+            "def average(items):\n"
+            "    return divide(sum(items), len(items))\n"
+            "\n"
+            "def report(items):\n"
+            "    return str(average(items))\n"
+            "\n"
+            "def unrelated():\n"
+            "    return 1\n"
+        )
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text(
+            'llm:\n  base_url: "https://api.openai.com/v1"\n  api_key: "sk-test-key"\n'
+            '  model: "gpt-4"\nscan:\n  parse_workers: 1\n'
+        )
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        subprocess.run(git + ["init", "-q"], cwd=src, check=True)
+        subprocess.run(git + ["add", "."], cwd=src, check=True)
+        subprocess.run(git + ["commit", "-q", "-m", "base"], cwd=src, check=True)
+
+        source = (src / "calc.py").read_text()
+        (src / "calc.py").write_text(source.replace("len(items))", "len(items) or 1)"))
+
+        mock_client = Mock()
+        mock_async_openai.return_value = mock_client
+        create = AsyncMock(return_value=Mock(
+            choices=[Mock(message=Mock(content='{"has_bug": false, "severity": "low", "bugs": []}'))],
+            usage=None
+        ))
+        mock_client.chat.completions.create = create
+
+        main([str(src), "-c", str(config_file), "-o", str(tmp_path / "report.json"), "--since", "HEAD"])
+
+        progress = json.loads((src / ".pyscan" / "progress.json").read_text())
+        assert sorted(progress["completed_functions"]) == [
+            "calc.py::average", "calc.py::divide", "calc.py::report"
+        ]
+        assert create.await_count == 3
+
+
+class TestCallerInfos:
+    """Test caller highlight lines and snippets built from call sites."""
+
+    @pytest.fixture
+    def functions(self, tmp_path):
+        """解析包含多行调用的示例文件。"""
+        code_file = tmp_path / "calc.py"
+        code_file.write_text(
+            "def divide(a, b):\n"
+            "    return a / b\n"
+            "\n"
+            "def report(items):\n"
+            "    total = sum(items)\n"
+            "    # divide(total, 0) 只是注释\n"
+            "    return divide(\n"
+            "        total,\n"
+            "        len(items),\n"
+            "    )\n"
+        )
+        functions = ASTParser().parse_file(str(code_file))
+        for func in functions:
+            func.file_path = "calc.py"
+        return {func.name: func for func in functions}
+
+    def test_highlight_lines(self, functions):
+        """测试高亮多行调用的每一行，不高亮注释中的同名文本。"""
+        builder = ContextBuilder(list(functions.values()))
+
+        callers = build_caller_infos(functions["divide"], builder)
+
+        assert [caller["function_name"] for caller in callers] == ["report"]
+        assert callers[0]["highlight_lines"] == [7, 8, 9, 10]
+
+    def test_extract_caller_snippet(self, functions):
+        """测试按调用点位置提取代码片段。"""
+        builder = ContextBuilder(list(functions.values()))
+        report = functions["report"]
+
+        snippet = extract_caller_snippet(
+            report, builder.get_call_sites(report, functions["divide"]), context_lines=1
+        )
+
+        assert snippet.split("\n") == [
+            "def report(items):",
+            "",
+            "    # ... (call at line 4)",
+            "    # divide(total, 0) 只是注释",
+            ">>>     return divide(",
+            ">>>         total,",
+            ">>>         len(items),",
+            ">>>     )",
+        ]
+        assert extract_caller_snippet(report, []) == "def report(items):"
+
+
+def imported_modules(code, *args):
+    """在新进程中运行代码，从 -X importtime 的输出中取出导入的顶层包及耗时（微秒）。"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *(args or ("-c", code))],
+        capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return modules
+
+
+class TestStartup:
+    """Test that heavy dependencies are imported lazily."""
+
+    HEAVY = ("openai", "httpx", "tqdm", "tiktoken")
+
+    def test_cli_import_skips_heavy_dependencies(self):
+        """测试导入 CLI 和构建上下文时不导入 openai、httpx、tqdm、tiktoken。"""
+        modules = imported_modules(
+            "import pyscan.cli\n"
+            "from pyscan.config import Config\n"
+            "from pyscan.context_builder import ContextBuilder\n"
+            "from pyscan.ast_parser import FunctionInfo\n"
+            "f = FunctionInfo(name='f', args=[], lineno=1, end_lineno=2, col_offset=0,\n"
+            "                 end_col_offset=0, code='def f():\\n    pass')\n"
+            "ContextBuilder([f]).build_context(f)\n"
+        )
+
+        assert "pyscan.cli" in modules
+        assert [name for name in modules if name.split(".")[0] in self.HEAVY] == []
+
+    def test_help_skips_heavy_dependencies(self):
+        """测试 --help 不导入 openai、httpx、tqdm、tiktoken。"""
+        modules = imported_modules(None, "-m", "pyscan", "--help")
+
+        assert "pyscan.cli" in modules
+        assert [name for name in modules if name.split(".")[0] in self.HEAVY] == []
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_cached_scan_skips_heavy_dependencies(self, mock_async_openai, tmp_path):
+        """测试结果全部命中缓存的扫描不导入 openai、httpx。"""
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "calc.py").write_text("def divide(a, b):\n    return a / b\n")
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text(
+            'llm:\n  base_url: "https://api.openai.com/v1"\n  api_key: "sk-test-key"\n'
+            '  model: "gpt-4"\nscan:\n  parse_workers: 1\n'
+        )
+        mock_async_openai.return_value.chat.completions.create = AsyncMock(return_value=Mock(
+            choices=[Mock(message=Mock(content='{"has_bug": false, "severity": "low", "bugs": []}'))],
+            usage=None
+        ))
+        args = [str(src), "-c", str(config_file), "-o", str(tmp_path / "report.json")]
+        main(args)
+
+        # --force 清空进度但保留结果缓存，每个函数都经过一次缓存查询
+        modules = imported_modules(None, "-m", "pyscan", *args, "--force")
+
+        assert "pyscan.bug_detector" in modules
+        assert [name for name in modules if name.split(".")[0] in ("openai", "httpx")] == []
+
+    def test_bug_detector_creates_clients_lazily(self):
+        """测试创建 BugDetector 不导入 openai，第一次使用客户端时才导入。"""
+        modules = imported_modules(
+            "import sys\n"
+            "from pyscan.config import Config\n"
+            "from pyscan.bug_detector import BugDetector\n"
+            "config = Config({'llm': {'base_url': 'http://localhost', 'api_key': 'k', 'model': 'm'}})\n"
+            "detector = BugDetector(config)\n"
+            "assert 'openai' not in sys.modules\n"
+            "assert detector.client is detector.client\n"
+            "assert 'openai' in sys.modules\n"
+        )
+
+        assert "pyscan.bug_detector" in modules
+        assert "openai" in modules
+
@@ -111,3 +111,162 @@ llm:
 
         with pytest.raises(ConfigError, match="max_tokens"):
             Config.from_file(str(config_file))
+
+    def test_rate_limit_config(self, tmp_path):
+        """测试速率限制配置。"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  base_url: "https://api.openai.com/v1"
+  api_key: "sk-test-key"
+  model: "gpt-4"
+  rpm: 500
+  tpm: 200000
+""")
+
+        config = Config.from_file(str(config_file))
+
+        assert config.llm_rpm == 500
+        assert config.llm_tpm == 200000
+
+    def test_invalid_rate_limit(self, tmp_path):
+        """测试无效的速率限制配置。"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  base_url: "https://api.openai.com/v1"
+  api_key: "sk-test-key"
+  model: "gpt-4"
+  tpm: 0
+""")
+
+        with pytest.raises(ConfigError, match="tpm"):
+            Config.from_file(str(config_file))
+
+    def test_cache_config(self, tmp_path):
+        """测试结果缓存配置的默认值和校验。"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  base_url: "https://api.openai.com/v1"
+  api_key: "sk-test-key"
+  model: "gpt-4"
+""")
+        config = Config.from_file(str(config_file))
+        assert config.cache_enabled is True
+        assert config.cache_max_size_mb == 500
+
+        config_file.write_text(config_file.read_text() + "cache:\n  max_size_mb: 0\n")
+        with pytest.raises(ConfigError, match="cache.max_size_mb"):
+            Config.from_file(str(config_file))
+
+    def test_multiple_endpoints(self, tmp_path):
+        """测试多端点配置。"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  model: "gpt-4"
+  rpm: 100
+  endpoints:
+    - base_url: "https://gw-a/v1"
+      api_key: "sk-a"
+      weight: 2
+      concurrency: 8
+    - name: "backup"
+      base_url: "https://gw-b/v1"
+      api_key: "sk-b"
+      model: "gpt-4o"
+      concurrency: 4
+      rpm: 50
+""")
+
+        config = Config.from_file(str(config_file))
+
+        assert len(config.llm_endpoints) == 2
+        assert config.llm_base_url == "https://gw-a/v1"
+        assert config.llm_endpoints[0]["model"] == "gpt-4"
+        assert config.llm_endpoints[0]["rpm"] == 100
+        assert config.llm_endpoints[1]["name"] == "backup"
+        assert config.llm_endpoints[1]["model"] == "gpt-4o"
+        assert config.llm_endpoints[1]["rpm"] == 50
+        # 默认并发为各端点并发上限之和
+        assert config.detector_concurrency == 12
+
+    def test_endpoint_models_without_top_level_model(self, tmp_path):
+        """测试每个端点都设置了 model 时可以省略顶层 model，缺少时报错。"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  endpoints:
+    - base_url: "https://gw-a/v1"
+      api_key: "sk-a"
+      model: "gpt-4o"
+    - base_url: "https://gw-b/v1"
+      api_key: "sk-b"
+      model: "gpt-4"
+""")
+
+        config = Config.from_file(str(config_file))
+
+        assert config.llm_model == "gpt-4o"
+        assert [endpoint["model"] for endpoint in config.llm_endpoints] == ["gpt-4o", "gpt-4"]
+
+        config_file.write_text("""
+llm:
+  endpoints:
+    - base_url: "https://gw-a/v1"
+      api_key: "sk-a"
+      model: "gpt-4o"
+    - base_url: "https://gw-b/v1"
+      api_key: "sk-b"
+""")
+        with pytest.raises(ConfigError, match=r"llm\.model"):
+            Config.from_file(str(config_file))
+
+    def test_endpoint_missing_api_key(self, tmp_path):
+        """测试端点缺少 api_key。"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  model: "gpt-4"
+  endpoints:
+    - base_url: "https://gw-a/v1"
+""")
+
+        with pytest.raises(ConfigError, match=r"endpoints\[0\]\.api_key"):
+            Config.from_file(str(config_file))
+
+    def test_http_config(self, tmp_path):
+        """测试 HTTP 连接池配置与默认值合并。"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  base_url: "https://api.openai.com/v1"
+  api_key: "sk-test-key"
+  model: "gpt-4"
+  http:
+    max_connections: 32
+    read_timeout: 120
+""")
+
+        config = Config.from_file(str(config_file))
+
+        assert config.llm_http["max_connections"] == 32
+        assert config.llm_http["read_timeout"] == 120
+        assert config.llm_http["keepalive_expiry"] == Config.DEFAULT_HTTP["keepalive_expiry"]
+        assert config.llm_http["http2"] is False
+
+    def test_unknown_http_option(self, tmp_path):
+        """测试未知的 HTTP 配置项。"""
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  base_url: "https://api.openai.com/v1"
+  api_key: "sk-test-key"
+  model: "gpt-4"
+  http:
+    max_conections: 32
+""")
+
+        with pytest.raises(ConfigError, match="max_conections"):
+            Config.from_file(str(config_file))
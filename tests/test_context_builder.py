@@ -87,6 +87,58 @@ class TestContextBuilder:
         assert "current_function" in context
         assert context["current_function"] is not None
 
+    def test_compression_levels_match_full_text_counting(self):
+        """测试按片段计数的压缩结果与逐级重建全文计数的结果一致。"""
+        callers = [
+            'def caller_a(x):\n    """Docs."""\n' + "    y = x\n" * 30 + "    return target(y)",
+            "def caller_b():\n    try:\n        target(1)\n    except ValueError:\n        pass",
+            "def caller_c():\n" + "    z = 1\n" * 12 + "    return target(z)",
+            "def caller_d():\n    return target(2)",
+        ]
+        inferred = [
+            {"hint": f"(推断): hint {i}", "code": f"def inferred_{i}():\n" + "    pass\n" * 10}
+            for i in range(3)
+        ]
+        context = {
+            "current_function": "def target(v):\n" + "    v += 1\n" * 20 + "    return v",
+            "callers": callers,
+            "callees": [],
+            "is_public_api": False,
+            "inferred_callers": inferred,
+        }
+        func = FunctionInfo(
+            name="target", args=["v"], lineno=1, end_lineno=22, col_offset=0, end_col_offset=0,
+            code=context["current_function"]
+        )
+
+        for max_tokens in range(0, 600, 7):
+            builder = ContextBuilder([], max_tokens=max_tokens)
+            sig = builder._extract_signature
+            top = [sig(c) for c in builder._prioritize_callers(callers, False)[:3]]
+            # 压缩级别从低到高依次尝试，返回第一个不超过限制的上下文
+            levels = [
+                context,
+                {"callers": [sig(c) for c in callers], "inferred_callers": inferred},
+                {"callers": top, "inferred_callers": inferred},
+                {"callers": top, "inferred_callers": inferred[:2]},
+                {"callers": top, "inferred_callers": []},
+                {"callers": top[:2], "inferred_callers": []},
+            ]
+            expected = {"callers": [], "inferred_callers": []}
+            for level in levels:
+                candidate = {"current_function": context["current_function"], **level}
+                if builder._count_tokens(builder._build_context_text(candidate)) <= max_tokens:
+                    expected = level
+                    break
+
+            result = builder._fit_context_to_token_limit(dict(context), func)
+
+            assert result["callers"] == expected["callers"]
+            assert result["inferred_callers"] == expected["inferred_callers"]
+            assert builder.count_context_tokens(result) == builder._count_tokens(
+                builder._build_context_text(result)
+            )
+
     def test_decorator_inference(self):
         """测试装饰器调用关系推断。"""
         # 创建测试函数
@@ -166,6 +218,212 @@ class TestContextBuilder:
         assert "inferred_callers" in context
         # 应该推断可能被 processor 调用
 
+    def test_caller_index(self):
+        """测试调用者倒排索引与逐个遍历的结果一致，并随 add_functions 增量更新。"""
+        def make(name, calls):
+            return FunctionInfo(
+                name=name, args=[], lineno=1, end_lineno=2, col_offset=0, end_col_offset=0,
+                code=f"def {name}():\n    pass", calls=set(calls)
+            )
+
+        target = make("target", [])
+        a = make("a", ["target", "other"])
+        b = make("b", ["other"])
+        builder = ContextBuilder([target, a, b])
+        assert builder.get_callers(target) == [a]
+
+        c = make("c", ["target"])
+        builder.add_functions([c])
+        assert builder.get_callers(target) == [a, c]
+        assert builder.get_callers(target) == [
+            f for f in builder.functions if target.name in f.calls
+        ]
+        assert builder.get_callees(c) == [target]
+        assert builder.get_callees(a) == [target]
+
+    def test_symbol_resolution(self, tmp_path):
+        """测试按模块和类解析调用者，未解析的调用作为低置信度调用者。"""
+        pkg = tmp_path / "pkg"
+        pkg.mkdir()
+        (pkg / "__init__.py").write_text("")
+        (pkg / "a.py").write_text(
+            "class Store:\n"
+            "    def get(self, key):\n"
+            "        return self.load(key)\n"
+            "\n"
+            "    def load(self, key):\n"
+            "        return key\n"
+            "\n"
+            "def get(key):\n"
+            "    return key\n"
+        )
+        (pkg / "b.py").write_text(
+            "import requests\n"
+            "from . import a\n"
+            "from pkg.a import Store\n"
+            "\n"
+            "def via_module():\n"
+            "    return a.get(1)\n"
+            "\n"
+            "def via_instance():\n"
+            "    return Store().get(1)\n"
+            "\n"
+            "def via_dict(d):\n"
+            "    return d.get(1)\n"
+            "\n"
+            "def external():\n"
+            "    return requests.get('x')\n"
+        )
+        functions = []
+        for name in ("a.py", "b.py"):
+            for func in ASTParser().parse_file(str(pkg / name)):
+                func.file_path = f"pkg/{name}"
+                functions.append(func)
+        by_name = {f.qualname: f for f in functions}
+
+        builder = ContextBuilder(functions)
+
+        assert builder.get_callers(by_name["get"]) == [by_name["via_module"]]
+        assert builder.get_callers(by_name["Store.get"]) == []
+        assert builder.get_callers(by_name["Store.load"]) == [by_name["Store.get"]]
+        assert builder.get_uncertain_callers(by_name["Store.get"]) == [
+            by_name["via_instance"], by_name["via_dict"]
+        ]
+        assert builder.get_uncertain_callers(by_name["get"]) == [
+            by_name["via_instance"], by_name["via_dict"]
+        ]
+        assert builder.get_uncertain_callers(by_name["Store.load"]) == []
+
+        # 被调用者同样按符号解析，不按函数名匹配所有同名函数
+        assert builder.get_callees(by_name["via_module"]) == [by_name["get"]]
+        assert builder.get_callees(by_name["via_instance"]) == []
+        assert builder.get_callees(by_name["Store.get"]) == [by_name["Store.load"]]
+        assert builder.get_callees(by_name["via_dict"]) == []
+        assert builder.get_callees(by_name["external"]) == []
+
+    def test_scan_rooted_inside_package(self, tmp_path):
+        """测试扫描根目录位于包内部时，按绝对导入路径的后缀解析调用者。"""
+        pkg = tmp_path / "mypkg"
+        pkg.mkdir()
+        (pkg / "utils.py").write_text(
+            "def helper():\n"
+            "    return 1\n"
+        )
+        (pkg / "app.py").write_text(
+            "import mypkg.utils\n"
+            "from mypkg.utils import helper\n"
+            "\n"
+            "def run():\n"
+            "    return helper()\n"
+            "\n"
+            "def run_qualified():\n"
+            "    return mypkg.utils.helper()\n"
+        )
+        functions = []
+        for name in ("utils.py", "app.py"):
+            for func in ASTParser().parse_file(str(pkg / name)):
+                func.file_path = name
+                functions.append(func)
+        by_name = {f.qualname: f for f in functions}
+
+        builder = ContextBuilder(functions)
+
+        assert builder.get_callers(by_name["helper"]) == [
+            by_name["run"], by_name["run_qualified"]
+        ]
+        assert builder.get_uncertain_callers(by_name["helper"]) == []
+
+    def test_uncertain_callers_use_remaining_budget(self):
+        """测试低置信度调用者只在上下文预算有剩余时加入。"""
+        def make(name, qualified_calls, body="pass"):
+            return FunctionInfo(
+                name=name, args=[], lineno=1, end_lineno=2, col_offset=0, end_col_offset=0,
+                code=f"def {name}():\n    {body}", calls=set(qualified_calls),
+                qualified_calls=qualified_calls
+            )
+
+        target = make("target", {})
+        caller = make("caller", {"target": [":target"]})
+        maybe = make("maybe", {"target": ["?"]}, body="x = 1\n" * 200)
+
+        builder = ContextBuilder([target, caller, maybe], max_tokens=10000)
+        context = builder.build_context(target)
+        assert context["callers"] == [caller.code]
+        assert context["uncertain_callers"] == [maybe.code]
+        assert builder.count_context_tokens(context) == (
+            len(builder._build_context_text(context)) // 4
+        )
+
+        builder = ContextBuilder([target, caller, maybe], max_tokens=100)
+        context = builder.build_context(target)
+        assert context["callers"] == [caller.code]
+        assert context["uncertain_callers"] == []
+
+    def test_callable_inference_matches_full_scan(self):
+        """测试基于索引的 Callable 推断与逐个遍历所有函数的结果一致。"""
+        import random
+
+        def reference(builder, function, inferred_callers):
+            # 索引化之前的逐个遍历实现
+            callees, callers = [], list(inferred_callers)
+            for arg_name, arg_type in function.arg_types.items():
+                if "allable" in arg_type:
+                    expected = builder._extract_callable_arg_count(arg_type)
+                    for func in builder.functions:
+                        if func.name != function.name and (expected is None or len(func.args) == expected):
+                            callees.append(func.code)
+                            break
+            for func in builder.functions:
+                if func.name != function.name:
+                    for arg_name, arg_type in func.arg_types.items():
+                        if "allable" in arg_type:
+                            expected = builder._extract_callable_arg_count(arg_type)
+                            if expected is None or len(function.args) == expected:
+                                callers.append((func.name, arg_name))
+                                break
+                        if callers:
+                            break
+            return callees, callers
+
+        rng = random.Random(0)
+        types = ["int", "Callable", "Callable[[], None]", "Callable[[int], int]",
+                 "Callable[[int, str], None]", "Callable[..., int]"]
+        functions = []
+        for i in range(60):
+            args = [f"a{j}" for j in range(rng.randint(0, 3))]
+            functions.append(FunctionInfo(
+                name=f"f{rng.randint(0, 40)}", args=args, lineno=1, end_lineno=2,
+                col_offset=0, end_col_offset=0, code=f"# {i}",
+                arg_types={a: rng.choice(types) for a in args if rng.random() < 0.7}
+            ))
+        builder = ContextBuilder(functions[:30])
+        builder.add_functions(functions[30:])
+
+        for function in functions:
+            for seeded in ([], [{"function_name": "decorator"}]):
+                context = {"inferred_callers": list(seeded), "inferred_callees": []}
+                builder._infer_callable_calls(function, context)
+                callees, callers = reference(builder, function, [("decorator", None)] if seeded else [])
+                assert [c["code"] for c in context["inferred_callees"]] == callees
+                assert [
+                    (c["function_name"], c.get("arg_name")) for c in context["inferred_callers"]
+                ] == callers
+
+    def test_fingerprint(self, sample_functions):
+        """测试指纹随函数自身或调用者代码变化，忽略缩进和行尾空白。"""
+        builder = ContextBuilder(sample_functions)
+        simple_func = next(f for f in sample_functions if f.name == "simple_function")
+        caller = next(f for f in sample_functions if f.name == "function_with_calls")
+        before = builder.fingerprint(simple_func)
+
+        simple_func.code = "    " + simple_func.code.replace("\n", "   \n    ")
+        assert builder.fingerprint(simple_func) == before
+
+        caller.code += "\n    # changed"
+        after = builder.fingerprint(simple_func)
+        assert after["code"] == before["code"]
+        assert after["context"] != before["context"]
+
     def test_advanced_analysis_disabled(self):
         """测试禁用高级分析。"""
         decorator_func = FunctionInfo(
@@ -0,0 +1,192 @@
+"""Tests for detection engine module."""
+import asyncio
+import pytest
+from pyscan.ast_parser import FunctionInfo
+from pyscan.budget import ScanBudget
+from pyscan.detection_engine import BatchPolicy, DetectionEngine, DetectionJob
+
+
+def make_function(name, lineno=1, lines=2):
+    """创建测试用 FunctionInfo。"""
+    return FunctionInfo(
+        name=name,
+        args=[],
+        lineno=lineno,
+        end_lineno=lineno + lines - 1,
+        col_offset=0,
+        end_col_offset=0,
+        code=f"def {name}():\n    pass",
+    )
+
+
+class FakeDetector:
+    """按函数名返回预设延迟和结果的假检测器。"""
+
+    system_prompt_tokens = 0
+
+    def __init__(self, delays=None, failures=()):
+        self.delays = delays or {}
+        self.failures = set(failures)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started = []
+        self.batches = []
+
+    async def detect_async(self, function, context, **kwargs):
+        self.started.append(function.name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delays.get(function.name, 0))
+        finally:
+            self.in_flight -= 1
+        if function.name in self.failures:
+            return None
+        return {
+            "reports": [],
+            "prompt": function.name,
+            "raw_response": "{}",
+            "usage": {"requests": 1, "prompt_tokens": 100, "completion_tokens": 10},
+        }
+
+    async def detect_batch_async(self, jobs):
+        self.batches.append([job.function.name for job in jobs])
+        return [await self.detect_async(job.function, job.context) for job in jobs]
+
+
+class TestDetectionEngine:
+    """Test DetectionEngine class."""
+
+    def _jobs(self, names):
+        return [
+            DetectionJob(function=make_function(name), context={})
+            for name in names
+        ]
+
+    def test_results_delivered_in_job_order(self):
+        """测试乱序完成的请求仍按任务顺序交付。"""
+        detector = FakeDetector(delays={"a": 0.05, "b": 0.01, "c": 0.0})
+        engine = DetectionEngine(detector, concurrency=3)
+        delivered = []
+
+        def on_result(job, result):
+            delivered.append(job.function.name)
+            return True
+
+        asyncio.run(engine.run(self._jobs(["a", "b", "c"]), on_result))
+
+        assert delivered == ["a", "b", "c"]
+        assert detector.max_in_flight == 3
+
+    def test_concurrency_limit(self):
+        """测试同时进行的请求数不超过 concurrency。"""
+        names = [f"f{i}" for i in range(10)]
+        detector = FakeDetector(delays={name: 0.01 for name in names})
+        engine = DetectionEngine(detector, concurrency=2)
+
+        asyncio.run(engine.run(self._jobs(names), lambda job, result: True))
+
+        assert detector.max_in_flight == 2
+        assert sorted(detector.started) == sorted(names)
+
+    def test_stop_on_failure(self):
+        """测试回调返回 False 后停止交付并不再拉取新任务。"""
+        names = [f"f{i}" for i in range(20)]
+        detector = FakeDetector(failures={"f1"})
+        engine = DetectionEngine(detector, concurrency=1)
+        delivered = []
+
+        def on_result(job, result):
+            delivered.append((job.function.name, result is not None))
+            return result is not None
+
+        asyncio.run(engine.run(self._jobs(names), on_result))
+
+        assert delivered == [("f0", True), ("f1", False)]
+        assert len(detector.started) < len(names)
+
+    def test_producer_error_after_prior_results(self):
+        """测试任务生成出错时，先交付之前的结果再抛出异常。"""
+        detector = FakeDetector()
+        engine = DetectionEngine(detector, concurrency=4)
+        delivered = []
+
+        def jobs():
+            yield DetectionJob(function=make_function("ok"), context={})
+            raise RuntimeError("context failed")
+
+        def on_result(job, result):
+            delivered.append(job.function.name)
+            return True
+
+        with pytest.raises(RuntimeError, match="context failed"):
+            asyncio.run(engine.run(jobs(), on_result))
+
+        assert delivered == ["ok"]
+
+    def test_budget_stops_new_work(self):
+        """测试预算不足时停止分发新任务，已完成的任务仍按序交付。"""
+        names = [f"f{i}" for i in range(10)]
+        detector = FakeDetector()
+        budget = ScanBudget(max_prompt_tokens=350)
+        engine = DetectionEngine(detector, concurrency=1, budget=budget)
+        jobs = [
+            DetectionJob(function=make_function(name), context={}, estimated_tokens=100)
+            for name in names
+        ]
+        delivered = []
+
+        def on_result(job, result):
+            delivered.append(job.function.name)
+            return True
+
+        asyncio.run(engine.run(jobs, on_result))
+
+        assert delivered == ["f0", "f1", "f2"]
+        assert "prompt token" in engine.stop_reason
+        assert budget.prompt_tokens == 300
+
+    def test_batches_delivered_per_job(self):
+        """测试批量检测的结果仍逐个按任务顺序交付。"""
+        detector = FakeDetector()
+        engine = DetectionEngine(detector, concurrency=2, batch_policy=BatchPolicy(max_functions=2))
+        jobs = [DetectionJob(function=make_function(name), context={}) for name in "abcde"]
+        delivered = []
+
+        def on_result(job, result):
+            delivered.append(job.function.name)
+            return True
+
+        asyncio.run(engine.run(jobs, on_result))
+
+        assert delivered == list("abcde")
+        assert detector.batches == [["a", "b"], ["c", "d"]]
+
+
+class TestBatchPolicy:
+    """Test BatchPolicy class."""
+
+    def _job(self, name, lines=2, tokens=100):
+        return DetectionJob(
+            function=make_function(name, lines=lines), context={}, estimated_tokens=tokens
+        )
+
+    def _names(self, groups):
+        return [[job.function.name for job in group] for group in groups]
+
+    def test_large_function_breaks_batch(self):
+        """测试大函数单独发送，且不打乱顺序。"""
+        policy = BatchPolicy(max_functions=8, max_lines=15, token_budget=1000)
+        jobs = [self._job("a"), self._job("b"), self._job("big", lines=40), self._job("c")]
+
+        assert self._names(policy.pack(jobs)) == [["a", "b"], ["big"], ["c"]]
+
+    def test_token_budget_and_max_functions(self):
+        """测试批次受 token 预算和函数数量限制。"""
+        policy = BatchPolicy(max_functions=3, max_lines=15, token_budget=250)
+        jobs = [self._job(f"f{i}") for i in range(5)]
+
+        assert self._names(policy.pack(jobs)) == [["f0", "f1"], ["f2", "f3"], ["f4"]]
+
+        policy = BatchPolicy(max_functions=3, max_lines=15, token_budget=1000)
+        assert self._names(policy.pack(jobs)) == [["f0", "f1", "f2"], ["f3", "f4"]]
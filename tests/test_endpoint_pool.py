@@ -0,0 +1,120 @@
+"""Tests for endpoint pool module."""
+import asyncio
+from pyscan.endpoint_pool import Endpoint, EndpointPool
+
+
+class FakeClock:
+    """可手动推进的时钟。"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeStatusError(Exception):
+    """模拟 openai.APIStatusError 的属性。"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+def make_endpoint(name, weight=1.0, max_concurrency=None):
+    """创建测试用端点。"""
+    return Endpoint(
+        name=name, base_url=f"https://{name}/v1", api_key="sk", model="gpt-4",
+        weight=weight, max_concurrency=max_concurrency
+    )
+
+
+class TestEndpointPool:
+    """Test EndpointPool class."""
+
+    def test_least_loaded_routing(self):
+        """测试按负载/权重选择端点。"""
+        a = make_endpoint("a")
+        b = make_endpoint("b", weight=2.0)
+        pool = EndpointPool([a, b])
+
+        chosen = [pool.acquire_sync().name for _ in range(6)]
+
+        # b 权重为 2，承担约 2/3 的请求
+        assert chosen.count("b") == 4
+        assert chosen.count("a") == 2
+
+    def test_capacity_limit(self):
+        """测试端点并发上限。"""
+        a = make_endpoint("a", max_concurrency=1)
+        b = make_endpoint("b", max_concurrency=1)
+        pool = EndpointPool([a, b])
+
+        first = pool.select()
+        pool.acquire_sync()
+        second = pool.select()
+        pool.acquire_sync()
+
+        assert {first.name, second.name} == {"a", "b"}
+        assert pool.select() is None
+
+        pool.release(a)
+        assert pool.select() is a
+
+    def test_failover_after_errors(self):
+        """测试连续错误后端点进入冷却，请求切换到其他端点。"""
+        clock = FakeClock()
+        a = make_endpoint("a", weight=10.0)
+        b = make_endpoint("b")
+        pool = EndpointPool([a, b], failure_threshold=2, cooldown=30, clock=clock)
+
+        for _ in range(2):
+            endpoint = pool.acquire_sync()
+            assert endpoint is a
+            pool.release(endpoint, FakeStatusError(503))
+
+        assert not a.is_healthy(clock.now)
+        assert pool.acquire_sync() is b
+
+        clock.now = 31
+        assert pool.select() is a
+
+    def test_rate_limit_honors_retry_after(self):
+        """测试 429 按 Retry-After 暂停端点。"""
+        clock = FakeClock()
+        a = make_endpoint("a")
+        b = make_endpoint("b")
+        pool = EndpointPool([a, b], clock=clock)
+
+        endpoint = pool.acquire_sync()
+        pool.release(endpoint, FakeStatusError(429, {"retry-after": "20"}))
+
+        assert endpoint.unhealthy_until == 20
+        assert pool.has_alternative(endpoint)
+
+    def test_parse_errors_do_not_affect_health(self):
+        """测试解析错误不影响端点健康状态。"""
+        a = make_endpoint("a")
+        pool = EndpointPool([a], failure_threshold=1)
+
+        pool.release(pool.acquire_sync(), ValueError("Invalid JSON response"))
+
+        assert a.consecutive_failures == 0
+        assert a.is_healthy(0)
+
+    def test_async_acquire_waits_for_capacity(self):
+        """测试所有端点满载时异步等待释放。"""
+        a = make_endpoint("a", max_concurrency=1)
+        pool = EndpointPool([a])
+
+        async def scenario():
+            first = await pool.acquire()
+            waiter = asyncio.create_task(pool.acquire())
+            await asyncio.sleep(0.01)
+            assert not waiter.done()
+            pool.release(first)
+            return await asyncio.wait_for(waiter, 1)
+
+        assert asyncio.run(scenario()) is a
+        assert a.in_flight == 1
@@ -0,0 +1,80 @@
+"""Tests for git diff based change detection."""
+import shutil
+import subprocess
+
+import pytest
+from pyscan.git_diff import GitDiffError, changed_line_ranges, overlaps, parse_diff_ranges
+
+
+DIFF = """diff --git a/pkg/a.py b/pkg/a.py
+index 1111111..2222222 100644
+--- a/pkg/a.py
++++ b/pkg/a.py
+@@ -3 +3 @@ def f():
+-    return 1
++    return 2
+@@ -10,2 +10,0 @@ def g():
+-    x = 1
+-    y = 2
+@@ -20,0 +19,3 @@ def h():
++    a
++    b
++    c
+diff --git a/old.py b/old.py
+deleted file mode 100644
+--- a/old.py
++++ /dev/null
+@@ -1,2 +0,0 @@
+-def gone():
+-    pass
+"""
+
+
+class TestParseDiff:
+    """Test unified diff parsing."""
+
+    def test_parse_ranges(self):
+        """测试解析修改、删除和新增的行范围。"""
+        assert parse_diff_ranges(DIFF) == {"pkg/a.py": [(3, 3), (10, 10), (19, 21)]}
+
+    def test_overlaps(self):
+        """测试行范围与函数区间的相交判断。"""
+        assert overlaps([(3, 3)], 1, 5)
+        assert overlaps([(5, 8)], 1, 5)
+        assert not overlaps([(6, 8)], 1, 5)
+        assert not overlaps([], 1, 5)
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git not installed")
+class TestChangedLineRanges:
+    """Test reading changes from a real git repository."""
+
+    def git(self, repo, *args):
+        subprocess.run(
+            ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+            cwd=repo, check=True, capture_output=True
+        )
+
+    def test_changed_line_ranges(self, tmp_path):
+        """测试读取已提交、未提交的修改和未跟踪的文件。"""
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "a.py").write_text("def f():\n    return 1\n\n\ndef g():\n    return 2\n")
+        self.git(tmp_path, "init", "-q")
+        self.git(tmp_path, "add", ".")
+        self.git(tmp_path, "commit", "-q", "-m", "base")
+
+        (src / "a.py").write_text("def f():\n    return 1\n\n\ndef g():\n    return 3\n")
+        (src / "new.py").write_text("def n():\n    pass\n")
+
+        ranges = changed_line_ranges(str(src), "HEAD")
+
+        assert ranges["a.py"] == [(6, 6)]
+        assert ranges["new.py"] == [(1, float("inf"))]
+
+    def test_unknown_revision(self, tmp_path):
+        """测试无法解析的版本号。"""
+        self.git(tmp_path, "init", "-q")
+
+        with pytest.raises(GitDiffError, match="Unknown revision"):
+            changed_line_ranges(str(tmp_path), "no-such-rev")
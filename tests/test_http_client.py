@@ -0,0 +1,112 @@
+"""Tests for shared HTTP client module."""
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from pyscan.http_client import ConnectionStats, HttpSettings, get_shared_client, SharedHttpClient
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    """支持 keep-alive 的最小 HTTP 服务。"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"{}"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server_url():
+    """启动本地 HTTP 服务。"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class TestConnectionStats:
+    """Test ConnectionStats class."""
+
+    def test_counts_new_connections_only(self):
+        """测试只统计连接建立完成事件。"""
+        stats = ConnectionStats()
+        for _ in range(3):
+            stats.record_request()
+        stats.record_trace("connection.connect_tcp.started")
+        stats.record_trace("connection.connect_tcp.complete")
+        stats.record_trace("http11.send_request_headers.complete")
+
+        assert stats.connections_opened == 1
+        assert stats.reused == 2
+        assert "3 HTTP requests over 1 connections (2 reused, 67%)" == stats.summary()
+
+
+class TestSharedHttpClient:
+    """Test SharedHttpClient class."""
+
+    def test_shared_per_settings(self):
+        """测试相同配置返回同一个共享客户端。"""
+        settings = HttpSettings(max_connections=7)
+        assert get_shared_client(settings) is get_shared_client(HttpSettings(max_connections=7))
+        assert get_shared_client(settings) is not get_shared_client(HttpSettings(max_connections=8))
+
+    def test_sync_requests_reuse_connection(self, server_url):
+        """测试同步请求复用 keep-alive 连接。"""
+        shared = SharedHttpClient(HttpSettings())
+        for _ in range(3):
+            assert shared.client.get(server_url).status_code == 200
+
+        assert shared.stats.requests == 3
+        assert shared.stats.connections_opened == 1
+        assert shared.stats.reused == 2
+
+    def test_async_client_per_event_loop(self, server_url):
+        """测试异步客户端在同一事件循环内复用，换事件循环后重建。"""
+        shared = SharedHttpClient(HttpSettings())
+
+        async def fetch_twice():
+            client = shared.async_client()
+            for _ in range(2):
+                await client.get(server_url)
+            assert shared.async_client() is client
+            return client
+
+        first = asyncio.run(fetch_twice())
+        second = asyncio.run(fetch_twice())
+
+        assert first is not second
+        assert shared.stats.requests == 4
+        assert shared.stats.connections_opened == 2
+        # 被替换的客户端在新的事件循环中关闭
+        assert first.is_closed
+        shared.close()
+
+    def test_close(self, server_url):
+        """测试 aclose()/close() 关闭异步和同步客户端，之后获取共享客户端时重新创建。"""
+        settings = HttpSettings(max_connections=9)
+        shared = get_shared_client(settings)
+        shared.client.get(server_url)
+
+        async def fetch():
+            client = shared.async_client()
+            await client.get(server_url)
+            await shared.aclose()
+            return client
+
+        async_client = asyncio.run(fetch())
+        shared.close()
+
+        assert shared.client.is_closed
+        assert async_client.is_closed
+        assert get_shared_client(settings) is not shared
@@ -0,0 +1,48 @@
+"""Tests for incremental JSON scanning module."""
+import json
+
+from pyscan.json_stream import JsonObjectScanner
+
+
+class TestJsonObjectScanner:
+    """Test JsonObjectScanner class."""
+
+    def _feed_all(self, chunks):
+        scanner = JsonObjectScanner()
+        for i, chunk in enumerate(chunks):
+            if scanner.feed(chunk):
+                return scanner, i
+        return scanner, None
+
+    def test_complete_after_closing_brace(self):
+        """测试顶层对象闭合时立即判定完整，之后的文本被丢弃。"""
+        text = '{"has_bug": false, "severity": "low", "bugs": []}\n说明文字'
+        chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+
+        scanner, index = self._feed_all(chunks)
+
+        assert scanner.complete
+        assert index < len(chunks) - 1
+        assert json.loads(scanner.text)["has_bug"] is False
+
+    def test_braces_inside_strings(self):
+        """测试字符串内的括号和转义引号不影响结构。"""
+        text = '{"description": "使用 \\"{\\" 和 } 的字符串", "bugs": [{"a": "]"}]}'
+
+        scanner, index = self._feed_all(list(text))
+
+        assert index == len(text) - 1
+        assert json.loads(scanner.text)["bugs"] == [{"a": "]"}]
+
+    def test_markdown_fence_prefix(self):
+        """测试对象前的 markdown 代码块标记被忽略。"""
+        scanner, _ = self._feed_all(['```json\n{"has_bug":', ' true}', "\n```"])
+
+        assert scanner.complete
+        assert scanner.text == '```json\n{"has_bug": true}'
+
+    def test_incomplete(self):
+        """测试未闭合的对象。"""
+        scanner, _ = self._feed_all(['{"bugs": [', '{"type": "x"'])
+
+        assert not scanner.complete
@@ -0,0 +1,46 @@
+"""Tests for latency module."""
+from pyscan.latency import LatencyTracker, TimeoutPolicy
+
+
+class TestTimeoutPolicy:
+    """Test TimeoutPolicy class."""
+
+    def test_scales_with_prompt_size(self):
+        """测试超时随 prompt 大小增长并受上限约束。"""
+        policy = TimeoutPolicy(base=30, per_1k_tokens=10, max=100)
+
+        assert policy.timeout(0) == 30
+        assert policy.timeout(2000) == 50
+        assert policy.timeout(50000) == 100
+
+
+class TestLatencyTracker:
+    """Test LatencyTracker class."""
+
+    def test_no_hedging_before_min_samples(self):
+        """测试样本不足时不对冲。"""
+        tracker = LatencyTracker(min_samples=5)
+        for _ in range(4):
+            tracker.record(1.0)
+
+        assert tracker.hedge_delay() is None
+
+    def test_quantile_delay(self):
+        """测试对冲延迟取近期延迟的分位数，且不低于 min_delay。"""
+        tracker = LatencyTracker(quantile=0.95, min_delay=0.5, min_samples=20)
+        for i in range(1, 101):
+            tracker.record(i / 10)
+
+        assert tracker.hedge_delay() == 9.5
+
+        fast = LatencyTracker(quantile=0.95, min_delay=0.5, min_samples=1)
+        fast.record(0.1)
+        assert fast.hedge_delay() == 0.5
+
+    def test_window(self):
+        """测试只保留最近的样本。"""
+        tracker = LatencyTracker(quantile=0.5, min_delay=0, min_samples=1, window=3)
+        for value in [100, 100, 1, 1, 1]:
+            tracker.record(value)
+
+        assert tracker.hedge_delay() == 1
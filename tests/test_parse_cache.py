@@ -0,0 +1,130 @@
+"""Tests for the persistent parse cache."""
+import os
+from unittest.mock import patch
+
+from pyscan.ast_parser import ASTParser
+from pyscan.parse_cache import ParseCache
+
+
+SOURCE = (
+    "from typing import Callable\n"
+    "\n"
+    "def apply(fn: Callable[[int], int], x: int):\n"
+    "    return fn(x)\n"
+    "\n"
+    "@decorator\n"
+    "async def run():\n"
+    "    return apply(abs, 1)\n"
+)
+
+
+class TestParseCache:
+    """Test ParseCache class."""
+
+    def test_roundtrip(self, tmp_path):
+        """测试缓存的解析结果与直接解析一致。"""
+        source_file = tmp_path / "a.py"
+        source_file.write_text(SOURCE)
+        functions = ASTParser().parse_file(str(source_file))
+
+        cache = ParseCache(tmp_path / "parse_cache.sqlite3")
+        cache.put(str(source_file), functions)
+
+        assert cache.get(str(source_file)) == functions
+        assert cache.get(str(tmp_path / "missing.py")) is None
+
+    def test_invalidated_by_content_change(self, tmp_path):
+        """测试内容变化后缓存失效，只有修改时间变化时仍然有效。"""
+        source_file = tmp_path / "a.py"
+        source_file.write_text(SOURCE)
+        cache = ParseCache(tmp_path / "parse_cache.sqlite3")
+        cache.put(str(source_file), ASTParser().parse_file(str(source_file)))
+
+        stat = os.stat(source_file)
+        os.utime(source_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        assert cache.get(str(source_file)) is not None
+
+        # 大小相同但内容不同
+        source_file.write_text(SOURCE.replace("x: int", "y: int"))
+        os.utime(source_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2 * 10**9))
+        assert cache.get(str(source_file)) is None
+
+    def test_parse_files_skips_cached(self, tmp_path):
+        """测试 parse_files 对未改动的文件不再解析。"""
+        paths = []
+        for i in range(3):
+            path = tmp_path / f"m{i}.py"
+            path.write_text(f"def f{i}():\n    return {i}\n")
+            paths.append(str(path))
+        cache = ParseCache(tmp_path / "parse_cache.sqlite3")
+        parser = ASTParser()
+
+        first = list(parser.parse_files(paths, workers=1, cache=cache))
+        with patch.object(ASTParser, "parse_file_stamped", side_effect=AssertionError("parsed")):
+            second = list(parser.parse_files(paths, workers=1, cache=cache))
+
+        assert second == first
+        assert cache.hits == 3
+
+    def test_retain(self, tmp_path):
+        """测试删除已不在扫描范围内的文件。"""
+        source_file = tmp_path / "a.py"
+        source_file.write_text(SOURCE)
+        cache = ParseCache(tmp_path / "parse_cache.sqlite3")
+        cache.put(str(source_file), [])
+
+        assert cache.retain([]) == 1
+        assert cache.get(str(source_file)) is None
+
+    def test_parse_files_parallel_with_cache(self, tmp_path):
+        """测试并行解析时缓存命中与未命中的文件保持原顺序。"""
+        paths = []
+        for i in range(6):
+            path = tmp_path / f"m{i}.py"
+            path.write_text(f"def f{i}():\n    return {i}\n")
+            paths.append(str(path))
+        cache = ParseCache(tmp_path / "parse_cache.sqlite3")
+        parser = ASTParser()
+        list(parser.parse_files(paths[::2], workers=1, cache=cache))
+
+        results = list(parser.parse_files(paths, workers=2, chunksize=2, cache=cache))
+
+        assert [file_path for file_path, _, _ in results] == paths
+        assert [functions[0].name for _, functions, _ in results] == [f"f{i}" for i in range(6)]
+        assert cache.hits == 3
+
+    def test_parse_files_writes_once_per_chunk(self, tmp_path):
+        """测试解析结果按块批量写入缓存，而不是每个文件提交一次。"""
+        paths = []
+        for i in range(5):
+            path = tmp_path / f"m{i}.py"
+            path.write_text(f"def f{i}():\n    return {i}\n")
+            paths.append(str(path))
+        (tmp_path / "bad.py").write_text("def broken(:\n")
+        paths.append(str(tmp_path / "bad.py"))
+        cache = ParseCache(tmp_path / "parse_cache.sqlite3")
+
+        spy = patch.object(ParseCache, "put_many", autospec=True, side_effect=ParseCache.put_many)
+        with spy as put_many:
+            results = list(ASTParser().parse_files(paths, workers=1, chunksize=4, cache=cache))
+
+        assert put_many.call_count == 2
+        assert [error is None for _, _, error in results] == [True] * 5 + [False]
+        assert all(cache.get(path) is not None for path in paths[:5])
+        assert cache.get(paths[5]) is None
+
+    def test_stores_stamp_of_parsed_content(self, tmp_path):
+        """测试缓存记录实际解析的内容：解析后、写入前修改的文件不会命中旧结果。"""
+        source_file = tmp_path / "a.py"
+        source_file.write_text("def f():\n    return 1\n")
+        cache = ParseCache(tmp_path / "parse_cache.sqlite3")
+
+        results = ASTParser().parse_files([str(source_file)], workers=1, chunksize=4, cache=cache)
+        assert next(results)[1][0].name == "f"
+        # 结果按块写入缓存，此时尚未写入；大小相同但内容不同
+        stat = os.stat(source_file)
+        source_file.write_text("def g():\n    return 1\n")
+        os.utime(source_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        list(results)
+
+        assert cache.get(str(source_file)) is None
@@ -0,0 +1,58 @@
+"""Tests for streaming pipeline module."""
+from pyscan.ast_parser import ASTParser
+from pyscan.pipeline import StreamingPipeline
+from pyscan.scanner import Scanner
+
+
+class TestStreamingPipeline:
+    """Test StreamingPipeline class."""
+
+    def _make_tree(self, tmp_path, count):
+        for i in range(count):
+            (tmp_path / f"mod_{i:02d}.py").write_text(
+                f"def func_{i}(x):\n    return helper_{i}(x)\n"
+            )
+
+    def test_batches_in_scan_order(self, tmp_path):
+        """测试按扫描顺序逐文件产出函数，并设置相对路径。"""
+        self._make_tree(tmp_path, 5)
+        (tmp_path / "broken.py").write_text("def broken(:\n")
+        (tmp_path / "empty.py").write_text("X = 1\n")
+
+        scanner = Scanner()
+        pipeline = StreamingPipeline(scanner, ASTParser(), str(tmp_path), parse_workers=1)
+        batches = list(pipeline.iter_batches())
+
+        expected_files = [
+            f for f in scanner.scan(str(tmp_path))
+            if not f.endswith(("broken.py", "empty.py"))
+        ]
+        assert [batch[0].file_path for batch in batches] == [
+            f.rsplit("/", 1)[-1] for f in expected_files
+        ]
+        assert pipeline.files_scanned == 7
+
+    def test_matches_parallel_parse(self, tmp_path):
+        """测试多进程流式解析结果与串行一致。"""
+        self._make_tree(tmp_path, 20)
+
+        serial = StreamingPipeline(Scanner(), ASTParser(), str(tmp_path), parse_workers=1)
+        parallel = StreamingPipeline(Scanner(), ASTParser(), str(tmp_path), parse_workers=2)
+
+        assert [f.name for b in serial.iter_batches() for f in b] == [
+            f.name for b in parallel.iter_batches() for f in b
+        ]
+
+    def test_early_close_stops_producer(self, tmp_path):
+        """测试消费者提前停止时生产者线程退出（背压 + 停止信号）。"""
+        self._make_tree(tmp_path, 30)
+
+        pipeline = StreamingPipeline(
+            Scanner(), ASTParser(), str(tmp_path), parse_workers=1, queue_size=2
+        )
+        batches = pipeline.iter_batches()
+        next(batches)
+        batches.close()
+
+        # 队列容量为 2，生产者不会提前扫描完整棵树
+        assert pipeline.files_scanned < 30
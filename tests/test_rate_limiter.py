@@ -0,0 +1,88 @@
+"""Tests for rate limiter module."""
+import pytest
+from pyscan.rate_limiter import TokenBucket, RateLimiter
+
+
+class FakeClock:
+    """可手动推进的时钟。"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+    """Test TokenBucket class."""
+
+    def test_burst_then_wait(self):
+        """测试桶满时可突发，耗尽后按速率等待。"""
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)  # 每秒补充 1
+
+        for _ in range(60):
+            assert bucket.reserve(1) == 0
+
+        assert bucket.reserve(1) == pytest.approx(1.0)
+        # 后续请求排在前一个之后
+        assert bucket.reserve(1) == pytest.approx(2.0)
+
+    def test_refill_over_time(self):
+        """测试随时间补充预算。"""
+        clock = FakeClock()
+        bucket = TokenBucket(60, clock)
+        bucket.reserve(60)
+
+        clock.now = 10.0
+        assert bucket.reserve(10) == 0
+        assert bucket.reserve(1) == pytest.approx(1.0)
+
+    def test_oversized_request_clipped(self):
+        """测试超过容量的请求在桶满时仍可通过。"""
+        clock = FakeClock()
+        bucket = TokenBucket(100, clock)
+
+        assert bucket.reserve(500) == 0
+        assert bucket.level == 0
+
+
+class TestRateLimiter:
+    """Test RateLimiter class."""
+
+    def test_unlimited(self):
+        """测试未配置预算时不限流。"""
+        limiter = RateLimiter()
+
+        assert limiter.enabled is False
+        assert limiter.reserve(10 ** 9) == 0
+
+    def test_tpm_limits_large_requests(self):
+        """测试 TPM 预算按估算 token 数限流。"""
+        clock = FakeClock()
+        limiter = RateLimiter(rpm=1000, tpm=6000, clock=clock)
+
+        assert limiter.reserve(3000) == 0
+        assert limiter.reserve(3000) == 0
+        # 每秒补充 100 token
+        assert limiter.reserve(1000) == pytest.approx(10.0)
+
+    def test_settle_charges_actual_usage(self):
+        """测试按实际 usage 修正 token 预算。"""
+        clock = FakeClock()
+        limiter = RateLimiter(tpm=6000, clock=clock)
+
+        limiter.reserve(1000)
+        limiter.settle(1000, 6000)
+
+        assert limiter.reserve(100) == pytest.approx(1.0)
+
+    def test_refund_unsent_request(self):
+        """测试退还未发出请求的预留。"""
+        clock = FakeClock()
+        limiter = RateLimiter(rpm=1, tpm=6000, clock=clock)
+
+        limiter.reserve(6000)
+        limiter.refund(6000)
+
+        assert limiter.reserve(6000) == 0.0
@@ -0,0 +1,133 @@
+"""Tests for the LLM result cache."""
+import json
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+from pyscan.cli import main
+from pyscan.result_cache import ResultCache
+
+
+class FakeClock:
+    """可手动推进的时钟。"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        self.now += 1
+        return self.now
+
+
+class TestResultCache:
+    """Test ResultCache class."""
+
+    def test_key_covers_all_inputs(self):
+        """测试模型、温度、system prompt 和 prompt 都参与键的计算。"""
+        base = ResultCache.make_key("gpt-4", 0.2, "system", "prompt")
+
+        assert base == ResultCache.make_key("gpt-4", 0.2, "system", "prompt")
+        assert base != ResultCache.make_key("gpt-4o", 0.2, "system", "prompt")
+        assert base != ResultCache.make_key("gpt-4", 0.0, "system", "prompt")
+        assert base != ResultCache.make_key("gpt-4", 0.2, "system2", "prompt")
+        assert base != ResultCache.make_key("gpt-4", 0.2, "system", "prompt2")
+        # 字段边界不同的拼接结果不能冲突
+        assert ResultCache.make_key("a", 0.2, "bc", "d") != ResultCache.make_key("ab", 0.2, "c", "d")
+
+    def test_put_get_persists(self, tmp_path):
+        """测试写入的结果在重新打开后仍可读取。"""
+        path = tmp_path / "cache.sqlite3"
+        cache = ResultCache(path)
+        cache.put("k", '{"has_bug": false}', {"has_bug": False, "bugs": []})
+        cache.close()
+
+        cache = ResultCache(path)
+        assert cache.get("k") == ('{"has_bug": false}', {"has_bug": False, "bugs": []})
+        assert cache.get("missing") is None
+        assert cache.stats()["entries"] == 1
+        assert cache.summary() == "1 hits, 1 misses (50% hit rate)"
+
+    def test_lru_eviction(self, tmp_path):
+        """测试超过容量时淘汰最久未使用的条目。"""
+        cache = ResultCache(tmp_path / "cache.sqlite3", clock=FakeClock())
+        cache.put("a", "x" * 100, {})
+        cache.put("b", "x" * 100, {})
+        entry_size = cache.stats()["bytes"] // 2
+        cache.max_bytes = entry_size * 2
+        # 访问 a 之后，b 成为最久未使用的条目
+        cache.get("a")
+        cache.put("c", "x" * 100, {})
+
+        assert cache.get("b") is None
+        assert cache.get("a") is not None
+        assert cache.get("c") is not None
+        assert cache.stats()["bytes"] <= cache.max_bytes
+
+    def test_prune(self, tmp_path):
+        """测试手动清理到指定大小。"""
+        cache = ResultCache(tmp_path / "cache.sqlite3", clock=FakeClock())
+        for key in "abcd":
+            cache.put(key, "x" * 100, {})
+
+        assert cache.prune(0) == 4
+        assert cache.stats()["entries"] == 0
+        assert cache.stats()["bytes"] == 0
+
+
+class TestCacheCommands:
+    """Test result cache integration with the CLI."""
+
+    @pytest.fixture
+    def project(self, tmp_path):
+        """创建待扫描项目和配置文件。"""
+        src = tmp_path / "src"
+        src.mkdir()
+        (src / "calc.py").write_text(
+            "def divide(a, b):\n"
+            "    return a / b\n"
+            "\n"
+            "def average(items):\n"
+            "    return divide(sum(items), len(items))\n"
+        )
+        config_file = tmp_path / "config.yaml"
+        config_file.write_text("""
+llm:
+  base_url: "https://api.openai.com/v1"
+  api_key: "sk-test-key"
+  model: "gpt-4"
+
+scan:
+  parse_workers: 1
+""")
+        return src, config_file
+
+    @patch('pyscan.bug_detector.AsyncOpenAI')
+    def test_force_rescan_uses_cache(self, mock_async_openai, tmp_path, project):
+        """测试 --force 重新扫描未改动的项目时不发送任何请求。"""
+        src, config_file = project
+        mock_client = Mock()
+        mock_async_openai.return_value = mock_client
+        mock_client.chat.completions.create = AsyncMock(return_value=Mock(
+            choices=[Mock(message=Mock(content='{"has_bug": false, "severity": "low", "bugs": []}'))],
+            usage=None
+        ))
+        report_file = tmp_path / "report.json"
+        args = [str(src), "-c", str(config_file), "-o", str(report_file)]
+
+        main(args)
+        assert mock_client.chat.completions.create.await_count == 2
+
+        main(args + ["--force"])
+        assert mock_client.chat.completions.create.await_count == 2
+        progress = json.loads((src / ".pyscan" / "progress.json").read_text())
+        assert sorted(progress["completed_functions"]) == ["calc.py::average", "calc.py::divide"]
+
+        main(["cache", "prune", str(src), "--max-size-mb", "0"])
+        cache = ResultCache(src / ".pyscan" / ResultCache.FILENAME)
+        assert cache.stats()["entries"] == 0
+
+    def test_cache_stats_without_cache(self, project):
+        """测试没有缓存文件时报错退出。"""
+        src, _ = project
+
+        with pytest.raises(SystemExit):
+            main(["cache", "stats", str(src)])
@@ -0,0 +1,99 @@
+"""Tests for retry module."""
+import pytest
+from pyscan.retry import (
+    RetryPolicy,
+    classify_error,
+    retry_after_seconds,
+    RATE_LIMIT,
+    SERVER_ERROR,
+    TIMEOUT,
+    PARSE_ERROR,
+    OTHER,
+)
+
+
+class FakeResponse:
+    """带响应头的假 HTTP 响应。"""
+
+    def __init__(self, headers=None):
+        self.headers = {k.lower(): v for k, v in (headers or {}).items()}
+
+
+class FakeStatusError(Exception):
+    """模拟 openai.APIStatusError 的属性。"""
+
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = FakeResponse(headers)
+
+
+class TestClassifyError:
+    """Test classify_error function."""
+
+    def test_classification(self):
+        """测试错误分类。"""
+        assert classify_error(FakeStatusError(429)) == RATE_LIMIT
+        assert classify_error(FakeStatusError(503)) == SERVER_ERROR
+        assert classify_error(TimeoutError()) == TIMEOUT
+        assert classify_error(ValueError("Invalid JSON response")) == PARSE_ERROR
+        assert classify_error(FakeStatusError(401)) == OTHER
+        assert classify_error(Exception("API Error")) == OTHER
+
+
+class TestRetryAfter:
+    """Test retry_after_seconds function."""
+
+    def test_retry_after_seconds(self):
+        """测试 Retry-After 秒数。"""
+        error = FakeStatusError(429, {"Retry-After": "20"})
+        assert retry_after_seconds(error) == 20
+
+    def test_retry_after_ms(self):
+        """测试 retry-after-ms 优先。"""
+        error = FakeStatusError(429, {"retry-after-ms": "1500", "Retry-After": "20"})
+        assert retry_after_seconds(error) == pytest.approx(1.5)
+
+    def test_ratelimit_reset_durations(self):
+        """测试 x-ratelimit-reset-* 时长格式，取最大值。"""
+        error = FakeStatusError(429, {
+            "x-ratelimit-reset-requests": "120ms",
+            "x-ratelimit-reset-tokens": "1m30s",
+        })
+        assert retry_after_seconds(error) == pytest.approx(90.0)
+
+    def test_no_headers(self):
+        """测试没有响应头时返回 None。"""
+        assert retry_after_seconds(Exception("boom")) is None
+        assert retry_after_seconds(FakeStatusError(500)) is None
+
+
+class TestRetryPolicy:
+    """Test RetryPolicy class."""
+
+    def test_exponential_backoff_with_jitter(self):
+        """测试指数退避及抖动范围。"""
+        policy = RetryPolicy(default_budget=10, base_delay=1.0, max_delay=8.0, rng=lambda: 0.0)
+        assert [policy.backoff(n) for n in range(1, 6)] == [0.5, 1.0, 2.0, 4.0, 4.0]
+
+        policy.rng = lambda: 0.999
+        assert policy.backoff(3) == pytest.approx(4.0, abs=0.01)
+
+    def test_per_class_budgets(self):
+        """测试每个错误类别独立的重试预算。"""
+        policy = RetryPolicy(default_budget=2, budgets={RATE_LIMIT: 4}, rng=lambda: 0.0)
+        failures = {}
+
+        assert policy.next_delay(FakeStatusError(429), failures) is not None
+        assert policy.next_delay(FakeStatusError(500), failures) is not None
+        assert policy.next_delay(FakeStatusError(429), failures) is not None
+        assert policy.next_delay(FakeStatusError(429), failures) is not None
+        # server_error 预算为 2，第二次失败时放弃
+        assert policy.next_delay(FakeStatusError(500), failures) is None
+        assert failures == {RATE_LIMIT: 3, SERVER_ERROR: 2}
+
+    def test_honors_retry_after(self):
+        """测试限流时使用服务端给出的等待时间。"""
+        policy = RetryPolicy(default_budget=3, base_delay=1.0, rng=lambda: 0.0)
+        delay = policy.next_delay(FakeStatusError(429, {"Retry-After": "20"}), {})
+        assert delay == 20
@@ -0,0 +1,81 @@
+"""Tests for scheduler module."""
+import pytest
+from pyscan.ast_parser import FunctionInfo
+from pyscan.context_builder import ContextBuilder
+from pyscan.scheduler import (
+    Scheduler,
+    FunctionSignals,
+    file_order_score,
+    load_score_function,
+    risk_score,
+)
+
+
+def make_function(name, size=2, calls=(), decorators=(), is_async=False):
+    """创建测试用 FunctionInfo。"""
+    return FunctionInfo(
+        name=name,
+        args=[],
+        lineno=1,
+        end_lineno=1 + size,
+        col_offset=0,
+        end_col_offset=0,
+        code=f"def {name}():\n    pass",
+        decorators=list(decorators),
+        is_async=is_async,
+        calls=set(calls),
+    )
+
+
+def size_score(function, signals):
+    """测试用自定义评分函数。"""
+    return signals.size
+
+
+class TestScheduler:
+    """Test Scheduler class."""
+
+    def test_rank_by_risk(self):
+        """测试按风险分数排序，分数相同时保持原顺序。"""
+        helper = make_function("helper", size=2)
+        big = make_function("big", size=120)
+        widely_used = make_function("widely_used", size=2)
+        callers = [make_function(f"c{i}", calls=["widely_used"]) for i in range(4)]
+        functions = [helper, big, widely_used] + callers
+
+        builder = ContextBuilder(functions)
+        ranked = Scheduler(risk_score).rank(functions, builder)
+
+        assert ranked[0] is big
+        assert ranked[1] is widely_used
+        # 其余函数分数相同，保持文件顺序
+        assert ranked[2:] == [helper] + callers
+
+    def test_collect_signals(self):
+        """测试收集排序信号。"""
+        target = make_function("target", size=10, decorators=["cached"], is_async=True)
+        caller = make_function("caller", calls=["target"])
+        builder = ContextBuilder([target, caller])
+
+        signals = Scheduler().collect_signals(target, builder)
+
+        assert signals == FunctionSignals(
+            is_public_api=False, size=10, caller_count=1, is_async=True, decorator_count=1
+        )
+
+    def test_file_order(self):
+        """测试 file_order 保持原顺序。"""
+        functions = [make_function("a"), make_function("b", size=100)]
+        builder = ContextBuilder(functions)
+
+        assert Scheduler(file_order_score).rank(functions, builder) == functions
+
+    def test_load_score_function(self):
+        """测试从配置加载评分函数。"""
+        assert load_score_function("risk") is risk_score
+        assert load_score_function("tests.test_scheduler:size_score") is size_score
+
+        with pytest.raises(ValueError):
+            load_score_function("unknown")
+        with pytest.raises(ValueError):
+            load_score_function("tests.test_scheduler:missing")